@@ -5,7 +5,6 @@ import cv2
 import dlib
 import base64
 import os
-import sys
 import logging
 import traceback
 import time
@@ -15,6 +14,14 @@ from imutils import face_utils
 from skimage.feature import daisy
 from skimage.color import rgb2gray
 
+# Landmark features and focus history are shared with python_model/
+from python_model.landmark_features import shape_to_array, extract_features
+from python_model.focus_history import TieredFocusHistory
+
+# Recent windows reported next to the session statistics, each served by a
+# different tier of the focus history
+STATISTICS_WINDOWS = (('last_minute', 60), ('last_10_minutes', 600), ('last_hour', 3600))
+
 # Configure logging
 logging.basicConfig(
     level=logging.DEBUG,
@@ -54,7 +61,7 @@ class FocusDetector:
             
             # Initialize tracking variables
             self.prev_face_pos = None
-            self.focus_history = []
+            self.focus_history = TieredFocusHistory()
             self.total_focus_time = 0
             self.last_focus_time = time.time()
             
@@ -63,21 +70,6 @@ class FocusDetector:
             logger.error(f"Error initializing FocusDetector: {str(e)}")
             raise
 
-    def compute_ear(self, eye_points, landmarks):
-        """Calculate Eye Aspect Ratio"""
-        p1 = np.array([landmarks.part(eye_points[1]).x, landmarks.part(eye_points[1]).y])
-        p2 = np.array([landmarks.part(eye_points[2]).x, landmarks.part(eye_points[2]).y])
-        p3 = np.array([landmarks.part(eye_points[3]).x, landmarks.part(eye_points[3]).y])
-        p4 = np.array([landmarks.part(eye_points[5]).x, landmarks.part(eye_points[5]).y])
-        p5 = np.array([landmarks.part(eye_points[0]).x, landmarks.part(eye_points[0]).y])
-        p6 = np.array([landmarks.part(eye_points[4]).x, landmarks.part(eye_points[4]).y])
-
-        A = np.linalg.norm(p2 - p4)
-        B = np.linalg.norm(p3 - p5)
-        C = np.linalg.norm(p1 - p6)
-        ear = (A + B) / (2.0 * C)
-        return ear
-
     def extract_daisy_features(self, eye_image):
         """Extract DAISY features from eye region"""
         try:
@@ -88,11 +80,10 @@ class FocusDetector:
         except:
             return 0
 
-    def get_gaze_direction(self, eye_points, landmarks, frame, tolerance=0.3):
+    def get_gaze_direction(self, eye_points, landmarks_points, frame, tolerance=0.3):
         """Determine gaze direction using eye region analysis"""
         # Get eye region coordinates
-        eye_region = np.array([(landmarks.part(point).x, landmarks.part(point).y) 
-                              for point in eye_points])
+        eye_region = landmarks_points[eye_points].astype(int)
         min_x, max_x = np.min(eye_region[:, 0]), np.max(eye_region[:, 0])
         min_y, max_y = np.min(eye_region[:, 1]), np.max(eye_region[:, 1])
         
@@ -151,15 +142,17 @@ class FocusDetector:
                 metrics['face_detected'] = True
                 face = faces[0]
                 landmarks = self.predictor(gray, face)
+                landmarks_points = shape_to_array(landmarks)
+                features = extract_features(landmarks_points)
 
                 # Calculate EAR for both eyes
-                left_ear = self.compute_ear(self.LEFT_EYE_POINTS, landmarks)
-                right_ear = self.compute_ear(self.RIGHT_EYE_POINTS, landmarks)
-                avg_ear = (left_ear + right_ear) / 2
+                left_ear = features['left_ear']
+                right_ear = features['right_ear']
+                avg_ear = features['avg_ear']
 
                 # Get gaze direction for both eyes
-                left_gaze, left_score = self.get_gaze_direction(self.LEFT_EYE_POINTS, landmarks, frame)
-                right_gaze, right_score = self.get_gaze_direction(self.RIGHT_EYE_POINTS, landmarks, frame)
+                left_gaze, left_score = self.get_gaze_direction(self.LEFT_EYE_POINTS, landmarks_points, frame)
+                right_gaze, right_score = self.get_gaze_direction(self.RIGHT_EYE_POINTS, landmarks_points, frame)
                 
                 # Calculate focus score
                 if avg_ear < 0.20:
@@ -181,9 +174,8 @@ class FocusDetector:
                 cv2.rectangle(frame, (x, y), (x + w, y + h), color, 2)
 
                 # Draw eye landmarks
-                for point in range(36, 48):
-                    pt = landmarks.part(point)
-                    cv2.circle(frame, (pt.x, pt.y), 2, (0, 255, 0), -1)
+                for x, y in landmarks_points[36:48].astype(int):
+                    cv2.circle(frame, (int(x), int(y)), 2, (0, 255, 0), -1)
 
                 # Draw status
                 cv2.putText(frame, f"{attention_status} ({focus_score:.1f}%)", 
@@ -201,12 +193,8 @@ class FocusDetector:
                     }
                 })
 
-                # Update focus history
-                self.focus_history.append({
-                    'timestamp': metrics['timestamp'],
-                    'score': focus_score,
-                    'status': attention_status
-                })
+                # Update focus history (scores of 40 and up count as focused)
+                self.focus_history.append(focus_score, focus_score >= 40)
 
                 # Update focus time
                 current_time = time.time()
@@ -222,23 +210,32 @@ class FocusDetector:
 
     def get_focus_statistics(self):
         try:
-            if not self.focus_history:
+            # Statistics cover the whole session, not just the recent window
+            if not self.focus_history.total_count:
                 return {
                     'average_score': 0.0,
                     'total_focus_time': 0.0,
                     'focus_percentage': 0.0
                 }
             
-            recent_scores = [entry['score'] for entry in self.focus_history]
-            average_score = sum(recent_scores) / len(recent_scores)
+            average_score = self.focus_history.session_average()
+            focus_percentage = self.focus_history.session_focus_percentage()
             
-            focused_entries = [entry for entry in self.focus_history if entry['score'] >= 40]
-            focus_percentage = (len(focused_entries) / len(self.focus_history)) * 100
+            recent = {}
+            now = time.monotonic()
+            for name, seconds in STATISTICS_WINDOWS:
+                window = self.focus_history.window_stats(seconds, now)
+                recent[name] = {
+                    'average_score': round(window['average_score'], 2),
+                    'focus_percentage': round(window['focus_percentage'], 2),
+                    'samples': window['samples']
+                }
             
             return {
                 'average_score': round(average_score, 2),
                 'total_focus_time': round(self.total_focus_time, 2),
-                'focus_percentage': round(focus_percentage, 2)
+                'focus_percentage': round(focus_percentage, 2),
+                'recent': recent
             }
             
         except Exception as e:
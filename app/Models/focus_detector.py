@@ -4,51 +4,221 @@ import time
 from datetime import datetime
 import mediapipe as mp
 import logging
+import os
+import threading
+from collections import OrderedDict
+
+from python_model.focus_history import FocusHistory
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-class FocusDetector:
+# Width frames are shrunk to before running the mediapipe graphs. Landmarks
+# and boxes come back as relative coordinates, so they are mapped onto the
+# full-resolution frame unchanged. 0 disables.
+ANALYSIS_WIDTH = int(os.environ.get('FOCUS_DETECT_WIDTH', 640))
+
+# Take the face box from the FaceMesh landmarks and run FaceDetection only on
+# frames where the mesh finds no face. 0 runs both graphs on every frame.
+MESH_ONLY = os.environ.get('FOCUS_MESH_ONLY', '1') != '0'
+
+# Landmarks on the outline of the face, which bound the face box
+FACE_OVAL_INDICES = sorted({index for edge in mp.solutions.face_mesh.FACEMESH_FACE_OVAL for index in edge})
+
+# Per-session graphs and state: at most this many sessions are kept, and a
+# session is closed after this many seconds without a frame
+GRAPH_POOL_SIZE = int(os.environ.get('FOCUS_GRAPH_POOL_SIZE', 32))
+GRAPH_IDLE_SECONDS = float(os.environ.get('FOCUS_GRAPH_IDLE_SECONDS', 300))
+
+def _create_graphs():
+    """A FaceMesh in tracking mode and its FaceDetection fallback"""
+    face_detection = mp.solutions.face_detection.FaceDetection(
+        model_selection=0,  # 0 for close-range, 1 for far-range
+        min_detection_confidence=0.5
+    )
+    face_mesh = mp.solutions.face_mesh.FaceMesh(
+        max_num_faces=1,
+        refine_landmarks=True,
+        min_detection_confidence=0.5,
+        min_tracking_confidence=0.5
+    )
+    return face_mesh, face_detection
+
+class DetectorSession:
+    """One student's mediapipe graphs and focus state; hold lock while using them"""
     def __init__(self):
+        self.face_mesh, self.face_detection = _create_graphs()
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+        self.closed = False
+        
+        # Focus tracking state
+        self.last_focus_time = time.time()
+        self.total_focus_time = 0
+        self.focus_history = FocusHistory()
+        self.prev_face_pos = None
+        self.movement_history = []
+        self.last_update_time = time.time()
+
+    def close(self):
+        with self.lock:
+            if not self.closed:
+                self.face_mesh.close()
+                self.face_detection.close()
+                self.closed = True
+
+class SessionPool:
+    """DetectorSessions kept per session ID, least recently used first out.
+
+    FaceMesh only takes its cheap tracking path when consecutive frames show
+    the same face, so each student's stream gets its own graphs, along with
+    its own stability and focus history. The pool is capped at max_size
+    sessions, and sessions idle for idle_seconds are closed on the next
+    acquire.
+    """
+    def __init__(self, max_size=GRAPH_POOL_SIZE, idle_seconds=GRAPH_IDLE_SECONDS):
+        self.max_size = max(1, max_size)
+        self.idle_seconds = idle_seconds
+        self.evictions = 0
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, session_id):
+        """The session, created (and the pool trimmed) if it is not open"""
+        now = time.monotonic()
+        evicted = []
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+            # Oldest first, so stop at the first session that is not idle
+            while self._sessions:
+                oldest_id, oldest = next(iter(self._sessions.items()))
+                if now - oldest.last_used < self.idle_seconds and len(self._sessions) < self.max_size:
+                    break
+                evicted.append(self._sessions.pop(oldest_id))
+            self.evictions += len(evicted)
+            if session is None:
+                session = DetectorSession()
+            session.last_used = now
+            self._sessions[session_id] = session
+        # Closing waits for a frame still running on that session
+        for old in evicted:
+            old.close()
+        return session
+
+    def get(self, session_id):
+        """The open session, or None; does not count as use"""
+        return self._sessions.get(session_id)
+
+    def release(self, session_id):
+        """Close a finished session"""
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is not None:
+            session.close()
+
+    def close(self):
+        with self._lock:
+            sessions, self._sessions = list(self._sessions.values()), OrderedDict()
+        for old in sessions:
+            old.close()
+
+    def __len__(self):
+        return len(self._sessions)
+
+class FocusDetector:
+    def __init__(self, mesh_only=MESH_ONLY, pool_size=GRAPH_POOL_SIZE, idle_seconds=GRAPH_IDLE_SECONDS):
         try:
             # Initialize mediapipe face detection
             self.mp_face_detection = mp.solutions.face_detection
             self.mp_face_mesh = mp.solutions.face_mesh
             self.mp_drawing = mp.solutions.drawing_utils
             
-            # Initialize face detection and face mesh
-            self.face_detection = self.mp_face_detection.FaceDetection(
-                model_selection=0,  # 0 for close-range, 1 for far-range
-                min_detection_confidence=0.5
-            )
-            self.face_mesh = self.mp_face_mesh.FaceMesh(
-                max_num_faces=1,
-                refine_landmarks=True,
-                min_detection_confidence=0.5,
-                min_tracking_confidence=0.5
-            )
+            # Initialize face detection and face mesh, with the focus state of
+            # frames analysed without a session ID (a single camera)
+            self.default_session = DetectorSession()
+            self.face_mesh = self.default_session.face_mesh
+            self.face_detection = self.default_session.face_detection
+            # One DetectorSession per student for frames with a session ID
+            self.session_pool = SessionPool(pool_size, idle_seconds)
             
+            self.mesh_only = mesh_only
             logger.info("Successfully initialized mediapipe face detection")
             
             # Focus tracking parameters
-            self.last_focus_time = time.time()
-            self.total_focus_time = 0
             self.focus_threshold = 0.5  # Lowered to 50% threshold for easier focus
-            self.focus_history = []
-            self.prev_face_pos = None
-            self.movement_history = []
-            self.last_update_time = time.time()
             self.update_interval = 1.0  # Update every second
             
         except Exception as e:
             logger.error(f"Error initializing FocusDetector: {str(e)}")
             raise
 
-    def analyze_frame(self, frame):
+    def _to_analysis_rgb(self, frame):
+        """Shrink to the analysis width, then convert to RGB for mediapipe"""
+        small = frame
+        if ANALYSIS_WIDTH and frame.shape[1] > ANALYSIS_WIDTH:
+            scale = ANALYSIS_WIDTH / frame.shape[1]
+            small = cv2.resize(frame, (ANALYSIS_WIDTH, max(1, int(round(frame.shape[0] * scale)))), interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+
+    def warm_up(self, resolutions=((640, 480), (1280, 720))):
+        """Run both mediapipe graphs on synthetic frames so the first real frame is not slow.
+
+        The first process() call initialises the graphs and their buffers.
+        Only the graphs run, so the focus history is left untouched.
+        Returns the seconds taken per resolution.
+        """
+        durations = {}
+        rng = np.random.default_rng(0)
+        for width, height in resolutions:
+            start = time.time()
+            frame_rgb = self._to_analysis_rgb(rng.integers(0, 256, (height, width, 3), dtype=np.uint8))
+            self.face_detection.process(frame_rgb)
+            self.face_mesh.process(frame_rgb)
+            durations[f"{width}x{height}"] = round(time.time() - start, 3)
+        return durations
+
+    def _detect(self, face_mesh, face_detection, frame_rgb):
+        """Relative face box (or None) and the mesh landmarks (or None) for one frame"""
+        face_mesh_results = face_mesh.process(frame_rgb)
+        face_landmarks = None
+        if face_mesh_results.multi_face_landmarks:
+            face_landmarks = face_mesh_results.multi_face_landmarks[0]
+        
+        if self.mesh_only and face_landmarks is not None:
+            # One graph per frame: the mesh already outlines the face
+            return self._box_from_landmarks(face_landmarks), face_landmarks
+        
+        face_detection_results = face_detection.process(frame_rgb)
+        if not face_detection_results.detections:
+            return None, face_landmarks
+        detection = face_detection_results.detections[0]  # Get the first face
+        box = detection.location_data.relative_bounding_box
+        return (box.xmin, box.ymin, box.width, box.height), face_landmarks
+
+    def end_session(self, session_id):
+        """Free the graphs and state kept for a session"""
+        self.session_pool.release(session_id)
+
+    def analyze_frame(self, frame, session_id=None):
+        """Score one frame.
+
+        Pass the student's session_id so their stream keeps its own graphs
+        and focus state; frames without one share the default session.
+        """
+        while True:
+            if session_id is None:
+                session = self.default_session
+            else:
+                session = self.session_pool.acquire(session_id)
+            with session.lock:
+                # Evicted by another thread between acquire and lock: open it again
+                if not session.closed:
+                    return self._analyze(session, frame)
+
+    def _analyze(self, session, frame):
         try:
-            # Convert the frame to RGB for mediapipe
-            frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            frame_rgb = self._to_analysis_rgb(frame)
             
             # Initialize metrics
             metrics = {
@@ -56,28 +226,25 @@ class FocusDetector:
                 'is_focused': False,
                 'face_detected': False,
                 'looking_away': False,
-                'total_focus_time': self.total_focus_time,
+                'total_focus_time': session.total_focus_time,
                 'timestamp': datetime.now().isoformat(),
                 'face_box': None,
                 'attention_points': [],
-                'average_focus': self._calculate_average_focus()
+                'average_focus': self._calculate_average_focus(session)
             }
             
             # Detect face
-            face_detection_results = self.face_detection.process(frame_rgb)
-            face_mesh_results = self.face_mesh.process(frame_rgb)
+            bbox, face_landmarks = self._detect(session.face_mesh, session.face_detection, frame_rgb)
             
-            if face_detection_results.detections:
+            if bbox is not None:
                 metrics['face_detected'] = True
-                detection = face_detection_results.detections[0]  # Get the first face
                 
                 # Get face bounding box
-                bbox = detection.location_data.relative_bounding_box
                 h, w, _ = frame.shape
-                x = int(bbox.xmin * w)
-                y = int(bbox.ymin * h)
-                width = int(bbox.width * w)
-                height = int(bbox.height * h)
+                x = int(bbox[0] * w)
+                y = int(bbox[1] * h)
+                width = int(bbox[2] * w)
+                height = int(bbox[3] * h)
                 
                 # Set face box
                 metrics['face_box'] = {
@@ -88,18 +255,18 @@ class FocusDetector:
                 }
                 
                 # Calculate stability score
-                stability_score = self._calculate_stability(x, y, width, height)
+                stability_score = self._calculate_stability(session, x, y, width, height)
                 
                 # Calculate attention score using face mesh landmarks
                 attention_score = 0.0
-                if face_mesh_results.multi_face_landmarks:
+                if face_landmarks is not None:
                     attention_score = self._calculate_attention_from_mesh(
-                        face_mesh_results.multi_face_landmarks[0], 
+                        face_landmarks, 
                         frame.shape
                     )
                     
                     # Add eye landmarks as attention points
-                    landmarks = face_mesh_results.multi_face_landmarks[0].landmark
+                    landmarks = face_landmarks.landmark
                     # Left eye points
                     for idx in [33, 133, 157, 158, 159, 160, 161, 246]:
                         metrics['attention_points'].append({
@@ -133,28 +300,19 @@ class FocusDetector:
                 # Update focus time if focused
                 if metrics['focus_score'] >= self.focus_threshold * 100:
                     current_time = time.time()
-                    self.total_focus_time += current_time - self.last_focus_time
+                    session.total_focus_time += current_time - session.last_focus_time
                     metrics['is_focused'] = True
                 
-                self.last_focus_time = time.time()
-                
-                # Store focus history
-                self.focus_history.append({
-                    'timestamp': metrics['timestamp'],
-                    'score': metrics['focus_score'],
-                    'is_focused': metrics['is_focused']
-                })
+                session.last_focus_time = time.time()
                 
-                # Keep only last 5 minutes of history
-                five_minutes_ago = time.time() - 300
-                self.focus_history = [entry for entry in self.focus_history 
-                                    if datetime.fromisoformat(entry['timestamp']).timestamp() > five_minutes_ago]
+                # Store focus history (entries older than 5 minutes drop out)
+                session.focus_history.append(metrics['focus_score'], metrics['is_focused'])
                 
                 # Update average focus every second
                 current_time = time.time()
-                if current_time - self.last_update_time >= self.update_interval:
-                    metrics['average_focus'] = self._calculate_average_focus()
-                    self.last_update_time = current_time
+                if current_time - session.last_update_time >= self.update_interval:
+                    metrics['average_focus'] = self._calculate_average_focus(session)
+                    session.last_update_time = current_time
             
             # Draw focus visualization on frame
             self._draw_focus_visualization(frame, metrics)
@@ -168,43 +326,51 @@ class FocusDetector:
                 'is_focused': False,
                 'face_detected': False,
                 'looking_away': False,
-                'total_focus_time': self.total_focus_time,
+                'total_focus_time': session.total_focus_time,
                 'timestamp': datetime.now().isoformat(),
                 'face_box': None,
                 'attention_points': [],
                 'average_focus': 0
             }, frame
 
-    def _calculate_stability(self, x, y, w, h):
+    def _box_from_landmarks(self, face_landmarks):
+        """Relative (xmin, ymin, width, height) of the face oval landmarks"""
+        landmarks = face_landmarks.landmark
+        xs = [landmarks[idx].x for idx in FACE_OVAL_INDICES]
+        ys = [landmarks[idx].y for idx in FACE_OVAL_INDICES]
+        xmin, ymin = max(0.0, min(xs)), max(0.0, min(ys))
+        return xmin, ymin, min(1.0, max(xs)) - xmin, min(1.0, max(ys)) - ymin
+
+    def _calculate_stability(self, session, x, y, w, h):
         try:
             current_pos = np.array([x + w/2, y + h/2])
             
-            if self.prev_face_pos is None:
-                self.prev_face_pos = current_pos
+            if session.prev_face_pos is None:
+                session.prev_face_pos = current_pos
                 return 1.0
 
             # Convert previous position to numpy array if it isn't already
-            if not isinstance(self.prev_face_pos, np.ndarray):
-                self.prev_face_pos = np.array(self.prev_face_pos)
+            if not isinstance(session.prev_face_pos, np.ndarray):
+                session.prev_face_pos = np.array(session.prev_face_pos)
 
             # Ensure both positions are valid
-            if not (np.all(np.isfinite(current_pos)) and np.all(np.isfinite(self.prev_face_pos))):
+            if not (np.all(np.isfinite(current_pos)) and np.all(np.isfinite(session.prev_face_pos))):
                 logger.warning("Invalid position values detected")
                 return 1.0
 
-            movement = np.linalg.norm(current_pos - self.prev_face_pos)
-            self.prev_face_pos = current_pos
+            movement = np.linalg.norm(current_pos - session.prev_face_pos)
+            session.prev_face_pos = current_pos
             
             # Normalize movement (100 pixels as max movement threshold)
             stability = max(0, 1 - (movement / 100))
             
             # Update movement history
-            self.movement_history.append(stability)
-            if len(self.movement_history) > 5:
-                self.movement_history.pop(0)
+            session.movement_history.append(stability)
+            if len(session.movement_history) > 5:
+                session.movement_history.pop(0)
             
             # Return smoothed stability score
-            return sum(self.movement_history) / len(self.movement_history)
+            return sum(session.movement_history) / len(session.movement_history)
         except Exception as e:
             logger.error(f"Error in stability calculation: {str(e)}")
             return 0.5
@@ -264,13 +430,9 @@ class FocusDetector:
             logger.error(f"Error calculating eye aspect ratio: {str(e)}")
             return 0.3  # Return a default "open eye" value
 
-    def _calculate_average_focus(self):
-        if not self.focus_history:
-            return 0
-        
+    def _calculate_average_focus(self, session):
         # Calculate average focus from recent history
-        recent_scores = [entry['score'] for entry in self.focus_history]
-        return sum(recent_scores) / len(recent_scores)
+        return session.focus_history.average()
 
     def _draw_focus_visualization(self, frame, metrics):
         if metrics['face_detected']:
@@ -329,8 +491,16 @@ class FocusDetector:
                        cv2.FONT_HERSHEY_SIMPLEX, 0.7,
                        status_color, 2)
     
-    def get_focus_statistics(self):
-        if not self.focus_history:
+    def get_focus_statistics(self, session_id=None):
+        session = self.default_session if session_id is None else self.session_pool.get(session_id)
+        if session is None:
+            return {
+                'average_score': 0,
+                'total_focus_time': 0,
+                'focus_percentage': 0
+            }
+        session.focus_history.expire()
+        if not session.focus_history:
             return {
                 'average_score': 0,
                 'total_focus_time': 0,
@@ -338,15 +508,13 @@ class FocusDetector:
             }
         
         # Calculate average focus score
-        recent_scores = [entry['score'] for entry in self.focus_history]
-        average_score = sum(recent_scores) / len(recent_scores)
+        average_score = session.focus_history.average()
         
         # Calculate focus percentage
-        focused_entries = [entry for entry in self.focus_history if entry['is_focused']]
-        focus_percentage = (len(focused_entries) / len(self.focus_history)) * 100 if self.focus_history else 0
+        focus_percentage = session.focus_history.focus_percentage()
         
         return {
             'average_score': round(average_score, 2),
-            'total_focus_time': round(self.total_focus_time, 2),
+            'total_focus_time': round(session.total_focus_time, 2),
             'focus_percentage': round(focus_percentage, 2)
         } 
\ No newline at end of file
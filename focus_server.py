@@ -8,23 +8,34 @@ import logging
 from datetime import datetime
 import traceback
 import base64
+import time
+import threading
+from collections import OrderedDict
+
+# Frame decoding, detection and logging helpers are shared with python_model/
+from python_model.image_utils import (
+    DetectorPool, decode_gray, resize_to_width, scale_rect, synthetic_frame,
+    DETECTION_WIDTH, WARMUP_RESOLUTIONS, parse_resolutions
+)
+from python_model.landmark_features import shape_to_array, extract_features
+from python_model.log_utils import setup_logging, ThrottledLogger
 
 app = Flask(__name__)
 CORS(app, resources={
     r"/*": {
         "origins": ["http://localhost:8000", "http://127.0.0.1:8000", "http://localhost:5173", "http://127.0.0.1:5173"],
         "methods": ["GET", "POST", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization", "X-Requested-With"]
+        "allow_headers": ["Content-Type", "Authorization", "X-Requested-With", "X-Session-Id"]
     }
 })
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    filename='focus_tracker.log'
-)
+# Configure logging; records are written by a background thread
+setup_logging('focus_tracker.log', fmt='%(asctime)s - %(name)s - %(levelname)s - %(message)s', stream=None)
 logger = logging.getLogger(__name__)
+# Messages that would otherwise be logged for every frame
+gaze_log = ThrottledLogger(logger)
+dlib_error_log = ThrottledLogger(logger)
+no_face_log = ThrottledLogger(logger)
 
 # Initialize OpenCV Face Detection
 face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
@@ -34,7 +45,8 @@ detector = None
 predictor = None
 
 try:
-    detector = dlib.get_frontal_face_detector()
+    # One detector per concurrent request thread, as dlib's is not thread-safe
+    detector = DetectorPool()
     
     # Try to find the model file in various locations
     possible_model_paths = [
@@ -56,6 +68,84 @@ try:
 except Exception as e:
     logger.error(f"Error initializing dlib: {str(e)}")
 
+def detect_largest_face(gray):
+    """Run the dlib detector at DETECTION_WIDTH (FOCUS_DETECT_WIDTH) and return the largest face at full resolution"""
+    small, scale = resize_to_width(gray, DETECTION_WIDTH)
+    dlib_faces = detector(small)
+    if len(dlib_faces) == 0:
+        return None
+    face_rect = max(dlib_faces, key=lambda rect: rect.width() * rect.height())
+    return scale_rect(face_rect, scale)
+
+# Detect-once-then-track: the full HOG detector runs every REDETECT_INTERVAL
+# frames per client, or when tracking confidence drops. 0 disables tracking.
+REDETECT_INTERVAL = int(os.environ.get('FOCUS_REDETECT_INTERVAL', 10))
+TRACK_MIN_CONFIDENCE = float(os.environ.get('FOCUS_TRACK_MIN_CONFIDENCE', 7.0))
+MAX_FACE_TRACKS = 500
+
+# Face tracks keyed by sessionId, least recently used first. Frames sent
+# without a sessionId are not tracked: clients behind one address (NAT, a
+# proxy) would otherwise share a track. Request threads share the dict, so
+# it is only used under face_tracks_lock.
+face_tracks = OrderedDict()
+face_tracks_lock = threading.Lock()
+
+class FaceTrack:
+    """Follows one client's face between full dlib detections"""
+    def __init__(self):
+        self.tracker = None
+        self.frames_since_detect = 0
+        # Landmark buffer reused for every frame of this client
+        self.landmarks = np.empty((68, 2), dtype=np.float64)
+        # Held while a frame uses the tracker and buffer
+        self.lock = threading.Lock()
+
+    def locate(self, gray):
+        if self.tracker is not None and self.frames_since_detect < REDETECT_INTERVAL:
+            if self.tracker.update(gray) >= TRACK_MIN_CONFIDENCE:
+                position = self.tracker.get_position()
+                face_rect = dlib.rectangle(
+                    max(0, int(round(position.left()))),
+                    max(0, int(round(position.top()))),
+                    min(gray.shape[1] - 1, int(round(position.right()))),
+                    min(gray.shape[0] - 1, int(round(position.bottom())))
+                )
+                if face_rect.width() > 0 and face_rect.height() > 0:
+                    self.frames_since_detect += 1
+                    return face_rect
+
+        face_rect = detect_largest_face(gray)
+        self.frames_since_detect = 0
+        if face_rect is None:
+            self.tracker = None
+            return None
+
+        if REDETECT_INTERVAL > 0:
+            self.tracker = dlib.correlation_tracker()
+            self.tracker.start_track(gray, face_rect)
+        return face_rect
+
+def get_face_track(key):
+    """Return the face track for a session, evicting the least recently used one when full"""
+    with face_tracks_lock:
+        track = face_tracks.get(key)
+        if track is None:
+            track = face_tracks[key] = FaceTrack()
+            if len(face_tracks) > MAX_FACE_TRACKS:
+                face_tracks.popitem(last=False)
+        else:
+            face_tracks.move_to_end(key)
+        return track
+
+def analyze_session_focus(frame, session_id):
+    """Analyze a frame, following the session's face between detections when there is a session ID"""
+    if not session_id:
+        return analyze_focus(frame)
+    track = get_face_track(session_id)
+    # Frames of one session sent in parallel take turns on its track
+    with track.lock:
+        return analyze_focus(frame, track)
+
 def calculate_position_score(x, y):
     """Calculate a score based on face position relative to center"""
     # Center is ideal (0.5, 0.5)
@@ -75,56 +165,34 @@ def calculate_size_score(area):
     else:
         return 1.0  # Just right
 
-def analyze_focus(frame):
+def analyze_focus(frame, track=None):
     """
     Analyze focus level based on face detection and position
     Returns a focus score between 0 and 100
+
+    If a FaceTrack is given, the face is followed between full detections.
     """
     try:
-        # Convert frame to grayscale for face detection
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        # Convert frame to grayscale for face detection (frames from
+        # decode_gray already are)
+        gray = frame if frame.ndim == 2 else cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
         
         # First try to use dlib for more precise facial landmark detection
         if detector is not None and predictor is not None:
             try:
-                # Detect faces using dlib
-                dlib_faces = detector(gray)
-                if len(dlib_faces) > 0:
-                    # Get the largest face
-                    face_rect = max(dlib_faces, key=lambda rect: rect.width() * rect.height())
-                    
-                    # Get facial landmarks
+                # Detect (or track) faces using dlib
+                if track is not None:
+                    face_rect = track.locate(gray)
+                else:
+                    face_rect = detect_largest_face(gray)
+                
+                if face_rect is not None:
+                    # Get facial landmarks, into the track's buffer when there is one
                     landmarks = predictor(gray, face_rect)
-                    landmarks_points = np.array([[p.x, p.y] for p in landmarks.parts()])
-                    
-                    # Extract eye landmarks
-                    left_eye = landmarks_points[36:42]  # Left eye points
-                    right_eye = landmarks_points[42:48]  # Right eye points
-                    
-                    # Calculate eye centers
-                    left_eye_center = np.mean(left_eye, axis=0)
-                    right_eye_center = np.mean(right_eye, axis=0)
-                    
-                    # Calculate ideal eye centers (horizontal)
-                    left_eye_ideal_center = np.mean([landmarks_points[36], landmarks_points[39]], axis=0)
-                    right_eye_ideal_center = np.mean([landmarks_points[42], landmarks_points[45]], axis=0)
-                    
-                    # Calculate eye tops and bottoms
-                    left_eye_top = np.mean([landmarks_points[37], landmarks_points[38]], axis=0)
-                    left_eye_bottom = np.mean([landmarks_points[40], landmarks_points[41]], axis=0)
-                    right_eye_top = np.mean([landmarks_points[43], landmarks_points[44]], axis=0)
-                    right_eye_bottom = np.mean([landmarks_points[46], landmarks_points[47]], axis=0)
-                    
-                    # Calculate horizontal and vertical deviations
-                    left_h_dev = np.linalg.norm(left_eye_center - left_eye_ideal_center) / np.linalg.norm(landmarks_points[36] - landmarks_points[39])
-                    right_h_dev = np.linalg.norm(right_eye_center - right_eye_ideal_center) / np.linalg.norm(landmarks_points[42] - landmarks_points[45])
-                    
-                    left_v_dev = np.linalg.norm(left_eye_center - (left_eye_top + left_eye_bottom)/2) / np.linalg.norm(left_eye_top - left_eye_bottom)
-                    right_v_dev = np.linalg.norm(right_eye_center - (right_eye_top + right_eye_bottom)/2) / np.linalg.norm(right_eye_top - right_eye_bottom)
+                    landmarks_points = shape_to_array(landmarks, track.landmarks if track is not None else None)
                     
-                    # Combine deviations
-                    h_deviation = (left_h_dev + right_h_dev) / 2
-                    v_deviation = (left_v_dev + right_v_dev) / 2
+                    # Eye gaze deviations and direction in one vectorised pass
+                    features = extract_features(landmarks_points)
                     
                     # Calculate position information using face landmarks
                     face_center_x = landmarks_points[27][0] / frame.shape[1]  # Nose bridge point
@@ -137,26 +205,9 @@ def analyze_focus(frame):
                     face_size = (face_rect.width() * face_rect.height()) / (frame.shape[0] * frame.shape[1])
                     size_score = calculate_size_score(face_size)
                     
-                    # Calculate gaze score based on eye positions
-                    gaze_score = 1.0 - min(1.0, h_deviation * 2.0 + v_deviation * 1.5)
-                    
-                    # Determine direction
-                    looking_direction = "center"
-                    if h_deviation > 0.2:
-                        if left_eye_center[0] > left_eye_ideal_center[0] and right_eye_center[0] > right_eye_ideal_center[0]:
-                            looking_direction = "right"
-                        elif left_eye_center[0] < left_eye_ideal_center[0] and right_eye_center[0] < right_eye_ideal_center[0]:
-                            looking_direction = "left"
-                    
-                    if v_deviation > 0.2:
-                        if left_eye_center[1] > left_eye_ideal_center[1] and right_eye_center[1] > right_eye_ideal_center[1]:
-                            looking_direction = looking_direction + "-down"
-                        elif left_eye_center[1] < left_eye_ideal_center[1] and right_eye_center[1] < right_eye_ideal_center[1]:
-                            looking_direction = looking_direction + "-up"
-                            
-                    # Boost score if looking directly at camera
-                    if looking_direction == "center":
-                        gaze_score = min(1.0, gaze_score * 1.2)
+                    # Gaze score (boosted when looking directly at the camera) and direction
+                    gaze_score = features['gaze_score']
+                    looking_direction = features['looking_direction']
                     
                     # Combine scores with weights
                     focus_score = (position_score * 0.3 + size_score * 0.2 + gaze_score * 0.5) * 100
@@ -170,28 +221,30 @@ def analyze_focus(frame):
                     elif gaze_score < 0.4:  # Looking away
                         focus_score = focus_score * 0.8  # Penalty for looking away
                     
-                    logger.info(f"Eye gaze detected with dlib. Direction: {looking_direction}, Score: {focus_score:.2f}")
+                    gaze_log.info("Eye gaze detected with dlib. Direction: %s, Score: %.2f", looking_direction, focus_score)
                     
                     return min(100, max(0, focus_score))
             
             except Exception as e:
-                logger.warning(f"Dlib processing error: {e}. Falling back to OpenCV.")
+                dlib_error_log.warning("Dlib processing error: %s. Falling back to OpenCV.", e)
         
         # Fallback to OpenCV if dlib failed or is not available
+        small, scale = resize_to_width(gray, DETECTION_WIDTH)
+        min_size = max(1, int(30 * scale))
         faces = face_cascade.detectMultiScale(
-            gray,
+            small,
             scaleFactor=1.1,
             minNeighbors=5,
-            minSize=(30, 30)
+            minSize=(min_size, min_size)
         )
         
         if len(faces) == 0:
-            logger.warning("No face detected")
+            no_face_log.warning("No face detected")
             return 0  # No face detected = not focused
         
-        # Get the largest face (closest to camera)
+        # Get the largest face (closest to camera), in full-resolution pixels
         largest_face = max(faces, key=lambda f: f[2] * f[3])
-        x, y, w, h = largest_face
+        x, y, w, h = [int(round(v / scale)) for v in largest_face]
         
         # Calculate relative position and size
         frame_h, frame_w = frame.shape[:2]
@@ -235,16 +288,16 @@ def analyze_focus_endpoint():
             return jsonify({'error': 'No image data provided'}), 400
             
         try:
-            # Convert base64 image to numpy array
+            # Convert base64 image straight to a (reduced) grayscale frame;
+            # scores are relative to the frame size, so the decode scale is not needed
             image_bytes = image_data['image'].split(',')[1].encode('utf-8')
-            np_arr = np.frombuffer(base64.b64decode(image_bytes), np.uint8)
-            frame = cv2.imdecode(np_arr, cv2.IMREAD_COLOR)
+            frame, _ = decode_gray(base64.b64decode(image_bytes))
             
             if frame is None:
                 return jsonify({'error': 'Invalid image data'}), 400
                 
-            # Analyze focus
-            focus_score = analyze_focus(frame)
+            # Analyze focus, tracking the face per session
+            focus_score = analyze_session_focus(frame, image_data.get('sessionId'))
             
             # Return the focus score
             return jsonify({
@@ -260,9 +313,79 @@ def analyze_focus_endpoint():
         logger.error(f"Error processing request: {str(e)}\n{traceback.format_exc()}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/analyze-focus/raw', methods=['POST', 'OPTIONS'])
+def analyze_focus_raw_endpoint():
+    """
+    Analyze a frame uploaded as raw image bytes (application/octet-stream, or
+    multipart with a 'frame' file) instead of base64 inside JSON. The optional
+    session ID comes from the X-Session-Id header or sessionId query parameter.
+    """
+    if request.method == 'OPTIONS':
+        return '', 204
+        
+    try:
+        if 'frame' in request.files:
+            frame_bytes = request.files['frame'].read()
+        else:
+            frame_bytes = request.get_data(cache=False)
+        if not frame_bytes:
+            return jsonify({'error': 'No image data provided'}), 400
+            
+        try:
+            # Decode straight from the request buffer to a (reduced) grayscale frame
+            frame, _ = decode_gray(frame_bytes)
+            
+            if frame is None:
+                return jsonify({'error': 'Invalid image data'}), 400
+                
+            session_id = request.headers.get('X-Session-Id') or request.args.get('sessionId')
+            focus_score = analyze_session_focus(frame, session_id)
+            
+            return jsonify({
+                'focus_score': focus_score,
+                'timestamp': datetime.utcnow().isoformat() + 'Z'
+            })
+            
+        except Exception as e:
+            logger.error(f"Error processing image: {str(e)}\n{traceback.format_exc()}")
+            return jsonify({'error': 'Error processing image data'}), 400
+            
+    except Exception as e:
+        logger.error(f"Error processing request: {str(e)}\n{traceback.format_exc()}")
+        return jsonify({'error': str(e)}), 500
+
+# Set once warm_up has run the models; /ready reports 503 until then
+warmed_up = threading.Event()
+
+def warm_up():
+    """Run the detector, predictor and cascade on synthetic frames so the first request is not slow"""
+    try:
+        for width, height in parse_resolutions(WARMUP_RESOLUTIONS):
+            start = time.time()
+            gray = synthetic_frame(width, height, channels=1)
+            analyze_focus(gray, FaceTrack())
+            if predictor is not None:
+                predictor(gray, dlib.rectangle(width // 3, height // 4, 2 * width // 3, 3 * height // 4))
+            logger.info(f"Warmed up at {width}x{height} in {time.time() - start:.3f}s")
+    except Exception as e:
+        logger.error(f"Warm-up failed: {str(e)}\n{traceback.format_exc()}")
+    warmed_up.set()
+
+def start_warm_up():
+    """Warm up in a background thread so /health and /ready answer meanwhile"""
+    threading.Thread(target=warm_up, name='focus-warm-up', daemon=True).start()
+
 @app.route('/health', methods=['GET'])
 def health_check():
     return jsonify({'status': 'healthy'}), 200
 
+@app.route('/ready', methods=['GET'])
+def ready_check():
+    """Readiness endpoint: 503 until the models are warmed up"""
+    if warmed_up.is_set():
+        return jsonify({'ready': True}), 200
+    return jsonify({'ready': False, 'message': 'Warming up'}), 503
+
 if __name__ == '__main__':
+    start_warm_up()
     app.run(host='0.0.0.0', port=5000) 
\ No newline at end of file
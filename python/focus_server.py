@@ -1,4 +1,5 @@
 import os
+import sys
 import cv2
 import numpy as np
 import dlib
@@ -8,6 +9,11 @@ import logging
 from datetime import datetime
 import traceback
 
+# Run from python/; the detection helpers come from the python_model package
+# next to it
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from python_model.image_utils import DetectorPool, resize_to_width, scale_rect, DETECTION_WIDTH
+
 app = Flask(__name__)
 CORS(app, resources={
     r"/*": {
@@ -32,7 +38,8 @@ detector = None
 predictor = None
 
 try:
-    detector = dlib.get_frontal_face_detector()
+    # One detector per concurrent request thread, as dlib's is not thread-safe
+    detector = DetectorPool()
     
     # Try to find the model file
     model_path = 'shape_predictor_68_face_landmarks.dat'
@@ -49,6 +56,15 @@ try:
 except Exception as e:
     logger.error(f"Error initializing dlib: {str(e)}")
 
+def detect_largest_face(gray):
+    """Run the dlib detector at DETECTION_WIDTH (FOCUS_DETECT_WIDTH) and return the largest face at full resolution"""
+    small, scale = resize_to_width(gray, DETECTION_WIDTH)
+    dlib_faces = detector(small)
+    if len(dlib_faces) == 0:
+        return None
+    face_rect = max(dlib_faces, key=lambda rect: rect.width() * rect.height())
+    return scale_rect(face_rect, scale)
+
 def analyze_focus(frame):
     """
     Analyze focus level based on face detection and position
@@ -61,12 +77,9 @@ def analyze_focus(frame):
         # First try to use dlib for more precise facial landmark detection
         if detector is not None and predictor is not None:
             try:
-                # Detect faces using dlib
-                dlib_faces = detector(gray)
-                if len(dlib_faces) > 0:
-                    # Get the largest face
-                    face_rect = max(dlib_faces, key=lambda rect: rect.width() * rect.height())
-                    
+                # Detect faces using dlib on the downscaled frame
+                face_rect = detect_largest_face(gray)
+                if face_rect is not None:
                     # Get facial landmarks
                     landmarks = predictor(gray, face_rect)
                     landmarks_points = np.array([[p.x, p.y] for p in landmarks.parts()])
@@ -152,20 +165,22 @@ def analyze_focus(frame):
                 logger.warning(f"Dlib processing error: {e}. Falling back to OpenCV.")
         
         # Fallback to OpenCV if dlib failed or is not available
+        small, scale = resize_to_width(gray, DETECTION_WIDTH)
+        min_size = max(1, int(30 * scale))
         faces = face_cascade.detectMultiScale(
-            gray,
+            small,
             scaleFactor=1.1,
             minNeighbors=5,
-            minSize=(30, 30)
+            minSize=(min_size, min_size)
         )
         
         if len(faces) == 0:
             logger.warning("No face detected")
             return 0  # No face detected = not focused
         
-        # Get the largest face (closest to camera)
+        # Get the largest face (closest to camera), in full-resolution pixels
         largest_face = max(faces, key=lambda f: f[2] * f[3])
-        x, y, w, h = largest_face
+        x, y, w, h = [int(round(v / scale)) for v in largest_face]
         
         # Calculate relative position and size
         frame_h, frame_w = frame.shape[:2]
@@ -0,0 +1,284 @@
+import os
+import csv
+import sys
+import time
+import hashlib
+import logging
+import argparse
+import traceback
+import multiprocessing
+
+import cv2
+
+logger = logging.getLogger(__name__)
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.webm', '.m4v')
+
+# Analysed frames run before each range starts (and not written) so the
+# smoothing histories are primed instead of starting from scratch
+WARMUP_FRAMES = 5
+
+# Timeline columns written for each detector, after 'frame' and 'time'
+DETECTOR_COLUMNS = {
+    'dlib': [
+        'focusScore', 'isDrowsy', 'eyeOpenness', 'faceStability', 'gazeQuality',
+        'headPoseQuality', 'attentionQuality', 'lookingDirection', 'fallbackUsed',
+        'reused', 'message'
+    ],
+    'haar': [
+        'focus_score', 'is_focused', 'face_detected', 'looking_away',
+        'eye_openness', 'face_stability', 'attention_score', 'average_focus'
+    ]
+}
+
+# Per-process detector, loaded once by _init_worker
+_new_analyzer = None
+
+
+def _init_worker(detector, reuse, log_level):
+    """Load the chosen detector's models once per worker process"""
+    global _new_analyzer
+    logging.basicConfig(level=log_level, format='%(asctime)s - %(levelname)s - %(message)s')
+    logging.getLogger().setLevel(log_level)
+
+    if detector == 'dlib':
+        from focus_tracker import FocusTracker, SessionState
+        tracker = FocusTracker()
+        if not reuse:
+            tracker.reuse_threshold = 0
+
+        def new_analyzer():
+            state = SessionState()
+            return lambda frame: tracker.process_frame(frame, state)
+    else:
+        from focus_detector import FocusDetector
+
+        def new_analyzer():
+            analyze = FocusDetector().analyze_frame
+
+            def analyze_flat(frame):
+                result = analyze(frame)
+                result.update(result.pop('details', {}))
+                return result
+            return analyze_flat
+
+    _new_analyzer = new_analyzer
+
+
+def _analyze_range(task):
+    """Analyse every stride-th frame in [start, end) of a video and write a part file"""
+    video_path, start, end, stride, fps, columns, part_path = task
+    cpu_start = time.process_time()
+    analyzed = 0
+    rows = []
+    try:
+        analyze = _new_analyzer()
+        capture = cv2.VideoCapture(video_path)
+        index = max(0, start - WARMUP_FRAMES * stride)
+        if index > 0:
+            capture.set(cv2.CAP_PROP_POS_FRAMES, index)
+
+        while index < end:
+            if index % stride:
+                # Skipped frames are only demuxed, never decoded
+                if not capture.grab():
+                    break
+            else:
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                result = analyze(frame)
+                analyzed += 1
+                if index >= start:
+                    rows.append([index, round(index / fps, 3) if fps else ''] + [result.get(column, False if column == 'reused' else '') for column in columns])
+            index += 1
+        capture.release()
+
+        # Write to a temporary name first so an interrupted run never leaves a partial part
+        tmp_path = part_path + '.tmp'
+        with open(tmp_path, 'w', newline='') as part:
+            writer = csv.writer(part)
+            writer.writerow(['frame', 'time'] + columns)
+            writer.writerows(rows)
+        os.replace(tmp_path, part_path)
+        error = None
+    except Exception as e:
+        logger.error(f"Error analysing {video_path} frames {start}-{end}: {str(e)}\n{traceback.format_exc()}")
+        error = str(e)
+
+    return video_path, part_path, len(rows), analyzed, time.process_time() - cpu_start, error
+
+
+def find_videos(paths):
+    """Expand files and directories into a sorted list of video files"""
+    videos = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                videos.extend(os.path.join(root, name) for name in files if name.lower().endswith(VIDEO_EXTENSIONS))
+        elif os.path.isfile(path):
+            videos.append(path)
+        else:
+            logger.warning(f"Skipping {path}: not a file or directory")
+    return sorted(videos)
+
+
+def video_key(video_path):
+    """File name stem plus a hash of the absolute path, so same-named videos from different directories do not collide"""
+    stem = os.path.splitext(os.path.basename(video_path))[0]
+    digest = hashlib.sha1(os.path.abspath(video_path).encode('utf-8')).hexdigest()[:8]
+    return f"{stem}.{digest}"
+
+
+def plan_video(video_path, output_dir, args):
+    """Split a video into frame ranges; ranges whose part file exists are already done"""
+    key = video_key(video_path)
+    output_path = os.path.join(output_dir, f"{key}.focus.{args.format}")
+    if os.path.exists(output_path) and not args.overwrite:
+        logger.info(f"Skipping {video_path}: {output_path} already exists")
+        return None
+
+    capture = cv2.VideoCapture(video_path)
+    if not capture.isOpened():
+        logger.error(f"Could not open {video_path}")
+        return None
+    frame_count = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = capture.get(cv2.CAP_PROP_FPS) or 0.0
+    capture.release()
+
+    # Ranges start on the stride grid so resumed and fresh runs pick the same frames
+    chunk = max(args.stride, args.chunk_frames // args.stride * args.stride)
+    if frame_count <= 0:
+        # Unknown length: one range read until the end of the stream
+        bounds = [(0, sys.maxsize)]
+    else:
+        bounds = [(start, min(start + chunk, frame_count)) for start in range(0, frame_count, chunk)]
+
+    # Parts are keyed by detector and stride so a resume never mixes settings
+    parts_dir = os.path.join(output_dir, f"{key}.{args.detector}.stride{args.stride}.parts")
+    os.makedirs(parts_dir, exist_ok=True)
+    columns = DETECTOR_COLUMNS[args.detector]
+    parts = []
+    tasks = []
+    for start, end in bounds:
+        part_path = os.path.join(parts_dir, f"{start:09d}.csv")
+        parts.append(part_path)
+        if not os.path.exists(part_path):
+            tasks.append((video_path, start, end, args.stride, fps, columns, part_path))
+
+    return {
+        'video': video_path,
+        'output': output_path,
+        'parts_dir': parts_dir,
+        'parts': parts,
+        'tasks': tasks,
+        'frame_count': frame_count,
+        'rows': 0,
+        'pending': len(tasks),
+        'failed': False
+    }
+
+
+def merge_parts(plan, output_format):
+    """Join a video's part files, in frame order, into its timeline file"""
+    tmp_path = plan['output'] + '.tmp'
+    if output_format == 'parquet':
+        import pandas as pd
+        frames = [pd.read_csv(part) for part in plan['parts']]
+        pd.concat(frames, ignore_index=True).to_parquet(tmp_path, index=False)
+    else:
+        with open(tmp_path, 'w', newline='') as output:
+            for number, part in enumerate(plan['parts']):
+                with open(part, newline='') as source:
+                    header = source.readline()
+                    if number == 0:
+                        output.write(header)
+                    output.writelines(source)
+    os.replace(tmp_path, plan['output'])
+
+    for part in plan['parts']:
+        os.remove(part)
+    os.rmdir(plan['parts_dir'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Analyse recorded videos offline and write per-frame focus timelines')
+    parser.add_argument('inputs', nargs='+', help='Video files or directories containing videos')
+    parser.add_argument('-o', '--output-dir', default='focus_timelines', help='Directory for timelines and resume parts')
+    parser.add_argument('--format', choices=('csv', 'parquet'), default='csv')
+    parser.add_argument('--detector', choices=sorted(DETECTOR_COLUMNS), default='dlib',
+                        help='dlib: FocusTracker (landmarks); haar: OpenCV cascade FocusDetector')
+    parser.add_argument('--stride', type=int, default=1, help='Analyse every Nth frame')
+    parser.add_argument('--chunk-frames', type=int, default=1500, help='Frames per range handed to a worker')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--no-reuse', action='store_true',
+                        help='Analyse every frame instead of reusing results for unchanged frames')
+    parser.add_argument('--overwrite', action='store_true', help='Re-analyse videos whose timeline already exists')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args()
+    if args.stride < 1 or args.chunk_frames < 1 or args.workers < 1:
+        parser.error('--stride, --chunk-frames and --workers must be at least 1')
+
+    if args.format == 'parquet':
+        try:
+            import pandas
+            import pyarrow
+        except ImportError:
+            parser.error('Parquet output needs pandas and pyarrow (pip install pandas pyarrow)')
+
+    log_level = logging.INFO if args.verbose else logging.WARNING
+    logging.basicConfig(level=log_level, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    videos = find_videos(args.inputs)
+    if not videos:
+        raise SystemExit("No videos found")
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    plans = {}
+    for video in videos:
+        plan = plan_video(video, args.output_dir, args)
+        if plan is not None:
+            plans[video] = plan
+    tasks = [task for plan in plans.values() for task in plan['tasks']]
+    resumed = sum(len(plan['parts']) - len(plan['tasks']) for plan in plans.values())
+    logger.info(f"{len(plans)} videos, {len(tasks)} frame ranges to analyse ({resumed} already done), {args.workers} workers")
+
+    start = time.perf_counter()
+    analyzed = 0
+    cpu_seconds = 0.0
+    if tasks:
+        with multiprocessing.Pool(args.workers, initializer=_init_worker,
+                                  initargs=(args.detector, not args.no_reuse, log_level)) as pool:
+            for video, part_path, rows, frames, cpu, error in pool.imap_unordered(_analyze_range, tasks):
+                plan = plans[video]
+                plan['pending'] -= 1
+                plan['rows'] += rows
+                analyzed += frames
+                cpu_seconds += cpu
+                if error is not None:
+                    plan['failed'] = True
+                if plan['pending'] == 0 and not plan['failed']:
+                    merge_parts(plan, args.format)
+                    logger.info(f"Wrote {plan['output']}")
+    for plan in plans.values():
+        if not plan['tasks']:
+            # Every range was finished by an earlier run; only the merge was missing
+            merge_parts(plan, args.format)
+            logger.info(f"Wrote {plan['output']}")
+    elapsed = time.perf_counter() - start
+
+    failed = [plan['video'] for plan in plans.values() if plan['failed']]
+    fps = analyzed / elapsed if elapsed > 0 else 0.0
+    cores = max(1, min(args.workers, len(tasks)))
+    print(f"Videos: {len(plans)} ({len(failed)} failed), ranges analysed: {len(tasks)}, resumed: {resumed}")
+    print(f"Frames analysed: {analyzed} in {elapsed:.1f}s with {cores} workers")
+    print(f"Throughput: {fps:.1f} fps, {fps / cores:.1f} fps per core, "
+          f"{analyzed / cpu_seconds if cpu_seconds else 0.0:.1f} frames per CPU-second")
+    for video in failed:
+        print(f"Failed: {video} (rerun to retry the unfinished ranges)")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
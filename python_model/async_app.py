@@ -0,0 +1,316 @@
+import os
+import sys
+import time
+import base64
+import asyncio
+import logging
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+
+# Sessions, tracker state and the inference backends are shared with the Flask service
+import app as service
+from session_registry import SessionLimitError
+
+logger = logging.getLogger(__name__)
+
+SUPERSEDED_RESULT = {
+    'type': 'superseded',
+    'success': False,
+    'superseded': True,
+    'message': 'Frame superseded by a newer frame from the same session'
+}
+
+
+class LatestFrameScheduler:
+    """Runs at most one frame per session, keeping only the newest waiting frame.
+
+    While a session's frame is being analysed, the next frame waits in a
+    single pending slot. A newer frame replaces it and the replaced request
+    is answered with None straight away, so a session that uploads faster
+    than it can be analysed gets scores for its latest frame instead of a
+    growing queue of stale ones.
+    """
+    def __init__(self, analyze, executor):
+        self.analyze = analyze
+        self.executor = executor
+        self._sessions = {}
+        self.analyzed = 0
+        self.superseded = 0
+
+    async def submit(self, session_id, *args):
+        """Analyse a frame in the executor; returns None if a newer frame replaced it"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        slot = self._sessions.get(session_id)
+        if slot is None:
+            slot = self._sessions[session_id] = {'running': False, 'pending': None}
+        if slot['pending'] is not None:
+            _, replaced = slot['pending']
+            if not replaced.done():
+                replaced.set_result(None)
+            self.superseded += 1
+        slot['pending'] = (args, future)
+
+        if not slot['running']:
+            slot['running'] = True
+            loop.create_task(self._drain(session_id, slot))
+        return await future
+
+    async def _drain(self, session_id, slot):
+        loop = asyncio.get_running_loop()
+        try:
+            while slot['pending'] is not None:
+                args, future = slot['pending']
+                slot['pending'] = None
+                try:
+                    result = await loop.run_in_executor(self.executor, self.analyze, session_id, *args)
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                    continue
+                self.analyzed += 1
+                if not future.done():
+                    future.set_result(result)
+        finally:
+            slot['running'] = False
+            if self._sessions.get(session_id) is slot and slot['pending'] is None:
+                del self._sessions[session_id]
+
+    def stats(self):
+        return {
+            'activeSessions': len(self._sessions),
+            'analyzed': self.analyzed,
+            'superseded': self.superseded
+        }
+
+
+def analyze_encoded(session_id, frame_data):
+    """Decode and analyse one uploaded frame (runs in an executor thread)"""
+    timings = {}
+    if isinstance(frame_data, str):
+        # Remove data URL prefix if present
+        if ',' in frame_data:
+            frame_data = frame_data.split(',')[1]
+        start = time.perf_counter()
+        frame_data = base64.b64decode(frame_data)
+        timings['base64_decode'] = time.perf_counter() - start
+    return service.analyze_stream_frame(session_id, frame_data, timings)
+
+
+async def run_session_call(request, function, *args):
+    """Run a session store call in the session executor.
+
+    With FOCUS_SHARED_SESSIONS the store takes cross-process locks that can
+    block for up to LOCK_TIMEOUT, which must not stall the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(request.app['session_executor'], function, *args)
+
+
+@web.middleware
+async def cors_middleware(request, handler):
+    """Answer CORS preflights and tag responses for the same origins as the Flask app"""
+    if request.method == 'OPTIONS':
+        response = web.Response()
+    else:
+        response = await handler(request)
+    origin = request.headers.get('Origin')
+    if origin in service.CORS_ORIGINS:
+        response.headers['Access-Control-Allow-Origin'] = origin
+        response.headers['Access-Control-Allow-Methods'] = 'GET, POST, OPTIONS'
+        response.headers['Access-Control-Allow-Headers'] = ', '.join(service.CORS_HEADERS)
+        response.headers['Vary'] = 'Origin'
+    return response
+
+
+async def start_session(request):
+    """Start a new focus tracking session"""
+    try:
+        data = await request.json()
+        meeting_id = data.get('meetingId')
+        user_id = data.get('userId')
+        user_name = data.get('userName')
+
+        if not all([meeting_id, user_id, user_name]):
+            return web.json_response({
+                'success': False,
+                'message': 'Missing required parameters: meetingId, userId, userName'
+            }, status=400)
+
+        session_id = await run_session_call(request, service.create_session, meeting_id, user_id, user_name)
+        return web.json_response({
+            'success': True,
+            'sessionId': session_id,
+            'message': 'Session started successfully'
+        })
+
+    except SessionLimitError as e:
+        logger.warning(f"Refused new session: {str(e)}")
+        return web.json_response({
+            'success': False,
+            'message': str(e)
+        }, status=503)
+    except Exception as e:
+        logger.error(f"Error starting session: {str(e)}\n{traceback.format_exc()}")
+        return web.json_response({
+            'success': False,
+            'message': f'Error: {str(e)}'
+        }, status=500)
+
+
+async def analyze_session_upload(request, session_id, frame_data):
+    """Validate the session, then analyse the frame unless a newer one replaces it"""
+    if not session_id or not frame_data:
+        return web.json_response({
+            'success': False,
+            'message': 'Missing required parameters: sessionId, frame'
+        }, status=400)
+
+    _, message, status = await run_session_call(request, service.lookup_session, session_id)
+    if message is not None:
+        return web.json_response({
+            'success': False,
+            'message': message
+        }, status=status)
+
+    try:
+        result = await request.app['scheduler'].submit(session_id, frame_data)
+    except Exception as e:
+        service.FRAME_ERRORS.labels('exception').inc()
+        logger.error(f"Error processing frame data: {str(e)}\n{traceback.format_exc()}")
+        return web.json_response({
+            'success': False,
+            'message': f'Error processing frame: {str(e)}'
+        }, status=500)
+
+    if result is None:
+        return web.json_response(dict(SUPERSEDED_RESULT, sessionId=session_id))
+    start = time.perf_counter()
+    response = web.json_response(result, status=400 if result.get('success') is False else 200)
+    service.STAGE_SECONDS.labels('serialize').observe(time.perf_counter() - start)
+    return response
+
+
+async def analyze_frame(request):
+    """Analyze a base64 frame for focus detection"""
+    try:
+        data = await request.json()
+    except Exception:
+        return web.json_response({
+            'success': False,
+            'message': 'Invalid JSON body'
+        }, status=400)
+    return await analyze_session_upload(request, data.get('sessionId'), data.get('frame'))
+
+
+async def analyze_frame_raw(request):
+    """Analyze a frame uploaded as raw image bytes or a multipart 'frame' file"""
+    session_id = request.headers.get('X-Session-Id') or request.query.get('sessionId')
+    if request.content_type.startswith('multipart/'):
+        form = await request.post()
+        upload = form.get('frame')
+        frame_bytes = upload.file.read() if upload is not None and hasattr(upload, 'file') else None
+    else:
+        frame_bytes = await request.read()
+    return await analyze_session_upload(request, session_id, frame_bytes)
+
+
+async def stop_session(request):
+    """Stop a focus tracking session"""
+    try:
+        data = await request.json()
+        session_id = data.get('sessionId')
+
+        if not session_id:
+            return web.json_response({
+                'success': False,
+                'message': 'Missing required parameter: sessionId'
+            }, status=400)
+
+        duration = await run_session_call(request, service.end_session, session_id)
+        if duration is None:
+            return web.json_response({
+                'success': False,
+                'message': 'Invalid session ID'
+            }, status=400)
+
+        return web.json_response({
+            'success': True,
+            'message': 'Session stopped successfully',
+            'sessionId': session_id,
+            'duration': round(duration)
+        })
+
+    except Exception as e:
+        logger.error(f"Error stopping session: {str(e)}\n{traceback.format_exc()}")
+        return web.json_response({
+            'success': False,
+            'message': f'Error: {str(e)}'
+        }, status=500)
+
+
+async def health_check(request):
+    """Health check endpoint"""
+    response = service.health_status()
+    response['latestFrame'] = request.app['scheduler'].stats()
+    return web.json_response(response)
+
+
+async def ready_check(request):
+    """Readiness endpoint: 503 until the models are loaded and warmed up"""
+    status = service.readiness()
+    return web.json_response(status, status=200 if status['ready'] else 503)
+
+
+async def metrics(request):
+    """Prometheus metrics endpoint"""
+    return web.Response(body=service.metrics_registry.render().encode('utf-8'),
+                        headers={'Content-Type': service.METRICS_CONTENT_TYPE})
+
+
+def create_app(analysis_threads=None):
+    """Build the aiohttp application around the shared session store"""
+    # Frames of different sessions are analysed concurrently on the shared
+    # FocusTracker; each concurrent frame borrows its own dlib detector from
+    # the tracker's DetectorPool, as the detector is not thread-safe
+    if analysis_threads is None:
+        analysis_threads = int(os.environ.get('FOCUS_ASYNC_THREADS', min(4, os.cpu_count() or 1)))
+    executor = ThreadPoolExecutor(max_workers=analysis_threads, thread_name_prefix='focus-async')
+    # Session lookups get their own threads so they never queue behind frames
+    session_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='focus-async-sessions')
+
+    application = web.Application(middlewares=[cors_middleware], client_max_size=8 * 1024 * 1024)
+    application['scheduler'] = LatestFrameScheduler(analyze_encoded, executor)
+    application['session_executor'] = session_executor
+    application.router.add_post('/start-session', start_session)
+    application.router.add_post('/analyze-frame', analyze_frame)
+    application.router.add_post('/analyze-frame/raw', analyze_frame_raw)
+    # Alias kept for compatibility with the frontend
+    application.router.add_post('/analyze-focus', analyze_frame)
+    application.router.add_post('/stop-session', stop_session)
+    application.router.add_get('/health', health_check)
+    application.router.add_get('/ready', ready_check)
+    application.router.add_get('/metrics', metrics)
+
+    async def shutdown_executor(_):
+        executor.shutdown(wait=False)
+        session_executor.shutdown(wait=False)
+    application.on_cleanup.append(shutdown_executor)
+    return application
+
+
+if __name__ == "__main__":
+    logger.info("Starting Focus Tracking Service (asyncio mode)...")
+
+    if not service.init_inference():
+        logger.error("Failed to initialize focus tracker before server start")
+        sys.exit(1)
+    service.start_warm_up()
+
+    port = int(os.environ.get('PORT', 5000))
+    host = os.environ.get('HOST', '127.0.0.1')
+    logger.info(f"Starting server on {host}:{port}")
+    web.run_app(create_app(), host=host, port=port, print=None)
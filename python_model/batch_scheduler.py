@@ -0,0 +1,188 @@
+import time
+import queue
+import logging
+import argparse
+import threading
+import traceback
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class BatchScheduler:
+    """Collects frames from many sessions and analyses them in micro-batches.
+
+    Request threads call analyze() and block on a future. A single analysis
+    thread waits up to max_wait_ms after the first queued frame, or until
+    max_batch_size frames are queued, then runs FocusTracker.process_batch so
+    each stage (grayscale, detection, landmarks, scoring) runs across the
+    whole batch. Only one thread drives the models, so request threads do not
+    contend for the GIL while analysing.
+
+    Run this module as a script to compare it with per-request analysis on
+    the target hardware before enabling it: on a single core both modes
+    reached the same throughput, and batching raised p50 latency by up to
+    max_wait_ms plus the time to run the rest of the batch.
+    """
+    def __init__(self, tracker, max_batch_size=16, max_wait_ms=5.0, timeout=10.0):
+        self.tracker = tracker
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.timeout = timeout
+
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._latencies = deque(maxlen=1000)
+        self._batches = 0
+        self._frames = 0
+        self._started = time.monotonic()
+
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name='focus-batch-scheduler', daemon=True)
+        self._thread.start()
+        logger.info(f"Batch scheduler started (max batch {max_batch_size}, max wait {max_wait_ms}ms)")
+
+    def submit(self, frame, state, scale=1.0, timings=None):
+        """Queue a frame for the next batch and return a future for its result.
+
+        If timings is a dict, the frame's stage timings are stored in it
+        before the future completes.
+        """
+        future = Future()
+        self._queue.put((frame, state, future, time.monotonic(), scale, timings))
+        return future
+
+    def analyze(self, frame, state, scale=1.0, timings=None):
+        """Queue a frame and wait for its result"""
+        return self.submit(frame, state, scale, timings).result(timeout=self.timeout)
+
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    def _next_batch(self):
+        item = self._queue.get()
+        if item is None:
+            return None
+        batch = [item]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self._running = False
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while self._running:
+            batch = self._next_batch()
+            if batch is None:
+                break
+
+            frames = [item[0] for item in batch]
+            states = [item[1] for item in batch]
+            scales = [item[4] for item in batch]
+            timings = [item[5] for item in batch]
+            try:
+                results = self.tracker.process_batch(frames, states, scales, timings)
+            except Exception as e:
+                logger.error(f"Error processing batch: {str(e)}\n{traceback.format_exc()}")
+                results = [self.tracker._error_result(e)] * len(batch)
+
+            done = time.monotonic()
+            with self._stats_lock:
+                self._batches += 1
+                self._frames += len(batch)
+                for item in batch:
+                    self._latencies.append(done - item[3])
+            for item, result in zip(batch, results):
+                item[2].set_result(result)
+
+    def stats(self):
+        """Throughput and end-to-end latency of recently scheduled frames"""
+        with self._stats_lock:
+            latencies = np.array(self._latencies) * 1000.0
+            batches = self._batches
+            frames = self._frames
+        elapsed = time.monotonic() - self._started
+        stats = {
+            'batches': batches,
+            'frames': frames,
+            'meanBatchSize': round(frames / batches, 2) if batches else 0,
+            'framesPerSecond': round(frames / elapsed, 2) if elapsed > 0 else 0,
+            'queueDepth': self.queue_depth()
+        }
+        if latencies.size:
+            stats['latencyMs'] = {
+                'p50': round(float(np.percentile(latencies, 50)), 2),
+                'p95': round(float(np.percentile(latencies, 95)), 2),
+                'p99': round(float(np.percentile(latencies, 99)), 2)
+            }
+        return stats
+
+    def shutdown(self):
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+
+def _benchmark(image_path, sessions, frames_per_session, max_batch_size, max_wait_ms):
+    """Compare per-request analysis threads against the batch scheduler"""
+    import cv2
+    from focus_tracker import FocusTracker, SessionState
+
+    frame = cv2.imread(image_path)
+    if frame is None:
+        raise SystemExit(f"Could not read {image_path}")
+    tracker = FocusTracker()
+
+    def drive(analyze):
+        latencies = []
+        lock = threading.Lock()
+
+        def student():
+            state = SessionState()
+            for _ in range(frames_per_session):
+                start = time.perf_counter()
+                analyze(frame, state)
+                with lock:
+                    latencies.append((time.perf_counter() - start) * 1000.0)
+
+        threads = [threading.Thread(target=student) for _ in range(sessions)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        return len(latencies) / elapsed, np.percentile(latencies, [50, 95, 99])
+
+    direct_fps, direct_pct = drive(tracker.process_frame)
+    scheduler = BatchScheduler(tracker, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+    batched_fps, batched_pct = drive(scheduler.analyze)
+    scheduler.shutdown()
+
+    print(f"{sessions} sessions x {frames_per_session} frames of {frame.shape[1]}x{frame.shape[0]}")
+    print(f"{'mode':<10}{'fps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, fps, pct in (('direct', direct_fps, direct_pct), ('batched', batched_fps, batched_pct)):
+        print(f"{name:<10}{fps:>10.1f}{pct[0]:>10.1f}{pct[1]:>10.1f}{pct[2]:>10.1f}")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.WARNING)
+    parser = argparse.ArgumentParser(description='Benchmark micro-batched frame analysis')
+    parser.add_argument('image', help='Image file used as the frame for every simulated session')
+    parser.add_argument('--sessions', type=int, default=16)
+    parser.add_argument('--frames', type=int, default=10, help='Frames per session')
+    parser.add_argument('--max-batch-size', type=int, default=16)
+    parser.add_argument('--max-wait-ms', type=float, default=5.0)
+    args = parser.parse_args()
+    _benchmark(args.image, args.sessions, args.frames, args.max_batch_size, args.max_wait_ms)
@@ -0,0 +1,360 @@
+import os
+import sys
+import json
+import time
+import queue
+import hashlib
+import logging
+import platform
+import argparse
+import resource
+import traceback
+import importlib.util
+import multiprocessing
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+PYTHON_MODEL_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(PYTHON_MODEL_DIR)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+DEFAULT_RESOLUTIONS = '640x480,1280x720,1920x1080'
+
+# Metrics compared against a baseline; True where a higher value is worse
+COMPARED_METRICS = {
+    'p50_ms': True,
+    'p95_ms': True,
+    'fps': False,
+    'peak_rss_mb': True
+}
+
+
+def _load_module(name, path):
+    """Import a script by path under a unique name (several are called app.py)"""
+    # Scripts outside python_model/ import it as a package from the repo root.
+    # Appended, so this directory's flat modules (and its app.py) still win
+    if REPO_ROOT not in sys.path:
+        sys.path.append(REPO_ROOT)
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _decode_color(buffer):
+    return cv2.imdecode(np.frombuffer(buffer, dtype=np.uint8), cv2.IMREAD_COLOR), 1.0
+
+
+def _load_tracker():
+    """FocusTracker (python_model/app.py service): dlib HOG + landmarks, per-stage timings"""
+    from focus_tracker import FocusTracker, SessionState
+    from image_utils import decode_gray
+    tracker = FocusTracker()
+    # Time the full pipeline on every frame rather than reused results
+    tracker.reuse_threshold = 0
+    state = SessionState()
+
+    def analyze(frame, scale, timings):
+        tracker.process_frame(frame, state, scale, timings)
+    return decode_gray, analyze
+
+
+def _load_mediapipe(mesh_only=True):
+    """FocusDetector in app/Models/focus_detector.py: face box from the mediapipe mesh"""
+    module = _load_module('mediapipe_focus_detector', os.path.join(REPO_ROOT, 'app', 'Models', 'focus_detector.py'))
+    detector = module.FocusDetector(mesh_only=mesh_only)
+    # One stream, so one session: its graphs and focus state come from the pool
+    return _decode_color, lambda frame, scale, timings: detector.analyze_frame(frame, 'benchmark')
+
+
+def _load_mediapipe_two_pass():
+    """The same FocusDetector running mediapipe face detection and the mesh on every frame"""
+    return _load_mediapipe(mesh_only=False)
+
+
+def _load_haar():
+    """FocusDetector in python_model/focus_detector.py: OpenCV Haar cascades"""
+    from focus_detector import FocusDetector
+    detector = FocusDetector()
+    return _decode_color, lambda frame, scale, timings: detector.analyze_frame(frame)
+
+
+def _load_daisy():
+    """FocusDetector in the root app.py: dlib landmarks + DAISY eye descriptors"""
+    module = _load_module('daisy_focus_app', os.path.join(REPO_ROOT, 'app.py'))
+    detector = module.FocusDetector()
+    return _decode_color, lambda frame, scale, timings: detector.analyze_frame(frame)
+
+
+def _load_focus_server():
+    """analyze_focus in the root focus_server.py: dlib landmarks with face tracking"""
+    module = _load_module('focus_server_app', os.path.join(REPO_ROOT, 'focus_server.py'))
+    from image_utils import decode_gray
+    track = module.FaceTrack()
+    return decode_gray, lambda frame, scale, timings: module.analyze_focus(frame, track)
+
+
+DETECTORS = {
+    'tracker': _load_tracker,
+    'mediapipe': _load_mediapipe,
+    'mediapipe_two_pass': _load_mediapipe_two_pass,
+    'haar': _load_haar,
+    'daisy': _load_daisy,
+    'focus_server': _load_focus_server
+}
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def _percentiles(seconds):
+    ms = np.asarray(seconds) * 1000.0
+    return {
+        'p50_ms': round(float(np.percentile(ms, 50)), 3),
+        'p95_ms': round(float(np.percentile(ms, 95)), 3),
+        'p99_ms': round(float(np.percentile(ms, 99)), 3),
+        'mean_ms': round(float(ms.mean()), 3)
+    }
+
+
+def _run_detector(name, corpus, warmup, repeats, threads, results):
+    """Benchmark one detector in its own process so its peak RSS is its own"""
+    try:
+        # Configure logging first so the scripts' own basicConfig calls
+        # (some of which log every frame to files) become no-ops
+        logging.basicConfig(level=logging.WARNING)
+        cv2.setNumThreads(threads)
+        # The root scripts look for the landmark model relative to the repo root
+        os.chdir(REPO_ROOT)
+        sys.path.insert(0, PYTHON_MODEL_DIR)
+
+        decode, analyze = DETECTORS[name]()
+        report = {'model_rss_mb': _peak_rss_mb(), 'resolutions': {}}
+
+        for resolution, frames in corpus.items():
+            for buffer in frames[:warmup]:
+                frame, scale = decode(buffer)
+                analyze(frame, scale, None)
+
+            totals = []
+            stages = {}
+            for _ in range(repeats):
+                for buffer in frames:
+                    start = time.perf_counter()
+                    frame, scale = decode(buffer)
+                    decoded = time.perf_counter()
+                    timings = {'decode': decoded - start}
+                    analyze(frame, scale, timings)
+                    end = time.perf_counter()
+                    if len(timings) == 1:
+                        # Detectors without internal stages are timed as a whole
+                        timings['analyze'] = end - decoded
+                    totals.append(end - start)
+                    for stage, seconds in timings.items():
+                        stages.setdefault(stage, []).append(seconds)
+
+            entry = _percentiles(totals)
+            entry['fps'] = round(len(totals) / sum(totals), 2)
+            entry['frames'] = len(totals)
+            entry['stages'] = {stage: _percentiles(values) for stage, values in stages.items()}
+            report['resolutions'][resolution] = entry
+
+        report['peak_rss_mb'] = _peak_rss_mb()
+        results.put((name, report))
+    except Exception as e:
+        results.put((name, {'error': f"{type(e).__name__}: {e}", 'traceback': traceback.format_exc()}))
+
+
+def load_corpus(path, max_frames):
+    """Read up to max_frames BGR frames from an image directory, image file or video"""
+    if os.path.isdir(path):
+        names = sorted(name for name in os.listdir(path) if name.lower().endswith(IMAGE_EXTENSIONS))
+        frames = [cv2.imread(os.path.join(path, name)) for name in names[:max_frames]]
+    elif path.lower().endswith(IMAGE_EXTENSIONS):
+        frames = [cv2.imread(path)]
+    else:
+        capture = cv2.VideoCapture(path)
+        frames = []
+        while len(frames) < max_frames:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            frames.append(frame)
+        capture.release()
+    frames = [frame for frame in frames if frame is not None]
+    if not frames:
+        raise SystemExit(f"No frames could be read from {path}")
+    return frames
+
+
+def fit_to(frame, width, height):
+    """Scale a frame to cover width x height and centre-crop it, keeping the aspect ratio"""
+    scale = max(width / frame.shape[1], height / frame.shape[0])
+    resized = cv2.resize(frame, (max(width, round(frame.shape[1] * scale)), max(height, round(frame.shape[0] * scale))),
+                         interpolation=cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR)
+    top = (resized.shape[0] - height) // 2
+    left = (resized.shape[1] - width) // 2
+    return resized[top:top + height, left:left + width]
+
+
+def build_corpus(frames, resolutions, quality):
+    """JPEG-encode every corpus frame at every resolution, like uploaded webcam frames"""
+    corpus = {}
+    digest = hashlib.sha256()
+    for resolution in resolutions:
+        width, height = (int(value) for value in resolution.split('x'))
+        encoded = []
+        for frame in frames:
+            ok, buffer = cv2.imencode('.jpg', fit_to(frame, width, height), [cv2.IMWRITE_JPEG_QUALITY, quality])
+            encoded.append(buffer.tobytes())
+            digest.update(encoded[-1])
+        corpus[resolution] = encoded
+    return corpus, digest.hexdigest()
+
+
+def compare(report, baseline, tolerance):
+    """List metrics that got worse than the baseline by more than tolerance (a fraction)"""
+    regressions = []
+    for name, current in report['detectors'].items():
+        previous = baseline.get('detectors', {}).get(name)
+        if previous is None or 'error' in current or 'error' in previous:
+            continue
+        pairs = [('peak_rss_mb', current.get('peak_rss_mb'), previous.get('peak_rss_mb'))]
+        for resolution, entry in current['resolutions'].items():
+            old = previous.get('resolutions', {}).get(resolution)
+            if old is None:
+                continue
+            for metric in ('p50_ms', 'p95_ms', 'fps'):
+                pairs.append((f"{resolution} {metric}", entry[metric], old[metric]))
+        for label, value, old in pairs:
+            if not value or not old:
+                continue
+            higher_is_worse = COMPARED_METRICS[label.split()[-1]]
+            change = (value - old) / old
+            if (change if higher_is_worse else -change) > tolerance:
+                regressions.append(f"{name} {label}: {old} -> {value} ({change:+.1%})")
+    return regressions
+
+
+def print_report(report):
+    print(f"{'detector':<20}{'resolution':<12}{'fps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'peak MB':>10}  stages (p50 ms)")
+    for name, result in report['detectors'].items():
+        if 'error' in result:
+            print(f"{name:<20}error: {result['error']}")
+            continue
+        for resolution, entry in result['resolutions'].items():
+            stages = ', '.join(f"{stage} {values['p50_ms']:.2f}" for stage, values in entry['stages'].items())
+            print(f"{name:<20}{resolution:<12}{entry['fps']:>9.1f}{entry['p50_ms']:>10.2f}{entry['p95_ms']:>10.2f}"
+                  f"{entry['p99_ms']:>10.2f}{result['peak_rss_mb']:>10.1f}  {stages}")
+
+
+def _wait_for_result(process, results, timeout):
+    """The detector process's result, or an error if it dies or runs past timeout seconds"""
+    deadline = time.monotonic() + timeout if timeout else None
+    while True:
+        try:
+            _, result = results.get(timeout=1.0)
+            return result
+        except queue.Empty:
+            pass
+        if not process.is_alive():
+            # A result put just before exiting may still be in the pipe
+            try:
+                _, result = results.get(timeout=1.0)
+                return result
+            except queue.Empty:
+                return {'error': f"Benchmark process exited with code {process.exitcode} without a result"}
+        if deadline is not None and time.monotonic() > deadline:
+            process.terminate()
+            return {'error': f"Benchmark process did not finish within {timeout:.0f}s"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark every focus detector on a fixed frame corpus')
+    parser.add_argument('corpus', help='Directory of images, an image, or a video to take frames from')
+    parser.add_argument('--frames', type=int, default=30, help='Corpus frames to use')
+    parser.add_argument('--resolutions', default=DEFAULT_RESOLUTIONS, help='Comma-separated WIDTHxHEIGHT list')
+    parser.add_argument('--detectors', default=','.join(DETECTORS), help=f"Comma-separated subset of {', '.join(DETECTORS)}")
+    parser.add_argument('--repeats', type=int, default=3, help='Timed passes over the corpus per resolution')
+    parser.add_argument('--warmup', type=int, default=5, help='Untimed frames per resolution')
+    parser.add_argument('--threads', type=int, default=1, help='OpenCV threads (1 keeps runs comparable)')
+    parser.add_argument('--quality', type=int, default=90, help='JPEG quality of the encoded corpus')
+    parser.add_argument('--output', help='Write the report JSON here (use it later as a baseline)')
+    parser.add_argument('--compare', help='Baseline report JSON to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.15, help='Allowed relative slowdown before flagging')
+    parser.add_argument('--timeout', type=float, default=1800, help='Seconds before a detector run is abandoned (0: no limit)')
+    args = parser.parse_args()
+
+    detectors = [name.strip() for name in args.detectors.split(',') if name.strip()]
+    unknown = [name for name in detectors if name not in DETECTORS]
+    if unknown:
+        parser.error(f"Unknown detectors: {', '.join(unknown)}")
+    resolutions = [value.strip() for value in args.resolutions.split(',') if value.strip()]
+
+    frames = load_corpus(args.corpus, args.frames)
+    corpus, corpus_hash = build_corpus(frames, resolutions, args.quality)
+
+    report = {
+        'created': datetime.now().isoformat(),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'processor': platform.processor() or platform.machine(),
+            'cpus': os.cpu_count(),
+            'opencv': cv2.__version__,
+            'numpy': np.__version__,
+            'settings': {key: value for key, value in os.environ.items() if key.startswith('FOCUS_')}
+        },
+        'corpus': {
+            'source': os.path.basename(os.path.normpath(args.corpus)),
+            'frames': len(frames),
+            'sha256': corpus_hash,
+            'resolutions': resolutions,
+            'quality': args.quality
+        },
+        'repeats': args.repeats,
+        'warmup': args.warmup,
+        'threads': args.threads,
+        'detectors': {}
+    }
+
+    # One fresh process per detector keeps model memory and caches separate
+    context = multiprocessing.get_context('spawn')
+    for name in detectors:
+        results = context.Queue()
+        process = context.Process(target=_run_detector, args=(name, corpus, args.warmup, args.repeats, args.threads, results))
+        process.start()
+        try:
+            result = _wait_for_result(process, results, args.timeout)
+        except Exception as e:
+            result = {'error': str(e)}
+        process.join()
+        report['detectors'][name] = result
+
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+        print(f"Report written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as source:
+            baseline = json.load(source)
+        if baseline.get('corpus', {}).get('sha256') != corpus_hash:
+            print("Warning: the baseline was recorded on a different corpus; results are not comparable")
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regressions beyond {args.tolerance:.0%}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.compare}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,3 @@
+# test.py, test_camera.py and test_focus.py are manual scripts (a Flask app,
+# camera loops), not pytest tests
+collect_ignore = ['test.py', 'test_camera.py', 'test_focus.py']
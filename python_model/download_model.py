@@ -1,54 +1,194 @@
 import os
-import urllib.request
+import bz2
 import sys
+import json
 import hashlib
-import bz2
+import argparse
+import urllib.error
+import urllib.request
+
+MODEL_URL = 'http://dlib.net/files/shape_predictor_68_face_landmarks.dat.bz2'
+MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'shape_predictor_68_face_landmarks.dat')
+# SHA-256 of the decompressed shape_predictor_68_face_landmarks.dat
+MODEL_SHA256 = 'fbdc2cb80eb9aa7a758672cbfdda32ba6300efe9b6e6c7a299ff7e736b11b92f'
+
+CHUNK_SIZE = 1024 * 1024
+HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+}
+
+
+def marker_path(file_path):
+    """File recording that file_path passed verification"""
+    return file_path + '.verified'
+
+
+def write_marker(file_path, sha256):
+    """Record the verified hash with the file's size and mtime, so a changed file is re-verified"""
+    stat = os.stat(file_path)
+    with open(marker_path(file_path), 'w') as marker:
+        json.dump({'sha256': sha256, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}, marker)
+
+
+def is_verified(file_path, expected_hash=MODEL_SHA256):
+    """True if a marker shows this exact file (same size and mtime) already matched expected_hash"""
+    try:
+        with open(marker_path(file_path)) as marker:
+            recorded = json.load(marker)
+        stat = os.stat(file_path)
+    except (OSError, ValueError):
+        return False
+    return (recorded.get('sha256') == expected_hash
+            and recorded.get('size') == stat.st_size
+            and recorded.get('mtime_ns') == stat.st_mtime_ns)
+
 
 def verify_sha256(file_path, expected_hash):
     sha256_hash = hashlib.sha256()
     with open(file_path, "rb") as f:
-        # Read and update hash in chunks of 4K
-        for byte_block in iter(lambda: f.read(4096), b""):
+        # Read and update hash in 1 MiB chunks
+        for byte_block in iter(lambda: f.read(CHUNK_SIZE), b""):
             sha256_hash.update(byte_block)
     return sha256_hash.hexdigest() == expected_hash
 
-def download_shape_predictor():
+
+def verify_model_file(file_path=MODEL_PATH, expected_hash=MODEL_SHA256):
+    """Check a model file's SHA-256, skipping the hash if a marker already vouches for it"""
+    if is_verified(file_path, expected_hash):
+        return True
+    if not os.path.exists(file_path) or not verify_sha256(file_path, expected_hash):
+        return False
+    write_marker(file_path, expected_hash)
+    return True
+
+
+class _StreamingDecompressor:
+    """Decompresses bz2 chunks into an output file while hashing the output"""
+    def __init__(self, out_file):
+        self.out_file = out_file
+        self.decompressor = bz2.BZ2Decompressor()
+        self.sha256 = hashlib.sha256()
+        self.written = 0
+
+    def feed(self, chunk):
+        while chunk:
+            if self.decompressor.eof:
+                # Multi-stream bz2 (e.g. pbzip2 output): continue with a new stream
+                self.decompressor = bz2.BZ2Decompressor()
+            data = self.decompressor.decompress(chunk)
+            self.out_file.write(data)
+            self.sha256.update(data)
+            self.written += len(data)
+            chunk = self.decompressor.unused_data if self.decompressor.eof else b''
+
+    @property
+    def complete(self):
+        """True once the last stream fed in was decompressed to its end"""
+        return self.decompressor.eof
+
+
+def _open_download(url, offset, timeout):
+    """Request url from byte offset; returns the response and whether it resumes at offset"""
+    headers = dict(HEADERS)
+    if offset > 0:
+        headers['Range'] = f'bytes={offset}-'
+    try:
+        response = urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=timeout)
+    except urllib.error.HTTPError as e:
+        if e.code == 416 and offset > 0:
+            # Range not satisfiable: the partial file is stale or already complete; start over
+            return _open_download(url, 0, timeout)
+        raise
+    return response, offset > 0 and response.status == 206
+
+
+def download_shape_predictor(url=MODEL_URL, model_path=MODEL_PATH, expected_hash=MODEL_SHA256,
+                             chunk_size=CHUNK_SIZE, timeout=60):
+    """Stream the compressed model to disk, decompressing and hashing as it arrives.
+
+    The compressed bytes received so far are kept in <model>.bz2.part, so
+    an interrupted download resumes with an HTTP Range request: the part
+    file is replayed through the decompressor (no network) and the rest is
+    fetched. The decompressed model is written to <model>.tmp and only
+    renamed into place once its SHA-256 matches expected_hash (skipped if
+    expected_hash is empty), after which a verified marker is written.
+    """
+    part_path = model_path + '.bz2.part'
+    tmp_path = model_path + '.tmp'
     try:
-        model_path = 'shape_predictor_68_face_landmarks.dat'
-        
-        # Download from official dlib model repository
-        url = 'http://dlib.net/files/shape_predictor_68_face_landmarks.dat.bz2'
-        print(f"Downloading model from dlib.net...")
-        
-        # Configure the request with headers
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-        }
-        
-        # Create a request with headers
-        req = urllib.request.Request(url, headers=headers)
-        
-        # Download and decompress the file
-        print("Downloading compressed model file...")
-        with urllib.request.urlopen(req) as response:
-            compressed_data = response.read()
-            
-        print("Decompressing model file...")
-        decompressed_data = bz2.decompress(compressed_data)
-        
-        print("Saving model file...")
-        with open(model_path, 'wb') as out_file:
-            out_file.write(decompressed_data)
-        
-        print(f"Model file downloaded and decompressed to {model_path}")
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        print(f"Downloading model from {url}" + (f" (resuming at {offset} bytes)" if offset else "") + "...")
+        response, resumed = _open_download(url, offset, timeout)
+        if not resumed:
+            offset = 0
+
+        with response, open(part_path, 'ab' if resumed else 'wb') as part, open(tmp_path, 'wb') as out_file:
+            stream = _StreamingDecompressor(out_file)
+            if resumed:
+                # Rebuild the decompressed output from the bytes already on disk
+                with open(part_path, 'rb') as done:
+                    for chunk in iter(lambda: done.read(chunk_size), b''):
+                        stream.feed(chunk)
+
+            total = response.headers.get('Content-Length')
+            total = int(total) + offset if total else None
+            received = offset
+            while True:
+                chunk = response.read(chunk_size)
+                if not chunk:
+                    break
+                part.write(chunk)
+                stream.feed(chunk)
+                received += len(chunk)
+                if total:
+                    print(f"\r{received / 1e6:.1f} / {total / 1e6:.1f} MB", end='', flush=True)
+            print()
+
+        # A cut between two bz2 streams still decompresses cleanly, so the length is checked too
+        if not stream.complete or (total and received < total):
+            raise IOError(f"Download ended early after {received} bytes; rerun to resume")
+
+        digest = stream.sha256.hexdigest()
+        if expected_hash and digest != expected_hash:
+            # The part file is what produced the bad output, so do not resume from it
+            os.remove(part_path)
+            os.remove(tmp_path)
+            raise IOError(f"Checksum mismatch: expected {expected_hash}, got {digest}")
+
+        os.replace(tmp_path, model_path)
+        os.remove(part_path)
+        if expected_hash:
+            write_marker(model_path, expected_hash)
+        print(f"Model file downloaded{', verified' if expected_hash else ''} and saved to {model_path} ({stream.written} bytes)")
         return True
-        
+
     except Exception as e:
         print(f"Error downloading model: {str(e)}", file=sys.stderr)
-        if os.path.exists(model_path):
-            os.remove(model_path)
+        # Keep the .bz2.part file for resuming; the .tmp output is rebuilt from it
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
         return False
 
+
+def ensure_model(url=MODEL_URL, model_path=MODEL_PATH, expected_hash=MODEL_SHA256, force=False):
+    """Download the model unless a verified copy is already in place"""
+    if not force and os.path.exists(model_path):
+        if not expected_hash:
+            print(f"Model file at {model_path} exists (checksum not checked)")
+            return True
+        if verify_model_file(model_path, expected_hash):
+            print(f"Model file at {model_path} is verified")
+            return True
+        print(f"Model file at {model_path} does not match the expected checksum; downloading again")
+    return download_shape_predictor(url, model_path, expected_hash)
+
+
 if __name__ == '__main__':
-    success = download_shape_predictor()
-    sys.exit(0 if success else 1) 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Download and verify the dlib 68-point landmark model')
+    parser.add_argument('--url', default=MODEL_URL, help='URL of the .bz2 compressed model')
+    parser.add_argument('--output', default=MODEL_PATH, help='Where to write the decompressed model')
+    parser.add_argument('--sha256', default=MODEL_SHA256, help="Expected SHA-256 of the decompressed model ('' skips the check)")
+    parser.add_argument('--force', action='store_true', help='Download even if a verified model exists')
+    args = parser.parse_args()
+    success = ensure_model(args.url, args.output, args.sha256, args.force)
+    sys.exit(0 if success else 1)
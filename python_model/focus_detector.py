@@ -5,6 +5,7 @@ from datetime import datetime
 import logging
 from collections import deque
 import os
+from image_utils import DETECTION_WIDTH, resize_to_width, scale_boxes
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -53,13 +54,17 @@ class FocusDetector:
                 }
             }
             
-            # Detect faces
+            # Detect faces on a copy downscaled to the detection width,
+            # then map the boxes back to full resolution for the eye search
+            small, scale = resize_to_width(gray, DETECTION_WIDTH)
+            min_size = max(1, int(30 * scale))
             faces = self.face_cascade.detectMultiScale(
-                gray,
+                small,
                 scaleFactor=1.1,
                 minNeighbors=5,
-                minSize=(30, 30)
+                minSize=(min_size, min_size)
             )
+            faces = scale_boxes(faces, scale)
             
             if len(faces) > 0:
                 metrics['face_detected'] = True
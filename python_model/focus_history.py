@@ -0,0 +1,197 @@
+import os
+import time
+
+import numpy as np
+
+# Seconds of focus scores kept for the recent averages, and the most entries
+# kept (five minutes at 60 fps); past that the oldest entry makes room
+HISTORY_WINDOW = 300
+HISTORY_CAPACITY = int(os.environ.get('FOCUS_HISTORY_CAPACITY', 18000))
+
+
+class FocusHistory:
+    """Focus scores of the last window seconds in a ring buffer, plus session totals.
+
+    Entries carry monotonic timestamps and arrive in time order, so expired
+    ones are always at the head. Running sums of the scores and of focused
+    entries are updated as entries enter and leave, which makes appending,
+    expiring and the statistics O(1) per frame instead of a scan.
+
+    Totals over every score appended are kept alongside, so whole-session
+    statistics need no history and memory stays flat however long the
+    session runs.
+    """
+    def __init__(self, window=HISTORY_WINDOW, capacity=HISTORY_CAPACITY):
+        self.window = window
+        self.capacity = max(1, capacity)
+        self.times = np.zeros(self.capacity, dtype=np.float64)
+        self.scores = np.zeros(self.capacity, dtype=np.float64)
+        self.focused = np.zeros(self.capacity, dtype=np.bool_)
+        self.head = 0
+        self.count = 0
+        self.score_sum = 0.0
+        self.focused_count = 0
+        self.total_count = 0
+        self.total_score_sum = 0.0
+        self.total_focused_count = 0
+
+    def _pop(self):
+        self.score_sum -= self.scores[self.head]
+        self.focused_count -= int(self.focused[self.head])
+        self.head = (self.head + 1) % self.capacity
+        self.count -= 1
+        if self.count == 0:
+            # Clear rounding error left by the subtractions
+            self.score_sum = 0.0
+
+    def expire(self, now=None):
+        """Drop entries older than the window"""
+        cutoff = (time.monotonic() if now is None else now) - self.window
+        while self.count and self.times[self.head] <= cutoff:
+            self._pop()
+
+    def append(self, score, is_focused, now=None):
+        now = time.monotonic() if now is None else now
+        self.expire(now)
+        if self.count == self.capacity:
+            self._pop()
+        is_focused = bool(is_focused)
+        tail = (self.head + self.count) % self.capacity
+        self.times[tail] = now
+        self.scores[tail] = score
+        self.focused[tail] = is_focused
+        self.score_sum += score
+        self.focused_count += int(is_focused)
+        self.count += 1
+        self.total_count += 1
+        self.total_score_sum += score
+        self.total_focused_count += int(is_focused)
+
+    def average(self):
+        """Average score over the window"""
+        self.expire()
+        return float(self.score_sum / self.count) if self.count else 0
+
+    def focus_percentage(self):
+        """Percentage of focused entries over the window"""
+        self.expire()
+        return self.focused_count / self.count * 100 if self.count else 0
+
+    def session_average(self):
+        """Average score over every entry appended"""
+        return self.total_score_sum / self.total_count if self.total_count else 0
+
+    def session_focus_percentage(self):
+        """Percentage of focused entries over every entry appended"""
+        return self.total_focused_count / self.total_count * 100 if self.total_count else 0
+
+    def __len__(self):
+        return self.count
+
+
+# Retention of each tier of TieredFocusHistory: raw samples for a minute,
+# per-second aggregates for 15 minutes and per-minute aggregates for a day
+RAW_SECONDS = 60
+RAW_CAPACITY = int(os.environ.get('FOCUS_RAW_CAPACITY', 3600))
+SECOND_BUCKETS = 900
+MINUTE_BUCKETS = 1440
+
+
+class RollupTier:
+    """Fixed-width time buckets of (count, score sum, focused count) in a ring.
+
+    Bucket n covers [n * width, (n + 1) * width) and lives in slot
+    n % buckets, so a new bucket overwrites the one a full retention older.
+    """
+    def __init__(self, width, buckets):
+        self.width = width
+        self.buckets = buckets
+        self.numbers = np.full(buckets, -1, dtype=np.int64)
+        self.counts = np.zeros(buckets, dtype=np.int64)
+        self.sums = np.zeros(buckets, dtype=np.float64)
+        self.focused = np.zeros(buckets, dtype=np.int64)
+
+    @property
+    def retention(self):
+        return self.width * self.buckets
+
+    def add(self, now, score, is_focused):
+        number = int(now // self.width)
+        slot = number % self.buckets
+        if self.numbers[slot] != number:
+            self.numbers[slot] = number
+            self.counts[slot] = 0
+            self.sums[slot] = 0.0
+            self.focused[slot] = 0
+        self.counts[slot] += 1
+        self.sums[slot] += score
+        self.focused[slot] += int(is_focused)
+
+    def window(self, seconds, now):
+        """(count, sum, focused count) of the buckets overlapping the last seconds"""
+        last = int(now // self.width)
+        first = int((now - seconds) // self.width)
+        covered = (self.numbers >= max(first, last - self.buckets + 1)) & (self.numbers <= last)
+        return int(self.counts[covered].sum()), float(self.sums[covered].sum()), int(self.focused[covered].sum())
+
+
+class TieredFocusHistory:
+    """Focus samples of a whole session in three tiers of bounded size.
+
+    Raw samples of the last raw_seconds sit in a FocusHistory ring; every
+    sample is also added to per-second and per-minute roll-ups (count, sum,
+    focused count), each a ring that drops its oldest buckets. A window is
+    served from the finest tier that still covers it, and session totals
+    come from the ring's running totals, so memory and the cost of the
+    statistics stay flat however long the session runs.
+    """
+    def __init__(self, raw_seconds=RAW_SECONDS, raw_capacity=RAW_CAPACITY,
+                 second_buckets=SECOND_BUCKETS, minute_buckets=MINUTE_BUCKETS):
+        self.raw = FocusHistory(raw_seconds, raw_capacity)
+        self.seconds = RollupTier(1, second_buckets)
+        self.minutes = RollupTier(60, minute_buckets)
+
+    def append(self, score, is_focused, now=None):
+        now = time.monotonic() if now is None else now
+        is_focused = bool(is_focused)
+        self.raw.append(score, is_focused, now)
+        self.seconds.add(now, score, is_focused)
+        self.minutes.add(now, score, is_focused)
+
+    def window(self, seconds, now=None):
+        """(count, sum, focused count) of the last seconds.
+
+        Windows up to raw_seconds are exact. Longer ones are served from
+        whole buckets, so they may include up to one bucket more than asked.
+        """
+        now = time.monotonic() if now is None else now
+        raw = self.raw
+        if seconds <= raw.window:
+            raw.expire(now)
+            if seconds == raw.window:
+                return raw.count, float(raw.score_sum), raw.focused_count
+            indexes = (raw.head + np.arange(raw.count)) % raw.capacity
+            recent = indexes[raw.times[indexes] > now - seconds]
+            return len(recent), float(raw.scores[recent].sum()), int(raw.focused[recent].sum())
+        if seconds <= self.seconds.retention:
+            return self.seconds.window(seconds, now)
+        return self.minutes.window(seconds, now)
+
+    def window_stats(self, seconds, now=None):
+        """Average score and focus percentage of the last seconds"""
+        count, score_sum, focused = self.window(seconds, now)
+        return {
+            'samples': count,
+            'average_score': score_sum / count if count else 0.0,
+            'focus_percentage': focused / count * 100 if count else 0.0
+        }
+
+    @property
+    def total_count(self):
+        return self.raw.total_count
+
+    def session_average(self):
+        return self.raw.session_average()
+
+    def session_focus_percentage(self):
+        return self.raw.session_focus_percentage()
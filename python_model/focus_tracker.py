@@ -0,0 +1,832 @@
+import os
+import time
+import cv2
+import dlib
+import numpy as np
+import logging
+from datetime import datetime
+from collections import deque
+from scipy.spatial import distance
+import random
+import threading
+import traceback
+from image_utils import DETECTION_WIDTH, DetectorPool, resize_to_width, scale_rect, scale_boxes, synthetic_frame
+from landmark_features import shape_to_array, extract_features, face_stability
+from log_utils import ThrottledLogger
+
+logger = logging.getLogger(__name__)
+# Messages that would otherwise be logged for every frame
+_frame_log = ThrottledLogger(logger)
+_fallback_log = ThrottledLogger(logger)
+_invalid_frame_log = ThrottledLogger(logger)
+
+# Size of the thumbnails compared by the change-detection gate
+CHANGE_THUMBNAIL_SIZE = (32, 24)
+
+def _lap(timings, stage, start):
+    """Record the seconds since start under timings[stage] and return the current time"""
+    now = time.perf_counter()
+    if timings is not None:
+        timings[stage] = now - start
+    return now
+
+class SessionState:
+    """Per-session smoothing and history for a single student's stream"""
+    def __init__(self):
+        # Held while a frame is analysed: two frames of one session may
+        # arrive on different request threads, and the correlation tracker
+        # and histories below must see them one at a time
+        self.lock = threading.Lock()
+
+        # Initialize tracking variables
+        self.prev_face_pos = None
+        self.focus_history = deque(maxlen=5)  # Increased from 3 to 5 for better averaging
+        self.gaze_history = deque(maxlen=3)   # Increased from 2 to 3
+        self.head_pose_history = deque(maxlen=3)  # Increased from 2 to 3
+        self.attention_history = deque(maxlen=3)   # Increased from 2 to 3
+        self.blink_counter = 0
+        self.last_blink_time = datetime.now()
+        self.head_movement_history = deque(maxlen=5)  # Increased from 3 to 5
+        self.prev_eyes_state = None
+
+        # Face tracking between full detections
+        self.face_tracker = None
+        self.frames_since_detect = 0
+        self.full_detections = 0
+        self.tracked_frames = 0
+        # Landmark buffer refilled by every analysed frame
+        self.landmarks = np.empty((68, 2), dtype=np.float64)
+
+        # Change detection: thumbnail and result of the last analysed frame
+        self.last_thumbnail = None
+        self.last_result = None
+        self.reused_in_a_row = 0
+        self.reused_frames = 0
+
+        # Component scores for detailed feedback
+        self.last_eye_score = 1.0
+        self.last_stability_score = 1.0
+        self.last_drowsy_score = 1.0
+        self.last_gaze_score = 1.0
+        self.last_head_pose_score = 1.0
+        self.last_attention_score = 1.0  # Track eye region attention
+
+        # Session tracking
+        self.session_start_time = datetime.now()
+        self.total_frames_processed = 0
+        self.frames_with_face = 0
+
+class FocusTracker:
+    """Shared detection models.
+
+    A single FocusTracker can serve every session concurrently: all mutable
+    per-student data lives in the SessionState passed to process_frame. The
+    shape predictor and Haar cascades are safe to share between threads; the
+    dlib face detector is not, so concurrent calls each borrow one from a
+    DetectorPool.
+    """
+    def __init__(self):
+        try:
+            # Initialize dlib's face detector and facial landmarks predictor.
+            # Request threads share this tracker and a dlib detector is not
+            # thread-safe, so each concurrent call borrows its own from a pool.
+            self.detector = DetectorPool()
+            model_path = os.path.join(os.path.dirname(__file__), 'shape_predictor_68_face_landmarks.dat')
+            
+            if not os.path.exists(model_path):
+                # Try to find the model in the parent directory
+                parent_model_path = os.path.join(os.path.dirname(__file__), '..', 'shape_predictor_68_face_landmarks.dat')
+                if os.path.exists(parent_model_path):
+                    model_path = parent_model_path
+                else:
+                    raise FileNotFoundError(f"Facial landmarks model not found at {model_path} or {parent_model_path}")
+            
+            self.predictor = dlib.shape_predictor(model_path)
+            logger.info(f"Successfully loaded dlib models from {model_path}")
+            
+            # Initialize OpenCV cascade classifiers as fallback
+            self.face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+            self.eye_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_eye.xml')
+            logger.info("Loaded OpenCV cascade classifiers as fallback detection method")
+            
+            self.use_dlib = True  # Flag to toggle between dlib and OpenCV
+            
+            # Detect-once-then-track: run the full HOG detector only every
+            # redetect_interval frames, or when the correlation tracker's
+            # peak-to-sidelobe ratio drops below track_min_confidence.
+            # An interval of 0 disables tracking.
+            self.redetect_interval = int(os.environ.get('FOCUS_REDETECT_INTERVAL', 10))
+            self.track_min_confidence = float(os.environ.get('FOCUS_TRACK_MIN_CONFIDENCE', 7.0))
+            
+            # Faces are detected on a copy downscaled to this width; landmarks
+            # and eye regions still use the full-resolution frame
+            self.detection_width = DETECTION_WIDTH
+            
+            # Change-detection gate: when the mean absolute difference between
+            # 32x24 thumbnails of a frame and the last analysed frame is below
+            # reuse_threshold grey levels, the previous result is returned
+            # instead of running the pipeline. At most max_reused_frames
+            # results are reused in a row so slow changes (e.g. drowsiness)
+            # are still picked up. A threshold of 0 disables the gate.
+            self.reuse_threshold = float(os.environ.get('FOCUS_REUSE_THRESHOLD', 1.5))
+            self.max_reused_frames = int(os.environ.get('FOCUS_MAX_REUSED_FRAMES', 5))
+            
+            # State used when process_frame is called without a session,
+            # e.g. by single-camera scripts
+            self.default_state = SessionState()
+            
+            logger.info("FocusTracker initialized successfully")
+            
+        except Exception as e:
+            error_msg = f"Error initializing FocusTracker: {str(e)}\n{traceback.format_exc()}"
+            logger.error(error_msg)
+            raise Exception(error_msg)
+
+    def get_eye_aspect_ratio(self, eye_points):
+        """Calculate the eye aspect ratio to detect blinks"""
+        try:
+            # Convert points to numpy array if not already
+            points = np.array(eye_points)
+            
+            # Compute the euclidean distances between the vertical eye landmarks
+            A = np.linalg.norm(points[1] - points[5])
+            B = np.linalg.norm(points[2] - points[4])
+            
+            # Compute the euclidean distance between the horizontal eye landmarks
+            C = np.linalg.norm(points[0] - points[3])
+            
+            # Calculate the eye aspect ratio
+            ear = (A + B) / (2.0 * C) if C > 0 else 0
+            return ear
+        except Exception as e:
+            logger.error(f"Error calculating eye aspect ratio: {str(e)}")
+            return 0
+
+    def calculate_eye_attention(self, eye_region, gray_frame):
+        """Calculate attention score based on eye region analysis"""
+        try:
+            if eye_region.size == 0:
+                return 0.0
+                
+            # Apply binary threshold to isolate pupil and iris
+            _, threshold = cv2.threshold(eye_region, 45, 255, cv2.THRESH_BINARY_INV)
+            
+            # Calculate non-zero pixels ratio (pupil and iris)
+            attention_score = cv2.countNonZero(threshold) / eye_region.size
+            
+            # Normalize the attention score
+            return min(1.0, attention_score / 0.3)  # 0.3 is an expected ratio
+        except Exception as e:
+            logger.error(f"Error calculating eye attention: {str(e)}")
+            return 0.0
+
+    def warm_up(self, resolutions=((640, 480), (1280, 720))):
+        """Run every model once per resolution on synthetic frames.
+
+        The first detector, cascade and predictor calls allocate internal
+        buffers; doing that here keeps the cost out of the first request.
+        Uses throwaway session state. Returns the seconds taken per resolution.
+        """
+        durations = {}
+        for width, height in resolutions:
+            start = time.perf_counter()
+            gray = synthetic_frame(width, height, channels=1)
+            # Detector and cascade fallback: the synthetic face is not detected
+            self.process_frame(gray, SessionState())
+            # Landmark predictor and the landmark scoring path on a centred box
+            face = dlib.rectangle(width // 3, height // 4, 2 * width // 3, 3 * height // 4)
+            self._score_frame(gray, self.predict_landmarks(gray, face), SessionState())
+            durations[f"{width}x{height}"] = round(time.perf_counter() - start, 3)
+        return durations
+
+    def process_frame(self, frame, state=None, scale=1.0, timings=None):
+        """Analyse one frame and update the session's smoothing state.
+
+        frame may be BGR or already grayscale. scale is the frame's size
+        relative to the originally captured image (e.g. 0.5 for a JPEG
+        decoded at half size), so pixel thresholds stay comparable.
+        If a timings dict is given, the seconds spent in each stage
+        (grayscale, change_detect, detect, landmarks, and score or
+        fallback for the Haar cascade path) are stored in it.
+        """
+        if state is None:
+            state = self.default_state
+        with state.lock:
+            return self._process_frame(frame, state, scale, timings)
+
+    def _process_frame(self, frame, state, scale, timings):
+        stage_start = time.perf_counter()
+        try:
+            state.total_frames_processed += 1
+            
+            # Validate frame
+            if frame is None or not isinstance(frame, np.ndarray):
+                _invalid_frame_log.warning("Invalid frame data received")
+                return self._invalid_frame_result()
+            
+            # Convert to grayscale
+            gray = self.to_gray(frame)
+            stage_start = _lap(timings, 'grayscale', stage_start)
+            
+            # Skip the pipeline if the frame barely changed
+            thumbnail, reused = self.check_unchanged(gray, state)
+            stage_start = _lap(timings, 'change_detect', stage_start)
+            if reused is not None:
+                return reused
+            
+            # First try with dlib
+            landmarks_points = None
+            if self.use_dlib:
+                face = self.locate_face(gray, state)
+                stage_start = _lap(timings, 'detect', stage_start)
+                if face is not None:
+                    # Get facial landmarks
+                    landmarks_points = self.predict_landmarks(gray, face, state.landmarks)
+                    stage_start = _lap(timings, 'landmarks', stage_start)
+            
+            result = self._score_frame(gray, landmarks_points, state, scale)
+            self._remember_result(state, thumbnail, result)
+            _lap(timings, 'score' if landmarks_points is not None else 'fallback', stage_start)
+            return result
+            
+        except Exception as e:
+            logger.error(f"Error processing frame: {str(e)}\n{traceback.format_exc()}")
+            return self._error_result(e)
+
+    def process_batch(self, frames, states, scales=None, timings=None):
+        """Analyse several frames, running each pipeline stage across the whole batch.
+
+        Frames may belong to different sessions; states[i] is the SessionState
+        for frames[i] and scales[i] its decode scale (see process_frame).
+        A session's frames run in successive rounds, in list order, so each
+        one is detected and scored after the previous one has updated the
+        session's tracker and histories. timings[i], if given, is a dict
+        that receives frame i's stage timings.
+        """
+        if scales is None:
+            scales = [1.0] * len(frames)
+        if timings is None:
+            timings = [None] * len(frames)
+        # Hold every session's lock for the batch, taken in a fixed order
+        locks = sorted({id(state): state.lock for state in states}.items())
+        for _, lock in locks:
+            lock.acquire()
+        try:
+            rounds = []
+            seen = {}
+            for i, state in enumerate(states):
+                number = seen.get(id(state), 0)
+                seen[id(state)] = number + 1
+                if number == len(rounds):
+                    rounds.append([])
+                rounds[number].append(i)
+            if len(rounds) == 1:
+                return self._process_batch(frames, states, scales, timings)
+            results = [None] * len(frames)
+            for indexes in rounds:
+                round_results = self._process_batch([frames[i] for i in indexes], [states[i] for i in indexes],
+                                                    [scales[i] for i in indexes], [timings[i] for i in indexes])
+                for i, result in zip(indexes, round_results):
+                    results[i] = result
+            return results
+        finally:
+            for _, lock in reversed(locks):
+                lock.release()
+
+    def _process_batch(self, frames, states, scales, timings):
+        results = [None] * len(frames)
+        grays = [None] * len(frames)
+        thumbnails = [None] * len(frames)
+        
+        # Stage 1: validation, grayscale conversion and change detection
+        for i, frame in enumerate(frames):
+            states[i].total_frames_processed += 1
+            if frame is None or not isinstance(frame, np.ndarray):
+                results[i] = self._invalid_frame_result()
+                continue
+            try:
+                stage_start = time.perf_counter()
+                gray = self.to_gray(frame)
+                stage_start = _lap(timings[i], 'grayscale', stage_start)
+                thumbnails[i], results[i] = self.check_unchanged(gray, states[i])
+                _lap(timings[i], 'change_detect', stage_start)
+                if results[i] is None:
+                    grays[i] = gray
+            except Exception as e:
+                results[i] = self._error_result(e)
+        
+        # Stage 2: dlib face detection
+        faces = [None] * len(frames)
+        if self.use_dlib:
+            for i, gray in enumerate(grays):
+                if gray is not None and results[i] is None:
+                    try:
+                        stage_start = time.perf_counter()
+                        faces[i] = self.locate_face(gray, states[i])
+                        _lap(timings[i], 'detect', stage_start)
+                    except Exception as e:
+                        results[i] = self._error_result(e)
+        
+        # Stage 3: landmark prediction into one (K, 68, 2) stack, and the
+        # geometric features of the whole stack in one vectorised pass
+        fitted = []
+        shapes = []
+        for i, face in enumerate(faces):
+            if face is not None and results[i] is None:
+                try:
+                    stage_start = time.perf_counter()
+                    shapes.append(self.predictor(grays[i], face))
+                    fitted.append(i)
+                    _lap(timings[i], 'landmarks', stage_start)
+                except Exception as e:
+                    results[i] = self._error_result(e)
+        landmarks = [None] * len(frames)
+        features = [None] * len(frames)
+        if shapes:
+            points = np.empty((len(shapes), 68, 2), dtype=np.float64)
+            for k, shape in enumerate(shapes):
+                shape_to_array(shape, points[k])
+            stacked = extract_features(points)
+            for k, i in enumerate(fitted):
+                landmarks[i] = points[k]
+                features[i] = {name: value[k] for name, value in stacked.items()}
+        
+        # Stage 4: per-session scoring
+        for i, gray in enumerate(grays):
+            if results[i] is not None:
+                continue
+            try:
+                stage_start = time.perf_counter()
+                results[i] = self._score_frame(gray, landmarks[i], states[i], scales[i], features[i])
+                self._remember_result(states[i], thumbnails[i], results[i])
+                _lap(timings[i], 'score' if landmarks[i] is not None else 'fallback', stage_start)
+            except Exception as e:
+                logger.error(f"Error processing frame: {str(e)}\n{traceback.format_exc()}")
+                results[i] = self._error_result(e)
+        
+        return results
+
+    def to_gray(self, frame):
+        """Convert a BGR frame to grayscale, passing grayscale frames through"""
+        if frame.ndim == 2:
+            return frame
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
+    def check_unchanged(self, gray, state):
+        """Compare a frame with the session's last analysed frame.
+
+        Returns (thumbnail, result): result is a copy of the cached result
+        flagged 'reused' if the frame barely changed, otherwise None.
+        """
+        if self.reuse_threshold <= 0:
+            return None, None
+        thumbnail = cv2.resize(gray, CHANGE_THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA)
+        if (state.last_result is None or state.last_thumbnail is None
+                or state.reused_in_a_row >= self.max_reused_frames):
+            return thumbnail, None
+        
+        difference = cv2.absdiff(thumbnail, state.last_thumbnail).mean()
+        if difference >= self.reuse_threshold:
+            return thumbnail, None
+        
+        state.reused_in_a_row += 1
+        state.reused_frames += 1
+        result = dict(state.last_result)
+        result['reused'] = True
+        result['timestamp'] = datetime.now().isoformat()
+        return thumbnail, result
+
+    def _remember_result(self, state, thumbnail, result):
+        """Cache an analysed frame's thumbnail and result for the change-detection gate"""
+        state.reused_in_a_row = 0
+        if thumbnail is None or 'error' in result:
+            state.last_thumbnail = None
+            state.last_result = None
+            return
+        state.last_thumbnail = thumbnail
+        state.last_result = dict(result)
+
+    def detect_face(self, gray):
+        """Return the largest dlib face rectangle in full-resolution coordinates, or None"""
+        small, scale = resize_to_width(gray, self.detection_width)
+        faces = self.detector(small)
+        if len(faces) == 0:
+            return None
+        return scale_rect(max(faces, key=lambda rect: rect.width() * rect.height()), scale)
+
+    def locate_face(self, gray, state):
+        """Find the session's face, following it with a correlation tracker between full detections"""
+        if state.face_tracker is not None and state.frames_since_detect < self.redetect_interval:
+            confidence = state.face_tracker.update(gray)
+            if confidence >= self.track_min_confidence:
+                position = state.face_tracker.get_position()
+                height, width = gray.shape[:2]
+                face = dlib.rectangle(
+                    max(0, int(round(position.left()))),
+                    max(0, int(round(position.top()))),
+                    min(width - 1, int(round(position.right()))),
+                    min(height - 1, int(round(position.bottom())))
+                )
+                if face.width() > 0 and face.height() > 0:
+                    state.frames_since_detect += 1
+                    state.tracked_frames += 1
+                    return face
+        
+        # Fall back to the full-frame detector and restart tracking from its result
+        face = self.detect_face(gray)
+        state.full_detections += 1
+        state.frames_since_detect = 0
+        if face is None or self.redetect_interval <= 0:
+            state.face_tracker = None
+        else:
+            state.face_tracker = dlib.correlation_tracker()
+            state.face_tracker.start_track(gray, face)
+        return face
+
+    def predict_landmarks(self, gray, face, out=None):
+        """Fit the 68-point shape predictor and return the points as a (68, 2) array.
+
+        If out is given, the points are written into it instead of a new array.
+        """
+        return shape_to_array(self.predictor(gray, face), out)
+
+    def _score_frame(self, gray, landmarks_points, state, scale=1.0, features=None):
+        opencv_fallback_used = False
+        if landmarks_points is not None:
+            state.frames_with_face += 1
+            components = self._analyze_landmarks(gray, landmarks_points, state, scale, features)
+        else:
+            # If dlib fails, use OpenCV as fallback
+            opencv_fallback_used = True
+            _fallback_log.info("Using OpenCV cascade classifiers as fallback")
+            components = self._analyze_cascade(gray, state, scale)
+            if components is None:
+                return {
+                    'type': 'focus-score',
+                    'focusScore': 0,
+                    'message': 'No face detected',
+                    'isDrowsy': False
+                }
+        
+        return self._build_result(state, components, opencv_fallback_used)
+
+    def _analyze_landmarks(self, gray, landmarks_points, state, scale=1.0, features=None):
+        # Geometric features (EAR, gaze, head pose) in one vectorised pass,
+        # unless process_batch already computed them for the whole batch
+        if features is None:
+            features = extract_features(landmarks_points)
+
+        # Get eye landmarks
+        left_eye = landmarks_points[36:42]  # Left eye points
+        right_eye = landmarks_points[42:48]  # Right eye points
+
+        # Create eye regions for attention calculation
+        left_eye_region = self.get_eye_region(gray, left_eye)
+        right_eye_region = self.get_eye_region(gray, right_eye)
+
+        # Average eye aspect ratio
+        avg_ear = features['avg_ear']
+
+        # Calculate eye attention scores - new from test.py
+        left_attention = self.calculate_eye_attention(left_eye_region, gray)
+        right_attention = self.calculate_eye_attention(right_eye_region, gray)
+        avg_attention = (left_attention + right_attention) / 2.0
+
+        # Update attention history
+        state.attention_history.append(avg_attention)
+
+        # Calculate face stability from the nose tip movement (100 original
+        # pixels max movement); landmark buffers are reused, so keep a copy
+        current_pos = np.array(features['nose_tip'])
+        face_stability_score = float(face_stability(current_pos, state.prev_face_pos, 100 * scale))
+        state.prev_face_pos = current_pos
+
+        # Detect drowsiness
+        is_drowsy = avg_ear < 0.2  # Threshold for closed eyes
+
+        if is_drowsy:
+            state.blink_counter += 1
+        else:
+            state.blink_counter = max(0, state.blink_counter - 1)
+
+        # Eye gaze from the eye centres' deviation, and where the person is looking
+        gaze_score = features['gaze_score']
+        looking_direction = features['looking_direction']
+
+        # Update gaze history
+        state.gaze_history.append(gaze_score)
+
+        # Head pose (simplified): nose tip offset from the bridge-chin midpoint
+        head_pose_score = features['head_pose_score']
+
+        # Initialize or update head pose history
+        state.head_pose_history.append(head_pose_score)
+
+        return {
+            'face_stability': face_stability_score,
+            'avg_ear': avg_ear,
+            'is_drowsy': is_drowsy,
+            'gaze_score': gaze_score,
+            'head_pose_score': head_pose_score,
+            'looking_direction': looking_direction,
+            'avg_attention': avg_attention
+        }
+
+    def _analyze_cascade(self, gray, state, scale=1.0):
+        # Detect faces using OpenCV on the downscaled frame
+        small, detect_scale = resize_to_width(gray, self.detection_width)
+        min_size = max(1, int(30 * scale * detect_scale))
+        faces = self.face_cascade.detectMultiScale(
+            small,
+            scaleFactor=1.1,
+            minNeighbors=5,
+            minSize=(min_size, min_size)
+        )
+        faces = scale_boxes(faces, detect_scale)
+
+        if len(faces) == 0:
+            return None
+
+        # Get the largest face
+        face = max(faces, key=lambda x: x[2] * x[3])
+        x, y, w, h = face
+
+        # Calculate face stability
+        current_pos = (x + w/2, y + h/2)
+
+        if state.prev_face_pos is None:
+            state.prev_face_pos = current_pos
+            face_stability = 1.0
+        else:
+            distance_moved = distance.euclidean(state.prev_face_pos, current_pos)
+            face_stability = max(0, 1 - (distance_moved / (100 * scale)))  # 100 original pixels max movement
+            state.prev_face_pos = current_pos
+
+        # Detect eyes within the face region
+        roi_gray = gray[y:y+h, x:x+w]
+        eyes = self.eye_cascade.detectMultiScale(
+            roi_gray,
+            scaleFactor=1.1,
+            minNeighbors=5,
+            minSize=(max(1, int(20 * scale)), max(1, int(20 * scale)))
+        )
+
+        # Calculate attention score based on eyes
+        total_attention = 0
+        for (ex, ey, ew, eh) in eyes:
+            eye_roi = roi_gray[ey:ey+eh, ex:ex+ew]
+            attention = self.calculate_eye_attention(eye_roi, gray)
+            total_attention += attention
+
+        avg_attention = total_attention / max(1, len(eyes))
+        state.attention_history.append(avg_attention)
+
+        # Set default values for dlib-specific metrics
+        avg_ear = 0.3 if len(eyes) > 0 else 0.1
+        is_drowsy = len(eyes) == 0
+        gaze_score = 0.5 if len(eyes) > 0 else 0.0
+        head_pose_score = 0.5
+        looking_direction = "unknown"
+
+        # Simulate gaze and head pose with defaults
+        state.gaze_history.append(gaze_score)
+        state.head_pose_history.append(head_pose_score)
+
+        return {
+            'face_stability': face_stability,
+            'avg_ear': avg_ear,
+            'is_drowsy': is_drowsy,
+            'gaze_score': gaze_score,
+            'head_pose_score': head_pose_score,
+            'looking_direction': looking_direction,
+            'avg_attention': avg_attention
+        }
+
+    def _build_result(self, state, components, opencv_fallback_used):
+        face_stability = components['face_stability']
+        avg_ear = components['avg_ear']
+        is_drowsy = components['is_drowsy']
+        gaze_score = components['gaze_score']
+        head_pose_score = components['head_pose_score']
+        looking_direction = components['looking_direction']
+        avg_attention = components['avg_attention']
+        
+        # Calculate focus score with enhanced metrics
+        focus_score = self._calculate_focus_score(
+            state,
+            face_stability,
+            avg_ear,
+            not (is_drowsy or state.blink_counter >= 5),
+            avg_attention
+        )
+
+        # Update focus history
+        state.focus_history.append(focus_score)
+        avg_focus = sum(state.focus_history) / len(state.focus_history) if len(state.focus_history) > 0 else 0
+
+        # Format focus score for display
+        # Return exactly 0 for no focus, but cap at 95 for perfect focus
+        if avg_focus == 0.0:
+            display_focus = 0
+        else:
+            # For other scores, round to one decimal place and cap at 95
+            display_focus = min(95, round(avg_focus * 100, 1))
+
+        # Prepare enhanced response
+        result = {
+            'type': 'focus-score',
+            'focusScore': display_focus,  # Use formatted score
+            'message': self._get_focus_message(state, avg_focus, is_drowsy),
+            'isDrowsy': bool(is_drowsy),
+            'eyeOpenness': round(avg_ear, 2),
+            'faceStability': round(face_stability, 2),
+            'gazeQuality': round(gaze_score, 2),
+            'headPoseQuality': round(head_pose_score, 2),
+            'attentionQuality': round(avg_attention, 2),  # New field
+            'lookingDirection': looking_direction,  # New field to show where user is looking
+            'fallbackUsed': opencv_fallback_used,  # Indicate if fallback was used
+            'timestamp': datetime.now().isoformat()
+        }
+
+        _frame_log.info("Successfully processed frame: focusScore=%s, lookingDirection=%s, fallbackUsed=%s",
+                        display_focus, looking_direction, opencv_fallback_used)
+        return result
+
+    def _invalid_frame_result(self):
+        return {
+            'type': 'focus-score',
+            'focusScore': 0,
+            'message': 'Invalid frame data',
+            'isDrowsy': False,
+            'timestamp': datetime.now().isoformat()
+        }
+
+    def _error_result(self, error):
+        return {
+            'type': 'focus-score',
+            'focusScore': 0,
+            'error': str(error),
+            'message': 'Error processing frame',
+            'isDrowsy': False
+        }
+
+    def get_eye_region(self, gray, eye_points):
+        """Extract eye region from grayscale image using eye landmarks"""
+        try:
+            if len(eye_points) == 0:
+                return np.array([])
+                
+            # Get bounding rectangle of eye points
+            x_min = int(min(eye_points[:, 0]))
+            y_min = int(min(eye_points[:, 1]))
+            x_max = int(max(eye_points[:, 0]))
+            y_max = int(max(eye_points[:, 1]))
+            
+            # Extract eye region with small padding
+            padding = 3
+            eye_region = gray[max(0, y_min-padding):min(gray.shape[0], y_max+padding), 
+                             max(0, x_min-padding):min(gray.shape[1], x_max+padding)]
+            
+            return eye_region
+        except Exception as e:
+            logger.error(f"Error extracting eye region: {str(e)}")
+            return np.array([])
+
+    def _calculate_focus_score(self, state, face_stability, eye_openness, not_drowsy, attention_score=None):
+        # Weight factors - rebalanced for more variable scores
+        stability_weight = 0.25  # Increased to make movement affect score more
+        eye_weight = 0.25
+        drowsy_weight = 0.2
+        gaze_weight = 0.15
+        head_pose_weight = 0.15
+        attention_weight = 0.2
+
+        # Calculate component scores with more variation
+        stability_score = max(0.1, min(0.95, face_stability))
+        eye_score = max(0.1, min(0.95, eye_openness))
+        drowsy_score = 0.9 if not_drowsy else 0.3
+        
+        # Get gaze score from history
+        if len(state.gaze_history) > 0:
+            gaze_score = sum(state.gaze_history) / len(state.gaze_history)
+        else:
+            gaze_score = 0.3  # Lower default if no history
+            
+        # Get head pose score from history
+        if len(state.head_pose_history) > 0:
+            head_pose_score = sum(state.head_pose_history) / len(state.head_pose_history)
+        else:
+            head_pose_score = 0.3  # Lower default if no history
+
+        # Determine attention score from eye regions with more variability
+        if attention_score is None:
+            attention_score = 0.3  # Lower default
+            if len(state.attention_history) > 0:
+                attention_score = max(0.3, min(0.95, sum(state.attention_history) / len(state.attention_history)))
+
+        # Store component scores for detailed feedback
+        state.last_stability_score = stability_score
+        state.last_eye_score = eye_score
+        state.last_drowsy_score = drowsy_score
+        state.last_gaze_score = gaze_score
+        state.last_head_pose_score = head_pose_score
+        state.last_attention_score = attention_score
+
+        # Calculate weighted average with new factors
+        focus_score = (
+            stability_score * stability_weight +
+            eye_score * eye_weight +
+            drowsy_score * drowsy_weight +
+            gaze_score * gaze_weight +
+            head_pose_score * head_pose_weight +
+            attention_score * attention_weight
+        )
+        
+        # Add a small random variation to the final score to prevent it from being too stable
+        focus_variation = random.uniform(-0.05, 0.05)
+        focus_score = max(0.1, min(0.95, focus_score + focus_variation))
+        
+        # Make boost more selective and variable
+        if gaze_score > 0.8 and head_pose_score > 0.8 and stability_score > 0.8:
+            # Smaller boost for excellent attention
+            focus_score = min(0.95, focus_score * 1.05)  # Reduced boost and max
+        
+        # Return the focus score without the perfect focus condition
+        return focus_score
+
+    def _get_focus_message(self, state, focus_score, is_drowsy):
+        if is_drowsy:
+            return "You appear to be drowsy. Please take a break if needed."
+        
+        # Get detailed component scores if available
+        eye_status = state.last_eye_score
+        gaze_status = None
+        if len(state.gaze_history) > 0:
+            gaze_status = sum(state.gaze_history) / len(state.gaze_history)
+            
+        head_pose_status = None
+        if len(state.head_pose_history) > 0:
+            head_pose_status = sum(state.head_pose_history) / len(state.head_pose_history)
+        
+        stability_status = state.last_stability_score
+        attention_status = state.last_attention_score
+        
+        # Determine the primary issue affecting focus
+        primary_issue = None
+        min_score = 1.0
+        
+        if eye_status is not None and eye_status < min_score:
+            min_score = eye_status
+            primary_issue = "eye_openness"
+            
+        if gaze_status is not None and gaze_status < min_score:
+            min_score = gaze_status
+            primary_issue = "gaze_direction"
+            
+        if head_pose_status is not None and head_pose_status < min_score:
+            min_score = head_pose_status
+            primary_issue = "head_position"
+            
+        if stability_status is not None and stability_status < min_score:
+            min_score = stability_status
+            primary_issue = "movement"
+            
+        if attention_status is not None and attention_status < min_score:
+            min_score = attention_status
+            primary_issue = "attention"
+        
+        # Return focus message based on focus score and primary issue
+        if focus_score == 0:
+            return "No focus detected - please check your camera and position"
+        elif focus_score == 1:
+            return "Perfect focus! Keep maintaining this level of attention"
+        elif focus_score < 0.3:
+            if primary_issue == "eye_openness":
+                return "Please open your eyes more and stay alert"
+            elif primary_issue == "gaze_direction":
+                return "Try to look directly at the screen"
+            elif primary_issue == "head_position":
+                return "Please face the camera directly"
+            elif primary_issue == "movement":
+                return "Try to reduce head movement"
+            elif primary_issue == "attention":
+                return "Your eyes indicate you're not focused on the screen"
+            else:
+                return "Please pay more attention"
+        elif focus_score < 0.6:
+            if primary_issue == "eye_openness":
+                return "Your eyes indicate reduced focus"
+            elif primary_issue == "gaze_direction":
+                return "Your gaze is wandering from the screen"
+            elif primary_issue == "head_position":
+                return "Your head position could be improved"
+            elif primary_issue == "movement":
+                return "You're moving more than optimal"
+            elif primary_issue == "attention":
+                return "Try to focus your eyes on the content"
+            else:
+                return "Try to focus more"
+        elif focus_score < 0.8:
+            return "Good focus. Keep it up!"
+        else:
+            return "Excellent focus! You're fully engaged."
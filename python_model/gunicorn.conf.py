@@ -0,0 +1,50 @@
+import gc
+import os
+import sys
+
+# Pre-fork serving: gunicorn -c gunicorn.conf.py wsgi:application
+# (from the repo root, gunicorn -c python_model/gunicorn.conf.py focus_server:app
+# serves focus_server.py the same way).
+#
+# With more than one worker the session table is kept in shared memory
+# (session_table.py), so any worker can serve any session. The tracker's
+# per-session smoothing state stays in each worker's memory and starts
+# afresh when a session's frames move to another worker.
+#
+# Metrics are kept per worker too: each /metrics scrape returns the counters
+# of whichever worker answered it, not totals over all workers. Scrape the
+# workers separately (e.g. one port each) or run a single worker where
+# exact counts matter.
+
+bind = f"{os.environ.get('HOST', '127.0.0.1')}:{os.environ.get('PORT', 5000)}"
+workers = int(os.environ.get('FOCUS_SERVER_WORKERS', os.cpu_count() or 1))
+# Read when the preloaded app creates its session table, before the fork
+os.environ.setdefault('FOCUS_SHARED_SESSIONS', '1' if workers > 1 else '0')
+# Frames are CPU-bound, so scale with workers rather than threads. Extra
+# threads only help while others wait on network I/O; each thread that
+# analyses a frame at the same time borrows its own dlib detector.
+worker_class = 'gthread'
+threads = int(os.environ.get('FOCUS_SERVER_THREADS', 1))
+timeout = int(os.environ.get('FOCUS_SERVER_TIMEOUT', 30))
+
+# Load the app, and with it the models, once in the master before forking
+preload_app = True
+
+# Optionally recycle workers; a restart is only a fork of the loaded master
+max_requests = int(os.environ.get('FOCUS_MAX_REQUESTS', 0))
+max_requests_jitter = max_requests // 10
+
+
+def pre_fork(server, worker):
+    # Move everything loaded so far into the permanent generation so garbage
+    # collections in the workers do not write to (and un-share) those pages
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    wsgi = sys.modules.get('wsgi')
+    if wsgi is not None:
+        wsgi.init_worker()
+    focus_server = sys.modules.get('focus_server')
+    if focus_server is not None:
+        focus_server.start_warm_up()
@@ -0,0 +1,159 @@
+import os
+import cv2
+import dlib
+import queue
+import pickle
+import numpy as np
+
+# Width that face detection runs at. Detector cost scales with pixel count,
+# so 720p uploads are shrunk before detection and only the resulting box is
+# mapped back to full resolution for landmarks and eye ROIs.
+DETECTION_WIDTH = int(os.environ.get('FOCUS_DETECT_WIDTH', 640))
+
+# Frame sizes the models are run at during warm-up, before a server reports ready
+WARMUP_RESOLUTIONS = os.environ.get('FOCUS_WARMUP_RESOLUTIONS', '640x480,1280x720')
+
+
+class DetectorPool:
+    """dlib frontal face detectors lent out one per concurrent call.
+
+    A dlib HOG detector must not run on two threads at once, so each call
+    borrows an idle detector and returns it afterwards. When every detector
+    is busy a new one is copied from a pickled template (a few ms, where
+    loading one with get_frontal_face_detector takes ~0.5 s), so the pool
+    grows to the peak number of concurrent calls. Called like a detector.
+    """
+    def __init__(self):
+        detector = dlib.get_frontal_face_detector()
+        self._template = pickle.dumps(detector)
+        self._idle = queue.SimpleQueue()
+        self._idle.put(detector)
+
+    def __call__(self, image, upsample_num_times=0):
+        try:
+            detector = self._idle.get_nowait()
+        except queue.Empty:
+            detector = pickle.loads(self._template)
+        try:
+            return detector(image, upsample_num_times)
+        finally:
+            self._idle.put(detector)
+
+
+def resize_to_width(image, width):
+    """Downscale an image to the given width.
+
+    Returns the (possibly unchanged) image and the scale factor applied.
+    Images already at or below the width are returned as-is.
+    """
+    if not width or image.shape[1] <= width:
+        return image, 1.0
+    scale = width / image.shape[1]
+    resized = cv2.resize(image, (width, max(1, int(round(image.shape[0] * scale)))), interpolation=cv2.INTER_AREA)
+    return resized, scale
+
+
+def scale_rect(rect, scale):
+    """Map a dlib rectangle found on a downscaled image back to full resolution"""
+    if scale == 1.0:
+        return rect
+    return dlib.rectangle(
+        int(round(rect.left() / scale)),
+        int(round(rect.top() / scale)),
+        int(round(rect.right() / scale)),
+        int(round(rect.bottom() / scale))
+    )
+
+
+def scale_boxes(boxes, scale):
+    """Map (x, y, w, h) boxes found on a downscaled image back to full resolution"""
+    if scale == 1.0 or len(boxes) == 0:
+        return boxes
+    return (boxes / scale).round().astype(int)
+
+
+def parse_resolutions(text):
+    """Parse 'WIDTHxHEIGHT,WIDTHxHEIGHT' into a list of (width, height) tuples"""
+    resolutions = []
+    for item in text.split(','):
+        if item.strip():
+            width, height = item.lower().split('x')
+            resolutions.append((int(width), int(height)))
+    return resolutions
+
+
+def synthetic_frame(width, height, channels=3, seed=0):
+    """A deterministic textured frame with a face-sized blob, for warming up detectors"""
+    rng = np.random.default_rng(seed)
+    frame = rng.integers(60, 120, (height, width), dtype=np.uint8)
+    center = (width // 2, height // 2)
+    axes = (max(1, width // 8), max(1, height // 5))
+    cv2.ellipse(frame, center, axes, 0, 0, 360, 190, -1)
+    for side in (-1, 1):
+        cv2.circle(frame, (center[0] + side * axes[0] // 2, center[1] - axes[1] // 4), max(1, axes[0] // 6), 40, -1)
+    frame = cv2.GaussianBlur(frame, (5, 5), 0)
+    if channels == 3:
+        return cv2.cvtColor(frame, cv2.COLOR_GRAY2BGR)
+    return frame
+
+
+# cv2 flags that let libjpeg's DCT scaling shrink the image while decoding
+_REDUCED_GRAYSCALE_FLAGS = {
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+}
+
+# JPEG start-of-frame markers (all SOFn except DHT, JPG and DAC)
+_JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def jpeg_dimensions(buffer):
+    """Read (width, height) from a JPEG header without decoding, or None if not a JPEG"""
+    data = memoryview(buffer)
+    if len(data) < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+    pos = 2
+    while pos + 9 < len(data):
+        if data[pos] != 0xFF:
+            return None
+        marker = data[pos + 1]
+        if marker == 0xFF:
+            pos += 1
+            continue
+        length = (data[pos + 2] << 8) | data[pos + 3]
+        if marker in _JPEG_SOF_MARKERS:
+            height = (data[pos + 5] << 8) | data[pos + 6]
+            width = (data[pos + 7] << 8) | data[pos + 8]
+            return width, height
+        pos += 2 + length
+    return None
+
+
+def decode_gray(buffer, target_width=None):
+    """Decode an image straight to grayscale, shrinking JPEGs during decode.
+
+    For JPEGs the largest reduction (2, 4 or 8) that keeps the decoded width at
+    or above target_width (default: the detection width) is used, so libjpeg
+    skips most of the IDCT work and no colour frame is ever built.
+    Returns (gray, scale) where scale is decoded pixels per original pixel,
+    or (None, 1.0) if the data is not an image.
+    """
+    if target_width is None:
+        target_width = DETECTION_WIDTH
+    encoded = np.frombuffer(buffer, dtype=np.uint8)
+
+    reduction = 1
+    dimensions = jpeg_dimensions(buffer)
+    if dimensions is not None and target_width:
+        for factor in (8, 4, 2):
+            if dimensions[0] // factor >= target_width:
+                reduction = factor
+                break
+
+    if reduction > 1:
+        gray = cv2.imdecode(encoded, _REDUCED_GRAYSCALE_FLAGS[reduction])
+        if gray is not None:
+            return gray, gray.shape[1] / dimensions[0]
+
+    return cv2.imdecode(encoded, cv2.IMREAD_GRAYSCALE), 1.0
@@ -0,0 +1,240 @@
+import time
+import argparse
+import operator
+import numpy as np
+
+# Indices into the 68-point dlib landmark layout
+LEFT_EYE = slice(36, 42)
+RIGHT_EYE = slice(42, 48)
+CHIN = 8
+NOSE_BRIDGE = 27
+NOSE_TIP = 30
+
+_POINT_XY = operator.attrgetter('x', 'y')
+
+
+def _combination_weights():
+    """Weights that turn the 68 points into every vector the features need.
+
+    Each row is one linear combination of landmarks (see the _ROW_* indices),
+    so all of them come out of a single matrix product.
+    """
+    rows = []
+    for eye in (36, 42):
+        corner_left, top_a, top_b, corner_right, bottom_b, bottom_a = range(eye, eye + 6)
+        width = {corner_left: 1, corner_right: -1}
+        gap_a = {top_a: 1, bottom_a: -1}
+        gap_b = {top_b: 1, bottom_b: -1}
+        # Eye centre (mean of all 6 points) minus the midpoint of the corners
+        gaze = {i: 1 / 6 for i in range(eye, eye + 6)}
+        gaze[corner_left] -= 0.5
+        gaze[corner_right] -= 0.5
+        # Midpoint of the lid centres minus the eye centre
+        vertical = {i: -1 / 6 for i in range(eye, eye + 6)}
+        for i in (top_a, top_b, bottom_a, bottom_b):
+            vertical[i] += 0.25
+        # Upper lid centre minus lower lid centre
+        height = {top_a: 0.5, top_b: 0.5, bottom_a: -0.5, bottom_b: -0.5}
+        rows.append((width, gap_a, gap_b, gaze, vertical, height))
+    # Interleave the eyes so each feature's left/right rows are adjacent
+    ordered = [eye_rows[k] for k in range(6) for eye_rows in rows]
+    # Bridge-to-chin axis, and nose tip minus the axis midpoint
+    ordered.append({CHIN: 1, NOSE_BRIDGE: -1})
+    ordered.append({NOSE_TIP: 1, NOSE_BRIDGE: -0.5, CHIN: -0.5})
+
+    weights = np.zeros((len(ordered), 68))
+    for row, combination in enumerate(ordered):
+        for point, weight in combination.items():
+            weights[row, point] = weight
+    return weights
+
+
+_WEIGHTS = _combination_weights()
+# Row pairs (left eye, right eye) in _WEIGHTS, then the two head-pose rows
+_ROW_WIDTH = slice(0, 2)
+_ROW_GAP_A = slice(2, 4)
+_ROW_GAP_B = slice(4, 6)
+_ROW_GAZE = slice(6, 8)
+_ROW_VERTICAL = slice(8, 10)
+_ROW_HEIGHT = slice(10, 12)
+_ROW_FACE_AXIS = 12
+_ROW_NOSE_OFFSET = 13
+
+# Looking directions indexed by 3 * horizontal code + vertical code
+# (horizontal: center, right, left; vertical: none, down, up)
+_DIRECTIONS = np.array([
+    'center', 'center-down', 'center-up',
+    'right', 'right-down', 'right-up',
+    'left', 'left-down', 'left-up'
+], dtype=object)
+
+
+def shape_to_array(shape, out=None):
+    """Copy a dlib shape's 68 points into a (68, 2) float array.
+
+    If out is given (e.g. a per-session buffer or one row of an (N, 68, 2)
+    stack) it is filled in place and returned, so no new array is allocated.
+    """
+    if out is None:
+        out = np.empty((shape.num_parts, 2), dtype=np.float64)
+    out[:] = list(map(_POINT_XY, shape.parts()))
+    return out
+
+
+def face_stability(nose_tip, prev_nose_tip, max_movement=100.0):
+    """1 for a still face, falling to 0 once the nose tip moved max_movement pixels.
+
+    Works on single (2,) points or (N, 2) stacks; a missing (None or NaN)
+    previous position counts as perfectly stable.
+    """
+    if prev_nose_tip is None:
+        return np.ones(np.shape(nose_tip)[:-1]) if np.ndim(nose_tip) > 1 else 1.0
+    offset = np.asarray(nose_tip) - prev_nose_tip
+    moved = np.hypot(offset[..., 0], offset[..., 1])
+    stability = np.maximum(0, 1 - moved / max_movement)
+    return np.where(np.isnan(stability), 1.0, stability)
+
+
+def extract_features(points, prev_nose_tip=None, max_movement=100.0):
+    """Compute every geometric focus feature from 68-point landmarks.
+
+    points is a (68, 2) array or an (N, 68, 2) stack. Returns a dict with
+    per-face eye aspect ratios, gaze deviations and looking direction,
+    head-pose score and face stability (see face_stability). Values are
+    Python scalars for a single face and length-N arrays for a stack.
+    """
+    pts = np.asarray(points, dtype=np.float64)
+    single = pts.ndim == 2
+    if single:
+        pts = pts[np.newaxis]
+
+    # Every difference vector in one product: (N, rows, xy), then all their lengths
+    vectors = _WEIGHTS @ pts
+    lengths = np.hypot(vectors[..., 0], vectors[..., 1])
+    width = lengths[:, _ROW_WIDTH]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Eye aspect ratio: both vertical distances over twice the eye width
+        ear = np.where(width > 0, (lengths[:, _ROW_GAP_A] + lengths[:, _ROW_GAP_B]) / (2.0 * width), 0.0)
+        # Gaze: offset of the eye centre from the corner midpoint, relative to the eye size
+        horizontal_deviation = (lengths[:, _ROW_GAZE] / width).mean(axis=1)
+        vertical_deviation = (lengths[:, _ROW_VERTICAL] / lengths[:, _ROW_HEIGHT]).mean(axis=1)
+        # Head pose: distance of the nose tip from the bridge-chin midpoint
+        head_pose_score = np.maximum(0, 1 - lengths[:, _ROW_NOSE_OFFSET] / (lengths[:, _ROW_FACE_AXIS] * 0.3))
+
+    # Looking direction: both eyes must agree on the side
+    gaze_offset = vectors[:, _ROW_GAZE]
+    positive = (gaze_offset > 0).all(axis=1)
+    negative = (gaze_offset < 0).all(axis=1)
+    horizontal = np.where(horizontal_deviation > 0.2, positive[:, 0] + 2 * negative[:, 0], 0)
+    vertical = np.where(vertical_deviation > 0.2, positive[:, 1] + 2 * negative[:, 1], 0)
+    direction = 3 * horizontal + vertical
+    looking_direction = _DIRECTIONS[direction]
+
+    # Gaze score is higher when looking at the centre, with a boost for looking straight on
+    gaze_score = 1.0 - np.minimum(1.0, horizontal_deviation * 2.0 + vertical_deviation * 1.5)
+    gaze_score = np.where(direction == 0, np.minimum(1.0, gaze_score * 1.2), gaze_score)
+
+    nose_tip = pts[:, NOSE_TIP]
+    features = {
+        'left_ear': ear[:, 0],
+        'right_ear': ear[:, 1],
+        'avg_ear': ear.mean(axis=1),
+        'gaze_horizontal_deviation': horizontal_deviation,
+        'gaze_vertical_deviation': vertical_deviation,
+        'gaze_score': gaze_score,
+        'looking_direction': looking_direction,
+        'head_pose_score': head_pose_score,
+        'face_stability': face_stability(nose_tip, prev_nose_tip, max_movement),
+        'nose_tip': nose_tip,
+        'face_center': pts[:, NOSE_BRIDGE]
+    }
+    if single:
+        return {name: (value[0] if value.ndim > 1 or value.dtype == object else float(value[0]))
+                for name, value in features.items()}
+    return features
+
+
+def _scalar_features(points, prev_nose_tip):
+    """The per-point feature code extract_features replaced, kept for the benchmark"""
+    left_eye = points[36:42]
+    right_eye = points[42:48]
+
+    def eye_aspect_ratio(eye):
+        A = np.linalg.norm(eye[1] - eye[5])
+        B = np.linalg.norm(eye[2] - eye[4])
+        C = np.linalg.norm(eye[0] - eye[3])
+        return (A + B) / (2.0 * C) if C > 0 else 0
+
+    avg_ear = (eye_aspect_ratio(left_eye) + eye_aspect_ratio(right_eye)) / 2.0
+    left_eye_center = np.mean(left_eye, axis=0)
+    right_eye_center = np.mean(right_eye, axis=0)
+    left_eye_top = np.mean([points[37], points[38]], axis=0)
+    left_eye_bottom = np.mean([points[41], points[40]], axis=0)
+    right_eye_top = np.mean([points[43], points[44]], axis=0)
+    right_eye_bottom = np.mean([points[47], points[46]], axis=0)
+    left_eye_ideal_center = np.mean([points[36], points[39]], axis=0)
+    right_eye_ideal_center = np.mean([points[42], points[45]], axis=0)
+    left_h = np.linalg.norm(left_eye_center - left_eye_ideal_center) / np.linalg.norm(points[36] - points[39])
+    right_h = np.linalg.norm(right_eye_center - right_eye_ideal_center) / np.linalg.norm(points[42] - points[45])
+    left_v = np.linalg.norm((left_eye_top + left_eye_bottom) / 2 - left_eye_center) / np.linalg.norm(left_eye_top - left_eye_bottom)
+    right_v = np.linalg.norm((right_eye_top + right_eye_bottom) / 2 - right_eye_center) / np.linalg.norm(right_eye_top - right_eye_bottom)
+    gaze_h = (left_h + right_h) / 2
+    gaze_v = (left_v + right_v) / 2
+    gaze_score = 1.0 - min(1.0, gaze_h * 2.0 + gaze_v * 1.5)
+    looking_direction = "center"
+    if gaze_h > 0.2:
+        if left_eye_center[0] > left_eye_ideal_center[0] and right_eye_center[0] > right_eye_ideal_center[0]:
+            looking_direction = "right"
+        elif left_eye_center[0] < left_eye_ideal_center[0] and right_eye_center[0] < right_eye_ideal_center[0]:
+            looking_direction = "left"
+    if gaze_v > 0.2:
+        if left_eye_center[1] > left_eye_ideal_center[1] and right_eye_center[1] > right_eye_ideal_center[1]:
+            looking_direction = looking_direction + "-down"
+        elif left_eye_center[1] < left_eye_ideal_center[1] and right_eye_center[1] < right_eye_ideal_center[1]:
+            looking_direction = looking_direction + "-up"
+    if looking_direction == "center":
+        gaze_score = min(1.0, gaze_score * 1.2)
+    forehead, nose_tip, chin = points[27], points[30], points[8]
+    stability = max(0, 1 - np.linalg.norm(nose_tip - prev_nose_tip) / 100)
+    face_height = np.linalg.norm(chin - forehead)
+    nose_offset = np.linalg.norm(nose_tip - (forehead + (chin - forehead) * 0.5))
+    head_pose_score = max(0, 1 - (nose_offset / (face_height * 0.3)))
+    return avg_ear, gaze_score, looking_direction, head_pose_score, stability
+
+
+def _benchmark(batch_size, repeats):
+    """Time the per-point feature code against extract_features"""
+    rng = np.random.default_rng(0)
+    # A rough frontal face: the layout does not change the timings
+    template = np.stack([np.linspace(0, 200, 68), 100 + 40 * np.sin(np.linspace(0, 6, 68))], axis=1)
+    stack = template + rng.normal(0, 2, (batch_size, 68, 2))
+
+    prev_nose_tips = stack[:, NOSE_TIP] + 1.0
+
+    def timed(function, items):
+        start = time.perf_counter()
+        for _ in range(repeats):
+            for points, prev_nose_tip in items:
+                function(points, prev_nose_tip)
+        return (time.perf_counter() - start) / (repeats * batch_size) * 1e6
+
+    scalar = timed(_scalar_features, list(zip(stack, prev_nose_tips)))
+    single = timed(extract_features, list(zip(stack, prev_nose_tips)))
+    start = time.perf_counter()
+    for _ in range(repeats):
+        extract_features(stack, prev_nose_tips)
+    batched = (time.perf_counter() - start) / (repeats * batch_size) * 1e6
+
+    print(f"{'method':<28}{'us/face':>10}")
+    print(f"{'per-point (old)':<28}{scalar:>10.1f}")
+    print(f"{'extract_features (68,2)':<28}{single:>10.1f}")
+    print(f"{f'extract_features ({batch_size},68,2)':<28}{batched:>10.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark landmark feature extraction')
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--repeats', type=int, default=200)
+    args = parser.parse_args()
+    _benchmark(args.batch_size, args.repeats)
@@ -0,0 +1,278 @@
+import sys
+import json
+import math
+import time
+import base64
+import argparse
+import threading
+from datetime import datetime
+
+import cv2
+import numpy as np
+import requests
+
+from benchmark import load_corpus, fit_to
+
+# A step counts as saturated once the server completes less than this share
+# of the frames the students offered
+THROUGHPUT_FLOOR = 0.9
+
+
+class Student:
+    """One simulated student: a session that posts frames at a fixed rate.
+
+    Each student is one thread with at most one request in flight, so the
+    loop is closed: frames are scheduled every 1/fps seconds, but a frame
+    whose slot passed while the previous request was outstanding is sent as
+    soon as that request returns. Latency is measured from the frame's
+    scheduled send time rather than the moment it actually went out, so the
+    time a frame spent waiting behind a stalled response is counted and a
+    stall does not hide in the percentiles (coordinated omission). Frames
+    still unsent when the step ends are counted as unsent.
+    """
+    def __init__(self, index, args, frames):
+        self.index = index
+        self.args = args
+        self.frames = frames
+        self.http = requests.Session()
+        self.session_id = None
+        self.latencies = []
+        self.errors = {}
+        self.superseded = 0
+        self.unsent = 0
+
+    def _error(self, kind):
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    def start(self):
+        if self.args.target == 'focus_server':
+            self.session_id = f"load-{self.index}"
+            return True
+        try:
+            response = self.http.post(f"{self.args.url}/start-session", json={
+                'meetingId': self.args.meeting_id,
+                'userId': f"load-{self.index}",
+                'userName': f"Load Student {self.index}"
+            }, timeout=self.args.timeout)
+            data = response.json()
+            if response.status_code == 200 and data.get('success'):
+                self.session_id = data['sessionId']
+                return True
+            self._error(f"start-session HTTP {response.status_code}")
+        except Exception as e:
+            self._error(f"start-session {type(e).__name__}")
+        return False
+
+    def post_frame(self, number, scheduled):
+        """Post one frame; its latency runs from the scheduled perf_counter() time"""
+        frame = self.frames[(self.index * 7 + number) % len(self.frames)]
+        args = self.args
+        try:
+            if args.target == 'focus_server':
+                response = self.http.post(f"{args.url}/analyze-focus", json={
+                    'image': frame['data_url'], 'sessionId': self.session_id
+                }, timeout=args.timeout)
+            elif args.raw:
+                response = self.http.post(f"{args.url}/analyze-frame/raw", data=frame['jpeg'], headers={
+                    'Content-Type': 'image/jpeg', 'X-Session-Id': self.session_id
+                }, timeout=args.timeout)
+            else:
+                response = self.http.post(f"{args.url}/analyze-frame", json={
+                    'sessionId': self.session_id, 'frame': frame['data_url']
+                }, timeout=args.timeout)
+            latency = time.perf_counter() - scheduled
+            data = response.json()
+        except requests.Timeout:
+            self._error('timeout')
+            return
+        except Exception as e:
+            self._error(type(e).__name__)
+            return
+
+        if data.get('superseded'):
+            # The asyncio service dropped this frame for a newer one; not an error
+            self.superseded += 1
+        elif response.status_code != 200:
+            self._error(f"HTTP {response.status_code}")
+        else:
+            self.latencies.append(latency)
+
+    def run(self, stop_at):
+        interval = 1.0 / self.args.fps
+        # Spread students over one interval so they do not all post at once
+        next_send = time.perf_counter() + interval * (self.index % 97) / 97
+        number = 0
+        while next_send < stop_at:
+            now = time.perf_counter()
+            if now >= stop_at:
+                break
+            if now < next_send:
+                time.sleep(next_send - now)
+            # A frame whose slot has passed goes out at once, with its latency still
+            # counted from next_send
+            self.post_frame(number, next_send)
+            number += 1
+            next_send += interval
+        if next_send < stop_at:
+            self.unsent = math.ceil((stop_at - next_send) / interval)
+
+    def stop(self):
+        if self.args.target == 'focus_server' or self.session_id is None:
+            return
+        try:
+            self.http.post(f"{self.args.url}/stop-session", json={'sessionId': self.session_id}, timeout=self.args.timeout)
+        except Exception as e:
+            self._error(f"stop-session {type(e).__name__}")
+        self.http.close()
+
+
+def run_step(students_count, frames, args):
+    """Run one load level and summarise it"""
+    students = [Student(index, args, frames) for index in range(students_count)]
+    starters = [threading.Thread(target=student.start) for student in students]
+    for thread in starters:
+        thread.start()
+    for thread in starters:
+        thread.join()
+
+    started = time.perf_counter()
+    stop_at = started + args.duration
+    threads = [threading.Thread(target=student.run, args=(stop_at,), daemon=True)
+               for student in students if student.session_id is not None]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    for student in students:
+        student.stop()
+
+    latencies = np.array([latency for student in students for latency in student.latencies]) * 1000.0
+    errors = {}
+    for student in students:
+        for kind, count in student.errors.items():
+            errors[kind] = errors.get(kind, 0) + count
+    completed = len(latencies)
+    superseded = sum(student.superseded for student in students)
+    failed = sum(errors.values())
+    attempted = completed + superseded + failed
+    offered = students_count * args.fps
+
+    step = {
+        'students': students_count,
+        'offeredFps': round(offered, 2),
+        'throughputFps': round(completed / elapsed, 2) if elapsed > 0 else 0.0,
+        'requests': attempted,
+        'completed': completed,
+        'superseded': superseded,
+        'errors': failed,
+        'errorRate': round(failed / attempted, 4) if attempted else 0.0,
+        'unsentFrames': sum(student.unsent for student in students),
+        'errorKinds': errors
+    }
+    for name, q in (('p50Ms', 50), ('p95Ms', 95), ('p99Ms', 99)):
+        step[name] = round(float(np.percentile(latencies, q)), 1) if completed else None
+
+    reasons = []
+    if step['throughputFps'] < offered * THROUGHPUT_FLOOR:
+        reasons.append(f"throughput {step['throughputFps']} < {THROUGHPUT_FLOOR:.0%} of offered {step['offeredFps']}")
+    if step['p95Ms'] is None or step['p95Ms'] > args.max_p95_ms:
+        reasons.append(f"p95 {step['p95Ms']} ms > {args.max_p95_ms} ms")
+    if step['errorRate'] > args.max_error_rate:
+        reasons.append(f"error rate {step['errorRate']:.1%} > {args.max_error_rate:.1%}")
+    step['saturated'] = bool(reasons)
+    step['saturationReasons'] = reasons
+    return step
+
+
+def encode_frames(args):
+    """JPEG-encode the corpus at the upload resolution, ready for both request formats"""
+    width, height = (int(value) for value in args.resolution.split('x'))
+    frames = []
+    for frame in load_corpus(args.corpus, args.frames):
+        ok, buffer = cv2.imencode('.jpg', fit_to(frame, width, height), [cv2.IMWRITE_JPEG_QUALITY, args.quality])
+        jpeg = buffer.tobytes()
+        frames.append({
+            'jpeg': jpeg,
+            'data_url': 'data:image/jpeg;base64,' + base64.b64encode(jpeg).decode('ascii')
+        })
+    return frames
+
+
+def print_step(step):
+    p = lambda value: '-' if value is None else f"{value:.1f}"
+    print(f"{step['students']:>8}{step['offeredFps']:>10.1f}{step['throughputFps']:>10.1f}{p(step['p50Ms']):>9}"
+          f"{p(step['p95Ms']):>9}{p(step['p99Ms']):>9}{step['errorRate']:>8.1%}{step['superseded']:>7}"
+          f"  {'SATURATED: ' + '; '.join(step['saturationReasons']) if step['saturated'] else 'ok'}", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Simulate a classroom of students streaming frames to the focus service')
+    parser.add_argument('corpus', help='Directory of images, an image, or a video to take frames from')
+    parser.add_argument('--url', default='http://127.0.0.1:5000', help='Base URL of the service')
+    parser.add_argument('--target', choices=('app', 'focus_server'), default='app',
+                        help='app: python_model/app.py session API; focus_server: focus_server.py /analyze-focus')
+    parser.add_argument('--raw', action='store_true', help='Upload raw JPEG bytes to /analyze-frame/raw (app only)')
+    parser.add_argument('--students', default='1,5,10,20,40',
+                        help='Comma-separated student counts, run in order until the service saturates')
+    parser.add_argument('--fps', type=float, default=1.0, help='Frames per second each student sends')
+    parser.add_argument('--duration', type=float, default=30.0, help='Seconds per load step')
+    parser.add_argument('--frames', type=int, default=30, help='Corpus frames to cycle through')
+    parser.add_argument('--resolution', default='640x480', help='Upload resolution WIDTHxHEIGHT')
+    parser.add_argument('--quality', type=int, default=80, help='JPEG quality of the uploads')
+    parser.add_argument('--timeout', type=float, default=10.0, help='Request timeout in seconds')
+    parser.add_argument('--max-p95-ms', type=float, default=1000.0, help='p95 latency above which a step is saturated')
+    parser.add_argument('--max-error-rate', type=float, default=0.01, help='Error rate above which a step is saturated')
+    parser.add_argument('--meeting-id', default='load-test')
+    parser.add_argument('--keep-going', action='store_true', help='Run every step even after saturation')
+    parser.add_argument('--output', help='Write the results as JSON')
+    args = parser.parse_args()
+    args.url = args.url.rstrip('/')
+    steps = sorted({int(value) for value in args.students.split(',') if value.strip()})
+    if not steps or steps[0] < 1 or args.fps <= 0:
+        parser.error('--students needs positive counts and --fps must be above 0')
+
+    try:
+        requests.get(f"{args.url}/health", timeout=args.timeout).raise_for_status()
+    except Exception as e:
+        raise SystemExit(f"Service at {args.url} is not healthy: {e}")
+
+    frames = encode_frames(args)
+    print(f"{len(frames)} frames at {args.resolution}, {args.fps} fps per student, {args.duration:.0f}s per step against {args.url}")
+    print(f"{'students':>8}{'offered':>10}{'served':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}{'supers':>7}")
+
+    results = []
+    for count in steps:
+        step = run_step(count, frames, args)
+        results.append(step)
+        print_step(step)
+        if step['saturated'] and not args.keep_going:
+            break
+
+    sustained = [step['students'] for step in results if not step['saturated']]
+    saturated = next((step for step in results if step['saturated']), None)
+    if saturated is None:
+        print(f"Not saturated up to {results[-1]['students']} students; rerun with larger --students counts")
+    else:
+        print(f"Saturated at {saturated['students']} students; "
+              f"max sustained: {max(sustained) if sustained else 'none'} students at {args.fps} fps")
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump({
+                'created': datetime.now().isoformat(),
+                'url': args.url,
+                'target': args.target,
+                'raw': args.raw,
+                'fps': args.fps,
+                'duration': args.duration,
+                'resolution': args.resolution,
+                'maxSustainedStudents': max(sustained) if sustained else 0,
+                'saturatedAt': saturated['students'] if saturated else None,
+                'steps': results
+            }, output, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+import os
+import sys
+import time
+import queue
+import atexit
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+DEFAULT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Records waiting for the writer thread. When it falls this far behind, new
+# records are dropped instead of making the logging thread wait.
+QUEUE_SIZE = 10000
+
+# Seconds between repeats of a rate-limited per-frame message
+LOG_INTERVAL = float(os.environ.get('FOCUS_LOG_INTERVAL', 10))
+
+_listener = None
+_queue_handler = None
+
+
+class _NonBlockingQueueHandler(QueueHandler):
+    """Hands records to the writer thread without formatting them or waiting"""
+    def __init__(self, records):
+        super().__init__(records)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # The record stays in this process, so %-formatting and tracebacks
+        # are left to the handlers on the writer thread
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging(filename=None, level=logging.INFO, fmt=DEFAULT_FORMAT, stream=sys.stdout):
+    """Log to a file and/or stream from a background thread.
+
+    Used instead of logging.basicConfig: the root logger gets a queue handler
+    and a QueueListener thread formats the records and writes them, so the
+    thread that logged never waits on disk or console I/O. Like basicConfig,
+    it does nothing if the root logger already has handlers.
+    """
+    global _listener, _queue_handler
+    root = logging.getLogger()
+    if root.handlers:
+        return None
+
+    formatter = logging.Formatter(fmt)
+    handlers = []
+    if filename:
+        handlers.append(logging.FileHandler(filename))
+    if stream is not None:
+        handlers.append(logging.StreamHandler(stream))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    records = queue.Queue(QUEUE_SIZE)
+    _queue_handler = _NonBlockingQueueHandler(records)
+    root.addHandler(_queue_handler)
+    root.setLevel(level)
+    _listener = QueueListener(records, *handlers, respect_handler_level=True)
+    _listener.start()
+    # Flush what is still queued when the process exits
+    atexit.register(_stop_listener)
+    return _listener
+
+
+def _stop_listener():
+    if _listener is not None:
+        _listener.stop()
+
+
+def _restart_after_fork():
+    """Give a forked child its own queue and writer thread (threads do not survive fork)"""
+    global _listener
+    if _listener is None:
+        return
+    records = queue.Queue(QUEUE_SIZE)
+    _queue_handler.queue = records
+    _listener = QueueListener(records, *_listener.handlers, respect_handler_level=True)
+    _listener.start()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+def dropped_records():
+    """Records discarded because the writer thread's queue was full"""
+    return _queue_handler.dropped if _queue_handler is not None else 0
+
+
+class ThrottledLogger:
+    """Logs a message repeated on every frame at most once per interval.
+
+    Calls in between are counted instead of logged, and the next message
+    that gets through says how many were suppressed. An interval of 0 logs
+    every call.
+    """
+    def __init__(self, logger, interval=LOG_INTERVAL):
+        self.logger = logger
+        self.interval = interval
+        self._next_time = 0.0
+        self._suppressed = 0
+        # Request threads share one throttle
+        self._lock = threading.Lock()
+
+    def log(self, level, msg, *args):
+        if not self.logger.isEnabledFor(level):
+            return
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_time:
+                self._suppressed += 1
+                return
+            self._next_time = now + self.interval
+            suppressed, self._suppressed = self._suppressed, 0
+        if suppressed:
+            msg += ' (%d similar messages suppressed)'
+            args += (suppressed,)
+        # stacklevel points the record at the caller of info()/warning()
+        self.logger.log(level, msg, *args, stacklevel=3)
+
+    def debug(self, msg, *args):
+        self.log(logging.DEBUG, msg, *args)
+
+    def info(self, msg, *args):
+        self.log(logging.INFO, msg, *args)
+
+    def warning(self, msg, *args):
+        self.log(logging.WARNING, msg, *args)
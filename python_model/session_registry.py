@@ -0,0 +1,154 @@
+import os
+import time
+import heapq
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Seconds without a frame before a session is evicted
+SESSION_TTL = float(os.environ.get('FOCUS_SESSION_TTL', 600))
+# Most sessions open at once; further /start-session calls are refused
+MAX_SESSIONS = int(os.environ.get('FOCUS_MAX_SESSIONS', 1000))
+# Seconds between reaper passes
+REAP_INTERVAL = float(os.environ.get('FOCUS_REAP_INTERVAL', 30))
+
+
+class SessionLimitError(Exception):
+    """Raised when a session is added while max_sessions are open"""
+
+
+class SessionRegistry:
+    """Open sessions with a time-to-live on their last activity.
+
+    Activity is a monotonic timestamp updated by touch(). A min-heap holds
+    one (last_active, session_id) entry per session, as of when it was
+    pushed; the reaper pops entries older than the TTL and either evicts the
+    session or, if it was touched since, pushes it back with its current
+    time. So touch() is O(1) and a reap costs O(log n) per popped entry.
+
+    Each session's info also carries running frame aggregates (frames,
+    score_sum, focused_frames), updated by record().
+
+    on_evict(session_id, info, reason) is called outside the lock for every
+    session that leaves other than through remove().
+    """
+    def __init__(self, ttl=SESSION_TTL, max_sessions=MAX_SESSIONS, reap_interval=REAP_INTERVAL, on_evict=None):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.reap_interval = reap_interval
+        self.on_evict = on_evict
+        self.evictions = {'expired': 0}
+        self.rejected = 0
+        self._sessions = {}
+        self._last_active = {}
+        self._heap = []
+        self._lock = threading.Lock()
+        self._reaper = None
+        self._stop = threading.Event()
+
+    def add(self, session_id, info):
+        """Register a session; raises SessionLimitError when the registry is full"""
+        self.start_reaper()
+        if len(self._sessions) >= self.max_sessions:
+            # Make room from sessions that are already past their TTL
+            self.reap()
+        now = time.monotonic()
+        with self._lock:
+            if len(self._sessions) >= self.max_sessions:
+                self.rejected += 1
+                raise SessionLimitError(f"Too many active sessions (limit {self.max_sessions})")
+            self._sessions[session_id] = dict(info, frames=0, score_sum=0.0, focused_frames=0)
+            self._last_active[session_id] = now
+            heapq.heappush(self._heap, (now, session_id))
+
+    def touch(self, session_id):
+        """Mark a session active; returns its info, or None if it is not open"""
+        with self._lock:
+            info = self._sessions.get(session_id)
+            if info is not None:
+                self._last_active[session_id] = time.monotonic()
+            return info
+
+    def record(self, session_id, score, focused):
+        """Add a frame's focus score to the session's aggregates"""
+        with self._lock:
+            info = self._sessions.get(session_id)
+            if info is not None:
+                info['frames'] += 1
+                info['score_sum'] += score
+                info['focused_frames'] += int(bool(focused))
+
+    def get(self, session_id, default=None):
+        return self._sessions.get(session_id, default)
+
+    def remove(self, session_id):
+        """Close a session; returns its info, or None if it was not open"""
+        with self._lock:
+            self._last_active.pop(session_id, None)
+            # Its heap entry is discarded when the reaper reaches it
+            return self._sessions.pop(session_id, None)
+
+    def reap(self, now=None):
+        """Evict sessions idle for longer than the TTL; returns how many"""
+        cutoff = (time.monotonic() if now is None else now) - self.ttl
+        expired = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= cutoff:
+                _, session_id = heapq.heappop(self._heap)
+                last_active = self._last_active.get(session_id)
+                if last_active is None:
+                    continue
+                if last_active > cutoff:
+                    heapq.heappush(self._heap, (last_active, session_id))
+                    continue
+                del self._last_active[session_id]
+                expired.append((session_id, self._sessions.pop(session_id)))
+            self.evictions['expired'] += len(expired)
+        for session_id, info in expired:
+            logger.info(f"Evicted session {session_id} after {self.ttl:.0f}s without frames")
+            if self.on_evict is not None:
+                try:
+                    self.on_evict(session_id, info, 'expired')
+                except Exception as e:
+                    logger.error(f"Error evicting session {session_id}: {str(e)}")
+        return len(expired)
+
+    def start_reaper(self):
+        """Start the reaper thread unless it is running in this process.
+
+        Threads do not survive a fork, so pre-forked servers call this in
+        each worker; add() calls it too.
+        """
+        if self.reap_interval <= 0 or (self._reaper is not None and self._reaper.is_alive()):
+            return
+        # Checked again under the lock, so two first add() calls start one reaper
+        with self._lock:
+            if self._reaper is None or not self._reaper.is_alive():
+                self._reaper = threading.Thread(target=self._reap_loop, name='session-reaper', daemon=True)
+                self._reaper.start()
+
+    def _reap_loop(self):
+        while not self._stop.wait(self.reap_interval):
+            try:
+                self.reap()
+            except Exception as e:
+                logger.error(f"Session reaper error: {str(e)}")
+
+    def stop(self):
+        self._stop.set()
+
+    def stats(self):
+        return {
+            'active': len(self._sessions),
+            'maxSessions': self.max_sessions,
+            'ttlSeconds': self.ttl,
+            'evicted': dict(self.evictions),
+            'rejected': self.rejected
+        }
+
+    def __contains__(self, session_id):
+        return session_id in self._sessions
+
+    def __len__(self):
+        return len(self._sessions)
@@ -0,0 +1,440 @@
+import os
+import time
+import uuid
+import atexit
+import logging
+import multiprocessing
+from datetime import datetime
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from session_registry import SESSION_TTL, MAX_SESSIONS, REAP_INTERVAL, SessionRegistry, SessionLimitError
+
+logger = logging.getLogger(__name__)
+
+# Slot states
+EMPTY = 0
+USED = 1
+# A removed session; lookups probe past it, inserts may reuse it
+DELETED = 2
+
+# Text fields are stored as UTF-8 truncated to this many bytes
+TEXT_BYTES = 64
+# Locks guarding the slots; slot i is guarded by lock i % LOCK_STRIPES. One
+# more lock after the stripes guards the counters
+LOCK_STRIPES = 16
+_COUNT_LOCK = LOCK_STRIPES
+# Seconds to wait for a lock before checking whether its holder has died
+LOCK_TIMEOUT = 1.0
+# The table is rehashed once this fraction of its slots are DELETED, as
+# lookups for absent sessions probe past every DELETED slot
+MAX_DELETED_FRACTION = 0.25
+
+SESSION_DTYPE = np.dtype([
+    ('state', np.uint8),
+    ('session_id', 'V16'),
+    ('meeting_id', f'S{TEXT_BYTES}'),
+    ('user_id', f'S{TEXT_BYTES}'),
+    ('user_name', f'S{TEXT_BYTES}'),
+    ('start_time', np.float64),  # wall clock, for the session duration
+    ('last_active', np.float64),  # time.monotonic(), which is system-wide on Linux
+    ('frames', np.uint64),
+    ('score_sum', np.float64),
+    ('focused_frames', np.uint64)
+], align=True)  # aligned, so 8-byte fields are written in one piece
+
+# Counters shared by every process, in a small array after the slots. The
+# generation is odd while a compaction is copying the rehashed slots into place
+_ACTIVE, _EXPIRED, _REJECTED, _DELETED, _GENERATION = range(5)
+_COUNTERS = 5
+
+
+def _key(session_id):
+    """16-byte key of a session ID, or None unless it is a UUID in canonical form.
+
+    Only the form create_session hands out is accepted, so the caller's own
+    per-session state is keyed by the same string as the table.
+    """
+    try:
+        key = uuid.UUID(str(session_id))
+    except ValueError:
+        return None
+    return key.bytes if str(key) == session_id else None
+
+
+def _text(value):
+    return str(value).encode('utf-8')[:TEXT_BYTES]
+
+
+def _untext(value):
+    return bytes(value).decode('utf-8', 'ignore')
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class SharedSessionTable(SessionRegistry):
+    """Session registry in shared memory, valid in every forked worker process.
+
+    The table is a structured numpy array in a multiprocessing SharedMemory
+    block, created before the server forks its workers, so a session started
+    on one worker can be validated and updated by any other without a
+    network hop. Slots are found by open addressing (linear probing from the
+    session ID's hash) in a table twice the size of max_sessions. Every read
+    or update of a slot takes the lock of the slot's stripe and checks the
+    slot still holds the key; the probe itself reads without locking, which
+    is safe because a slot's state is set to USED only after its fields are
+    written and to DELETED before the slot is reused.
+
+    Removed sessions leave DELETED slots, which inserts reuse. Once more
+    than MAX_DELETED_FRACTION of the slots are DELETED, add() rehashes the
+    sessions under every lock into a spare copy of the slots, then copies
+    the spare into place; the generation counter tells unlocked probes to
+    look again once the slots have moved.
+
+    A worker killed inside a critical section (gunicorn's SIGKILL of a hung
+    worker) never releases its lock. Each lock records its holder's pid, and
+    a process finding the lock held by an exited process takes it over. The
+    slot it was writing is left as it was. A compaction killed before the
+    generation turned odd leaves the live slots untouched; one killed after
+    it leaves a complete spare, and the next process to find the generation
+    odd takes over the locks and finishes the copy.
+
+    The pid is recorded just after a lock is acquired and cleared just
+    before it is released. A process killed between the two steps leaves
+    the lock held with no owner, which is never taken over: the window is
+    a few bytecodes, against a critical section that runs to completion.
+
+    Expiry scans last_active with numpy instead of keeping a heap, as the
+    heap would have to be shared too. Only fixed-size fields are shared: the
+    tracker's SessionState stays in the process that analyses the frames.
+    Offers the same interface as SessionRegistry.
+    """
+    def __init__(self, ttl=SESSION_TTL, max_sessions=MAX_SESSIONS, reap_interval=REAP_INTERVAL, on_evict=None):
+        super().__init__(ttl, max_sessions, reap_interval, on_evict)
+        self.capacity = 2 * max(1, max_sessions)
+        slots_size = self.capacity * SESSION_DTYPE.itemsize
+        size = 2 * slots_size + (_COUNTERS + LOCK_STRIPES + 1) * 8
+        self._shm = shared_memory.SharedMemory(create=True, size=size)
+        self._slots = np.ndarray(self.capacity, dtype=SESSION_DTYPE, buffer=self._shm.buf)
+        self._slots[:] = np.zeros(1, dtype=SESSION_DTYPE)
+        # Where a compaction rehashes the sessions before copying them into place
+        self._spare = np.ndarray(self.capacity, dtype=SESSION_DTYPE, buffer=self._shm.buf, offset=slots_size)
+        # Field views, to skip the field lookup on every probe
+        self._states = self._slots['state']
+        self._ids = self._slots['session_id']
+        self._last_active_times = self._slots['last_active']
+        self._counters = np.ndarray(_COUNTERS, dtype=np.int64, buffer=self._shm.buf, offset=2 * slots_size)
+        self._counters[:] = 0
+        # pid holding each lock, 0 while it is free
+        self._owners = np.ndarray(LOCK_STRIPES + 1, dtype=np.int64, buffer=self._shm.buf, offset=2 * slots_size + _COUNTERS * 8)
+        self._owners[:] = 0
+        self._locks = [multiprocessing.Lock() for _ in range(LOCK_STRIPES + 1)]
+        self._recovery_lock = multiprocessing.Lock()
+        # Sessions this process has handed to the caller, to release their
+        # local state when another process removes them
+        self._local = set()
+        self._owner = multiprocessing.current_process().pid
+        atexit.register(self._release)
+
+    def _release(self):
+        self.stop()
+        self._slots = self._spare = self._counters = self._owners = None
+        self._states = self._ids = self._last_active_times = None
+        self._shm.close()
+        if multiprocessing.current_process().pid == self._owner:
+            self._shm.unlink()
+
+    def _take_over(self, number):
+        """Claim a lock whose recorded holder has exited; True if this process now holds it"""
+        with self._recovery_lock:
+            holder = int(self._owners[number])
+            if holder and not _pid_alive(holder):
+                # Still acquired, now on behalf of this process
+                logger.warning(f"Taking over session table lock {number} from exited process {holder}")
+                self._owners[number] = os.getpid()
+                return True
+        return False
+
+    def _acquire_lock(self, number):
+        lock = self._locks[number]
+        # The holder is checked straight away, so a process taking over every
+        # lock of a dead compaction does not wait LOCK_TIMEOUT for each
+        acquired = lock.acquire(block=False)
+        while not acquired and not self._take_over(number):
+            acquired = lock.acquire(timeout=LOCK_TIMEOUT)
+        self._owners[number] = os.getpid()
+
+    def _release_lock(self, number):
+        self._owners[number] = 0
+        self._locks[number].release()
+
+    @contextmanager
+    def _locked(self, number):
+        self._acquire_lock(number)
+        try:
+            yield
+        finally:
+            self._release_lock(number)
+
+    def _probe(self, key):
+        """Slot indexes in probe order for a key"""
+        start = int.from_bytes(key[:8], 'little') % self.capacity
+        for step in range(self.capacity):
+            yield (start + step) % self.capacity
+
+    def _scan(self, key):
+        states, ids = self._states, self._ids
+        for index in self._probe(key):
+            state = states[index]
+            if state == EMPTY:
+                return None
+            if state == USED and ids[index].tobytes() == key:
+                return index
+        return None
+
+    def _generation(self):
+        """The current generation, after waiting for (or finishing) any compaction under way"""
+        generation = self._counters[_GENERATION]
+        while generation % 2:
+            self._finish_compaction()
+            generation = self._counters[_GENERATION]
+        return generation
+
+    def _find(self, key):
+        """Index of the key's slot, or None"""
+        while True:
+            generation = self._generation()
+            index = self._scan(key)
+            # Look again if a compaction moved the slots during the scan
+            if self._counters[_GENERATION] == generation:
+                return index
+
+    @contextmanager
+    def _slot(self, session_id):
+        """Yields the index of the session's slot with its stripe locked, or None"""
+        key = _key(session_id)
+        while True:
+            index = self._find(key) if key is not None else None
+            if index is None:
+                yield None
+                return
+            with self._locked(index % LOCK_STRIPES):
+                # Not removed, or moved by a compaction, since the lookup. An
+                # odd generation here means the compacting process died
+                if (self._counters[_GENERATION] % 2 == 0
+                        and self._states[index] == USED and self._ids[index].tobytes() == key):
+                    yield index
+                    return
+
+    @contextmanager
+    def _all_locked(self):
+        for number in range(LOCK_STRIPES + 1):
+            self._acquire_lock(number)
+        try:
+            yield
+        finally:
+            for number in reversed(range(LOCK_STRIPES + 1)):
+                self._release_lock(number)
+
+    def _rehash(self):
+        """Write the sessions, rehashed without DELETED slots, into the spare slots"""
+        spare = self._spare
+        spare[:] = np.zeros(1, dtype=SESSION_DTYPE)
+        used = self._slots[self._states == USED]
+        for row in used:
+            for index in self._probe(row['session_id'].tobytes()):
+                if spare[index]['state'] == EMPTY:
+                    spare[index] = row
+                    break
+        return len(used)
+
+    def _copy_spare(self):
+        """Copy the rehashed slots into place and end the compaction.
+
+        Only runs with the generation odd, and can be repeated: if the
+        process dies part way, the next one to see the odd generation runs
+        it again from the start.
+        """
+        self._slots[:] = self._spare
+        self._counters[_DELETED] = 0
+        self._counters[_GENERATION] += 1
+
+    def _compact(self):
+        """Rehash the sessions, turning every DELETED slot EMPTY"""
+        with self._all_locked():
+            # Another process may have compacted while this one waited
+            if self._counters[_DELETED] <= self.capacity * MAX_DELETED_FRACTION:
+                return
+            # A process killed while rehashing leaves the live slots as they were
+            count = self._rehash()
+            self._counters[_GENERATION] += 1
+            self._copy_spare()
+        logger.info(f"Compacted session table: {count} sessions in {self.capacity} slots")
+
+    def _finish_compaction(self):
+        """Wait for a compaction under way, finishing it if its process died"""
+        with self._all_locked():
+            if self._counters[_GENERATION] % 2:
+                logger.warning("Finishing a session table compaction left by an exited process")
+                self._copy_spare()
+
+    def add(self, session_id, info):
+        key = _key(session_id)
+        if key is None:
+            raise ValueError(f"Session ID {session_id} is not a canonical UUID")
+        self.start_reaper()
+        if self._counters[_ACTIVE] >= self.max_sessions:
+            self.reap()
+        with self._locked(_COUNT_LOCK):
+            if self._counters[_ACTIVE] >= self.max_sessions:
+                self._counters[_REJECTED] += 1
+                raise SessionLimitError(f"Too many active sessions (limit {self.max_sessions})")
+            self._counters[_ACTIVE] += 1
+        if self._counters[_DELETED] > self.capacity * MAX_DELETED_FRACTION:
+            self._compact()
+
+        now = time.monotonic()
+        while True:
+            generation = self._generation()
+            for index in self._probe(key):
+                with self._locked(index % LOCK_STRIPES):
+                    # A compaction ran during the probe: start it again
+                    if self._counters[_GENERATION] != generation:
+                        break
+                    slot = self._slots[index]
+                    reused = slot['state'] == DELETED
+                    if slot['state'] == USED:
+                        continue
+                    # Write the fields, then publish the slot
+                    slot['session_id'] = np.void(key)
+                    slot['meeting_id'] = _text(info.get('meeting_id', ''))
+                    slot['user_id'] = _text(info.get('user_id', ''))
+                    slot['user_name'] = _text(info.get('user_name', ''))
+                    slot['start_time'] = time.time()
+                    slot['last_active'] = now
+                    slot['frames'] = 0
+                    slot['score_sum'] = 0.0
+                    slot['focused_frames'] = 0
+                    slot['state'] = USED
+                if reused:
+                    with self._locked(_COUNT_LOCK):
+                        self._counters[_DELETED] -= 1
+                self._local.add(session_id)
+                return
+            else:
+                # Unreachable while the table is twice max_sessions
+                with self._locked(_COUNT_LOCK):
+                    self._counters[_ACTIVE] -= 1
+                raise SessionLimitError("Session table is full")
+
+    def _info(self, index):
+        slot = self._slots[index]
+        return {
+            'meeting_id': _untext(slot['meeting_id']),
+            'user_id': _untext(slot['user_id']),
+            'user_name': _untext(slot['user_name']),
+            'start_time': datetime.fromtimestamp(float(slot['start_time'])).isoformat(),
+            'frames': int(slot['frames']),
+            'score_sum': float(slot['score_sum']),
+            'focused_frames': int(slot['focused_frames'])
+        }
+
+    def touch(self, session_id):
+        with self._slot(session_id) as index:
+            if index is None:
+                return None
+            self._last_active_times[index] = time.monotonic()
+            info = self._info(index)
+        self._local.add(session_id)
+        return info
+
+    def record(self, session_id, score, focused):
+        with self._slot(session_id) as index:
+            if index is None:
+                return
+            slot = self._slots[index]
+            slot['frames'] += 1
+            slot['score_sum'] += score
+            slot['focused_frames'] += int(bool(focused))
+
+    def get(self, session_id, default=None):
+        with self._slot(session_id) as index:
+            return self._info(index) if index is not None else default
+
+    def _deleted(self, count=1):
+        with self._locked(_COUNT_LOCK):
+            self._counters[_ACTIVE] -= count
+            self._counters[_DELETED] += count
+
+    def remove(self, session_id):
+        self._local.discard(session_id)
+        with self._slot(session_id) as index:
+            if index is None:
+                return None
+            info = self._info(index)
+            self._states[index] = DELETED
+        self._deleted()
+        return info
+
+    def reap(self, now=None):
+        cutoff = (time.monotonic() if now is None else now) - self.ttl
+        states, ids, last_active = self._states, self._ids, self._last_active_times
+        expired = []
+        generation = self._generation()
+        for index in np.flatnonzero((states == USED) & (last_active <= cutoff)):
+            key = ids[index].tobytes()
+            with self._locked(index % LOCK_STRIPES):
+                # Touched, removed or moved since the scan: leave it
+                if (self._counters[_GENERATION] != generation or states[index] != USED
+                        or ids[index].tobytes() != key or last_active[index] > cutoff):
+                    continue
+                info = self._info(index)
+                states[index] = DELETED
+            expired.append((str(uuid.UUID(bytes=key)), info))
+        if expired:
+            self._deleted(len(expired))
+            with self._locked(_COUNT_LOCK):
+                self._counters[_EXPIRED] += len(expired)
+
+        evicted = [(session_id, info, 'expired') for session_id, info in expired]
+        self._local.difference_update(session_id for session_id, _ in expired)
+        # Sessions this process served that another process stopped or expired
+        gone = [session_id for session_id in list(self._local) if session_id not in self]
+        self._local.difference_update(gone)
+        evicted += [(session_id, None, 'closed') for session_id in gone]
+        for session_id, info, reason in evicted:
+            if reason == 'expired':
+                logger.info(f"Evicted session {session_id} after {self.ttl:.0f}s without frames")
+            if self.on_evict is not None:
+                try:
+                    self.on_evict(session_id, info, reason)
+                except Exception as e:
+                    logger.error(f"Error evicting session {session_id}: {str(e)}")
+        return len(expired)
+
+    def stats(self):
+        return {
+            'active': int(self._counters[_ACTIVE]),
+            'maxSessions': self.max_sessions,
+            'ttlSeconds': self.ttl,
+            'evicted': {'expired': int(self._counters[_EXPIRED])},
+            'rejected': int(self._counters[_REJECTED]),
+            'shared': True
+        }
+
+    def __contains__(self, session_id):
+        key = _key(session_id)
+        return key is not None and self._find(key) is not None
+
+    def __len__(self):
+        return int(self._counters[_ACTIVE])
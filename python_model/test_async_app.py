@@ -0,0 +1,99 @@
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from aiohttp.test_utils import TestClient, TestServer
+
+import async_app
+from async_app import LatestFrameScheduler
+
+
+@pytest.fixture
+def executor():
+    executor = ThreadPoolExecutor(max_workers=2)
+    yield executor
+    executor.shutdown(wait=True)
+
+
+def test_newer_frame_replaces_the_waiting_one(executor):
+    release = threading.Event()
+    analyzed = []
+
+    def analyze(session_id, frame):
+        if frame == 1:
+            release.wait(5)
+        analyzed.append(frame)
+        return frame * 10
+
+    async def run():
+        scheduler = LatestFrameScheduler(analyze, executor)
+        first = asyncio.ensure_future(scheduler.submit('a', 1))
+        await asyncio.sleep(0.05)
+        second = asyncio.ensure_future(scheduler.submit('a', 2))
+        await asyncio.sleep(0)
+        third = asyncio.ensure_future(scheduler.submit('a', 3))
+        await asyncio.sleep(0.05)
+        release.set()
+        return await asyncio.gather(first, second, third), scheduler
+
+    results, scheduler = asyncio.run(run())
+    assert results == [10, None, 30]
+    assert analyzed == [1, 3]
+    assert scheduler.analyzed == 2 and scheduler.superseded == 1
+    assert scheduler.stats()['activeSessions'] == 0
+
+
+def test_sessions_do_not_supersede_each_other(executor):
+    async def run():
+        scheduler = LatestFrameScheduler(lambda session_id, frame: (session_id, frame), executor)
+        results = await asyncio.gather(*(scheduler.submit(session_id, 1) for session_id in 'abc'))
+        return results, scheduler
+
+    results, scheduler = asyncio.run(run())
+    assert results == [('a', 1), ('b', 1), ('c', 1)]
+    assert scheduler.superseded == 0
+
+
+def test_analysis_error_reaches_the_caller(executor):
+    def analyze(session_id, frame):
+        if frame == 'bad':
+            raise ValueError('bad frame')
+        return frame
+
+    async def run():
+        scheduler = LatestFrameScheduler(analyze, executor)
+        with pytest.raises(ValueError):
+            await scheduler.submit('a', 'bad')
+        # The session keeps working after a failed frame
+        return await scheduler.submit('a', 'good')
+
+    assert asyncio.run(run()) == 'good'
+
+
+def test_a_slow_session_lookup_does_not_block_the_loop(monkeypatch):
+    def slow_lookup(session_id):
+        # A shared session table waiting on a contended lock
+        time.sleep(0.5)
+        return None, 'Invalid session ID', 400
+    monkeypatch.setattr(async_app.service, 'lookup_session', slow_lookup)
+
+    async def run():
+        gaps = []
+
+        async def tick():
+            while True:
+                start = time.perf_counter()
+                await asyncio.sleep(0.01)
+                gaps.append(time.perf_counter() - start)
+
+        async with TestClient(TestServer(async_app.create_app(analysis_threads=1))) as client:
+            ticker = asyncio.ensure_future(tick())
+            response = await client.post('/analyze-frame', json={'sessionId': 'x', 'frame': 'abc'})
+            ticker.cancel()
+            return max(gaps), response.status, await response.json()
+
+    longest_gap, status, body = asyncio.run(run())
+    assert longest_gap < 0.25
+    assert status == 400 and body['message'] == 'Invalid session ID'
@@ -0,0 +1,82 @@
+import threading
+
+import pytest
+
+from batch_scheduler import BatchScheduler
+
+
+class FakeTracker:
+    """Records batch sizes; the first batch waits until every frame is queued"""
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.batches = []
+        self.release = threading.Event()
+
+    def process_batch(self, frames, states, scales, timings):
+        self.release.wait(5)
+        self.batches.append(len(frames))
+        if self.fail:
+            raise RuntimeError('detector failed')
+        for timing in timings:
+            if timing is not None:
+                timing['batch'] = len(frames)
+        return [{'frame': frame, 'state': state, 'scale': scale} for frame, state, scale in zip(frames, states, scales)]
+
+    def _error_result(self, e):
+        return {'success': False, 'message': str(e)}
+
+
+@pytest.fixture
+def make_scheduler():
+    schedulers = []
+
+    def make(tracker, **kwargs):
+        scheduler = BatchScheduler(tracker, **kwargs)
+        schedulers.append(scheduler)
+        return scheduler
+    yield make
+    for scheduler in schedulers:
+        scheduler.shutdown()
+
+
+def test_frames_are_grouped_up_to_the_batch_size(make_scheduler):
+    tracker = FakeTracker()
+    scheduler = make_scheduler(tracker, max_batch_size=4, max_wait_ms=50)
+    timings = [{} for _ in range(10)]
+    futures = [scheduler.submit(index, f"state{index}", 0.5, timings[index]) for index in range(10)]
+    tracker.release.set()
+
+    results = [future.result(timeout=5) for future in futures]
+    assert [result['frame'] for result in results] == list(range(10))
+    assert results[3] == {'frame': 3, 'state': 'state3', 'scale': 0.5}
+    # The first frame may be taken alone before the rest are queued
+    assert tracker.batches in ([4, 4, 2], [1, 4, 4, 1])
+    assert all(max(tracker.batches) >= timing['batch'] for timing in timings)
+
+    stats = scheduler.stats()
+    assert stats['frames'] == 10 and stats['batches'] == len(tracker.batches)
+    assert stats['queueDepth'] == 0
+    assert set(stats['latencyMs']) == {'p50', 'p95', 'p99'}
+
+
+def test_a_lone_frame_waits_at_most_max_wait(make_scheduler):
+    tracker = FakeTracker()
+    tracker.release.set()
+    scheduler = make_scheduler(tracker, max_batch_size=16, max_wait_ms=20)
+    assert scheduler.analyze('only', 'state')['frame'] == 'only'
+    assert tracker.batches == [1]
+
+
+def test_a_failed_batch_answers_every_frame(make_scheduler):
+    tracker = FakeTracker(fail=True)
+    tracker.release.set()
+    scheduler = make_scheduler(tracker, max_batch_size=4, max_wait_ms=50)
+    futures = [scheduler.submit(index, None) for index in range(3)]
+    results = [future.result(timeout=5) for future in futures]
+    assert results == [{'success': False, 'message': 'detector failed'}] * 3
+
+
+def test_shutdown_stops_the_thread(make_scheduler):
+    scheduler = make_scheduler(FakeTracker(), max_wait_ms=1)
+    scheduler.shutdown()
+    assert not scheduler._thread.is_alive()
@@ -1,6 +1,6 @@
 import cv2
 import numpy as np
-from app import FocusTracker
+from focus_tracker import FocusTracker
 import time
 import logging
 
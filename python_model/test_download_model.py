@@ -0,0 +1,120 @@
+import os
+import bz2
+import hashlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import download_model
+
+MODEL = os.urandom(50000) * 8
+# Two concatenated streams, as written by parallel compressors such as pbzip2
+FIRST_STREAM = bz2.compress(MODEL[:200000])
+COMPRESSED = FIRST_STREAM + bz2.compress(MODEL[200000:])
+MODEL_SHA256 = hashlib.sha256(MODEL).hexdigest()
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """Serves COMPRESSED with Range support; cut_after drops the next response early"""
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        start = 0
+        requested = self.headers.get('Range')
+        server.ranges.append(requested)
+        if requested:
+            start = int(requested.split('=')[1].rstrip('-'))
+            if start >= len(COMPRESSED):
+                self.send_response(416)
+                self.end_headers()
+                return
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{len(COMPRESSED) - 1}/{len(COMPRESSED)}')
+        else:
+            self.send_response(200)
+        body = COMPRESSED[start:]
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if server.cut_after:
+            self.wfile.write(body[:server.cut_after])
+            server.cut_after = None
+            self.wfile.flush()
+            self.connection.shutdown(2)
+            return
+        self.wfile.write(body)
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), RangeHandler)
+    server.ranges = []
+    server.cut_after = None
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/model.dat.bz2"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def model_path(tmp_path):
+    return str(tmp_path / 'model.dat')
+
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def test_download_decompresses_and_verifies(server, model_path):
+    assert download_model.download_shape_predictor(server.url, model_path, MODEL_SHA256, chunk_size=4096)
+    assert read(model_path) == MODEL
+    assert download_model.is_verified(model_path, MODEL_SHA256)
+    assert not os.path.exists(model_path + '.bz2.part')
+    assert not os.path.exists(model_path + '.tmp')
+
+
+# Cutting right after the first stream leaves valid bz2 data, so only the length shows it is short
+@pytest.mark.parametrize('cut_after', [len(FIRST_STREAM) // 2, len(FIRST_STREAM)])
+def test_interrupted_download_resumes_from_the_part_file(server, model_path, cut_after):
+    server.cut_after = cut_after
+    assert not download_model.download_shape_predictor(server.url, model_path, MODEL_SHA256, chunk_size=4096)
+    kept = os.path.getsize(model_path + '.bz2.part')
+    assert 0 < kept < len(COMPRESSED)
+    assert not os.path.exists(model_path)
+
+    assert download_model.download_shape_predictor(server.url, model_path, MODEL_SHA256, chunk_size=4096)
+    assert server.ranges == [None, f'bytes={kept}-']
+    assert read(model_path) == MODEL
+
+
+def test_stale_part_past_the_end_starts_over(server, model_path):
+    with open(model_path + '.bz2.part', 'wb') as part:
+        part.write(COMPRESSED + b'stale')
+    assert download_model.download_shape_predictor(server.url, model_path, MODEL_SHA256)
+    assert server.ranges == [f'bytes={len(COMPRESSED) + 5}-', None]
+    assert read(model_path) == MODEL
+
+
+def test_checksum_mismatch_discards_the_download(server, model_path):
+    assert not download_model.download_shape_predictor(server.url, model_path, '0' * 64)
+    assert not os.path.exists(model_path)
+    assert not os.path.exists(model_path + '.bz2.part')
+    assert not os.path.exists(model_path + '.tmp')
+
+
+def test_ensure_model_skips_a_verified_file(server, model_path):
+    assert download_model.ensure_model(server.url, model_path, MODEL_SHA256)
+    assert download_model.ensure_model(server.url, model_path, MODEL_SHA256)
+    assert len(server.ranges) == 1
+
+    # A changed file no longer matches its marker and is downloaded again
+    with open(model_path, 'ab') as f:
+        f.write(b'x')
+    assert download_model.ensure_model(server.url, model_path, MODEL_SHA256)
+    assert len(server.ranges) == 2
+    assert read(model_path) == MODEL
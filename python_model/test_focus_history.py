@@ -0,0 +1,120 @@
+import time
+
+import pytest
+
+from focus_history import FocusHistory, RollupTier, TieredFocusHistory
+
+
+def test_window_keeps_only_recent_entries():
+    history = FocusHistory(window=10, capacity=100)
+    start = time.monotonic() - 100
+    for second in range(20):
+        history.append(second * 5.0, second % 2 == 0, now=start + second)
+
+    # Entries older than 10 seconds before the last append are gone
+    assert len(history) == 10
+    assert history.score_sum == pytest.approx(sum(second * 5.0 for second in range(10, 20)))
+    assert history.focused_count == 5
+
+
+def test_capacity_drops_the_oldest_entry():
+    history = FocusHistory(window=1000, capacity=4)
+    now = time.monotonic()
+    for score in (10, 20, 30, 40, 50, 60):
+        history.append(score, score >= 40, now=now)
+    assert len(history) == 4
+    assert history.average() == pytest.approx(45.0)
+    assert history.focus_percentage() == pytest.approx(75.0)
+
+
+def test_session_totals_outlive_the_window():
+    history = FocusHistory(window=5, capacity=10)
+    start = time.monotonic() - 1000
+    for second in range(30):
+        history.append(60.0 if second < 15 else 20.0, second < 15, now=start + second)
+
+    history.expire()
+    assert len(history) == 0
+    assert history.average() == 0 and history.focus_percentage() == 0
+    assert history.total_count == 30
+    assert history.session_average() == pytest.approx(40.0)
+    assert history.session_focus_percentage() == pytest.approx(50.0)
+
+
+def test_running_sums_match_a_scan_after_wrapping():
+    history = FocusHistory(window=50, capacity=16)
+    start = time.monotonic() - 1000
+    samples = [((index * 37) % 101, index % 3 == 0) for index in range(200)]
+    for index, (score, focused) in enumerate(samples):
+        history.append(score, focused, now=start + index * 0.5)
+
+    window = samples[-len(history):]
+    assert len(history) == 16
+    assert history.score_sum == pytest.approx(sum(score for score, _ in window))
+    assert history.focused_count == sum(focused for _, focused in window)
+
+
+def test_empty_history():
+    history = FocusHistory()
+    assert len(history) == 0
+    assert history.average() == 0 and history.focus_percentage() == 0
+    assert history.session_average() == 0 and history.session_focus_percentage() == 0
+
+
+def _brute_window(samples, seconds, now, width=None):
+    """(count, sum, focused) of samples in the window, with whole buckets if width is given"""
+    if width is None:
+        chosen = [(score, focused) for when, score, focused in samples if when > now - seconds]
+    else:
+        first = (now - seconds) // width
+        chosen = [(score, focused) for when, score, focused in samples if when // width >= first]
+    return len(chosen), sum(score for score, _ in chosen), sum(focused for _, focused in chosen)
+
+
+def _focused_percentage(samples):
+    return sum(focused for _, _, focused in samples) / len(samples) * 100
+
+
+def test_tiers_serve_each_window_from_the_finest_covering_tier():
+    history = TieredFocusHistory(raw_seconds=60, raw_capacity=1000, second_buckets=900, minute_buckets=1440)
+    start = 1000.0
+    samples = []
+    # Two hours at 2 fps
+    for index in range(2 * 3600 * 2):
+        when = start + index * 0.5
+        score = (index * 37) % 101
+        samples.append((when, score, score >= 40))
+        history.append(score, score >= 40, now=when)
+    now = samples[-1][0]
+
+    for seconds, width in ((30, None), (60, None), (600, 1), (3600, 60), (5400, 60)):
+        count, score_sum, focused = history.window(seconds, now)
+        expected = _brute_window(samples, seconds, now, width)
+        assert (count, focused) == (expected[0], expected[2])
+        assert score_sum == pytest.approx(expected[1])
+
+    # Memory is bounded by the tiers, not the session
+    assert len(history.raw) == 120
+    assert history.seconds.counts.size == 900 and history.minutes.counts.size == 1440
+    assert history.total_count == len(samples)
+    assert history.session_average() == pytest.approx(sum(score for _, score, _ in samples) / len(samples))
+
+    stats = history.window_stats(60, now)
+    assert stats['samples'] == 120
+    assert stats['focus_percentage'] == pytest.approx(_focused_percentage(samples[-120:]))
+
+
+def test_rollup_buckets_older_than_the_retention_are_dropped():
+    tier = RollupTier(1, 10)
+    for second in range(25):
+        tier.add(second + 0.5, 1.0, True)
+    assert tier.window(100, 24.9) == (10, 10.0, 10)
+    assert tier.window(3, 24.9) == (4, 4.0, 4)
+    # Nothing arrived for a while: old buckets in the ring are not counted
+    assert tier.window(5, 40.0) == (0, 0.0, 0)
+
+
+def test_empty_tiered_history():
+    history = TieredFocusHistory()
+    assert history.total_count == 0
+    assert history.window_stats(3600) == {'samples': 0, 'average_score': 0.0, 'focus_percentage': 0.0}
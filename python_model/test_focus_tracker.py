@@ -0,0 +1,92 @@
+import time
+import threading
+
+import numpy as np
+import pytest
+
+from image_utils import synthetic_frame
+import focus_tracker
+from focus_tracker import FocusTracker, SessionState
+
+
+@pytest.fixture(scope='module')
+def tracker():
+    return FocusTracker()
+
+
+def test_frames_of_one_session_are_analysed_one_at_a_time(tracker, monkeypatch):
+    state = SessionState()
+    active = []
+    overlaps = []
+    locate_face = tracker.locate_face
+
+    def slow_locate_face(gray, session):
+        active.append(session)
+        if active.count(session) > 1:
+            overlaps.append(session)
+        time.sleep(0.005)
+        try:
+            return locate_face(gray, session)
+        finally:
+            active.remove(session)
+    monkeypatch.setattr(tracker, 'locate_face', slow_locate_face)
+    # Every frame goes through detection instead of the change-detection gate
+    monkeypatch.setattr(tracker, 'reuse_threshold', 0)
+
+    frame = synthetic_frame(320, 240)
+    threads = [threading.Thread(target=lambda: [tracker.process_frame(frame, state) for _ in range(5)])
+               for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert overlaps == []
+    assert state.total_frames_processed == 20
+    assert not state.lock.locked()
+
+
+def test_batch_holds_each_session_lock_once(tracker):
+    first, second = SessionState(), SessionState()
+    frame = synthetic_frame(320, 240)
+    results = tracker.process_batch([frame, frame, frame], [first, second, first])
+    assert len(results) == 3
+    assert first.total_frames_processed == 2 and second.total_frames_processed == 1
+    assert not first.lock.locked() and not second.lock.locked()
+
+
+def test_a_sessions_frames_in_one_batch_match_sequential_analysis(tracker, monkeypatch):
+    monkeypatch.setattr(tracker, 'reuse_threshold', 0)
+    # The score carries a small random variation
+    monkeypatch.setattr(focus_tracker.random, 'uniform', lambda low, high: 0.0)
+    frames = [np.roll(synthetic_frame(320, 240, seed=seed), seed * 9, axis=1) for seed in range(4)]
+
+    sequential = SessionState()
+    expected = [tracker.process_frame(frame, sequential) for frame in frames]
+
+    batched, other = SessionState(), SessionState()
+    results = tracker.process_batch(frames + frames[:1], [batched] * 4 + [other])
+
+    strip = lambda result: {key: value for key, value in result.items() if key != 'timestamp'}
+    assert [strip(result) for result in results[:4]] == [strip(result) for result in expected]
+    assert list(batched.focus_history) == list(sequential.focus_history)
+    assert batched.prev_face_pos == sequential.prev_face_pos
+    assert strip(results[4]) == strip(expected[0])
+
+
+def test_each_frame_of_a_session_is_detected_after_the_previous_is_scored(tracker, monkeypatch):
+    monkeypatch.setattr(tracker, 'reuse_threshold', 0)
+    seen = []
+    locate_face = tracker.locate_face
+
+    def recording_locate_face(gray, state):
+        seen.append((state, len(state.focus_history)))
+        return locate_face(gray, state)
+    monkeypatch.setattr(tracker, 'locate_face', recording_locate_face)
+
+    first, second = SessionState(), SessionState()
+    frames = [synthetic_frame(320, 240, seed=seed) for seed in range(5)]
+    tracker.process_batch(frames, [first, second, first, first, second])
+
+    assert [count for state, count in seen if state is first] == [0, 1, 2]
+    assert [count for state, count in seen if state is second] == [0, 1]
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from landmark_features import NOSE_TIP, extract_features, face_stability, _scalar_features
+
+
+def _faces(count, seed=0):
+    """Noisy copies of a rough frontal face layout"""
+    rng = np.random.default_rng(seed)
+    template = np.stack([np.linspace(0, 200, 68), 100 + 40 * np.sin(np.linspace(0, 6, 68))], axis=1)
+    return template + rng.normal(0, 3, (count, 68, 2))
+
+
+def test_single_face_matches_per_point_code():
+    faces = _faces(200)
+    directions = set()
+    for points in faces:
+        prev_nose_tip = points[NOSE_TIP] + 5.0
+        ear, gaze_score, direction, head_pose, stability = _scalar_features(points, prev_nose_tip)
+        features = extract_features(points, prev_nose_tip)
+        assert features['avg_ear'] == pytest.approx(ear)
+        assert features['gaze_score'] == pytest.approx(gaze_score)
+        assert features['looking_direction'] == direction
+        assert features['head_pose_score'] == pytest.approx(head_pose)
+        assert features['face_stability'] == pytest.approx(stability)
+        directions.add(direction)
+    # The faces exercise more than the default direction
+    assert len(directions) > 1
+
+
+def test_stack_matches_single_faces():
+    faces = _faces(16, seed=1)
+    prev_nose_tips = faces[:, NOSE_TIP] + 1.0
+    stacked = extract_features(faces, prev_nose_tips)
+    for index, points in enumerate(faces):
+        single = extract_features(points, prev_nose_tips[index])
+        for name in ('avg_ear', 'gaze_score', 'head_pose_score', 'face_stability'):
+            assert stacked[name][index] == pytest.approx(single[name])
+        assert stacked['looking_direction'][index] == single['looking_direction']
+
+
+def test_single_face_returns_python_scalars():
+    features = extract_features(_faces(1)[0])
+    assert isinstance(features['avg_ear'], float)
+    assert isinstance(features['looking_direction'], str)
+    assert features['nose_tip'].shape == (2,)
+
+
+def test_face_stability_without_previous_position():
+    assert face_stability(np.array([10.0, 10.0]), None) == 1.0
+    assert face_stability(np.array([10.0, 10.0]), np.array([np.nan, np.nan])) == 1.0
+    assert face_stability(np.array([0.0, 0.0]), np.array([60.0, 80.0])) == 0.0
@@ -0,0 +1,54 @@
+import logging
+import threading
+
+from log_utils import ThrottledLogger
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def test_throttled_logger_counts_every_suppressed_call():
+    logger = logging.getLogger('test_log_utils.throttled')
+    logger.propagate = False
+    handler = ListHandler()
+    logger.addHandler(handler)
+    throttled = ThrottledLogger(logger, interval=3600)
+    barrier = threading.Barrier(8)
+
+    def spam():
+        barrier.wait()
+        for _ in range(2000):
+            throttled.warning('No face detected')
+    threads = [threading.Thread(target=spam) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # The interval has passed: the next message reports everything held back
+    throttled._next_time = 0.0
+    throttled.warning('No face detected')
+    logger.removeHandler(handler)
+
+    assert handler.messages == [
+        'No face detected',
+        f'No face detected ({8 * 2000 - 1} similar messages suppressed)'
+    ]
+
+
+def test_zero_interval_logs_every_call():
+    logger = logging.getLogger('test_log_utils.unthrottled')
+    logger.propagate = False
+    handler = ListHandler()
+    logger.addHandler(handler)
+    throttled = ThrottledLogger(logger, interval=0)
+    for number in range(3):
+        throttled.warning('frame %d', number)
+    logger.removeHandler(handler)
+    assert handler.messages == ['frame 0', 'frame 1', 'frame 2']
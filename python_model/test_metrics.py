@@ -0,0 +1,44 @@
+import pytest
+
+from metrics import Counter, Gauge, Histogram, Registry, _Metric
+
+
+def test_a_metric_missing_its_hooks_cannot_be_created():
+    class Incomplete(_Metric):
+        kind = 'counter'
+
+        def _samples(self):
+            return []
+
+    with pytest.raises(TypeError):
+        Incomplete('broken_total', 'Missing _new_child')
+
+
+def test_render_in_exposition_format():
+    registry = Registry()
+    frames = registry.register(Counter('frames_total', 'Frames', ['result']))
+    registry.register(Gauge('queue_depth', 'Queued frames', lambda: 3))
+    latency = registry.register(Histogram('stage_seconds', 'Stage time', ['stage'], buckets=(0.01, 0.1)))
+
+    frames.labels('ok').inc()
+    frames.labels('ok').inc(2)
+    frames.labels('say "hi"').inc()
+    for value in (0.005, 0.05, 0.5):
+        latency.labels('detect').observe(value)
+
+    assert registry.render().splitlines() == [
+        '# HELP frames_total Frames',
+        '# TYPE frames_total counter',
+        'frames_total{result="ok"} 3',
+        'frames_total{result="say \\"hi\\""} 1',
+        '# HELP queue_depth Queued frames',
+        '# TYPE queue_depth gauge',
+        'queue_depth 3',
+        '# HELP stage_seconds Stage time',
+        '# TYPE stage_seconds histogram',
+        'stage_seconds_bucket{stage="detect",le="0.01"} 1',
+        'stage_seconds_bucket{stage="detect",le="0.1"} 2',
+        'stage_seconds_bucket{stage="detect",le="+Inf"} 3',
+        'stage_seconds_count{stage="detect"} 3',
+        'stage_seconds_sum{stage="detect"} 0.555',
+    ]
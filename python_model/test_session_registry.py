@@ -0,0 +1,129 @@
+import time
+import threading
+
+import pytest
+
+import session_registry
+from session_registry import SessionRegistry, SessionLimitError
+
+
+class Clock:
+    """Stand-in for time.monotonic that only moves when told to"""
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(session_registry.time, 'monotonic', clock)
+    return clock
+
+
+def test_sessions_expire_after_ttl(clock):
+    evicted = []
+    registry = SessionRegistry(ttl=10, reap_interval=0, on_evict=lambda *args: evicted.append(args))
+    registry.add('a', {'user_name': 'A'})
+    registry.add('b', {'user_name': 'B'})
+
+    clock.now += 6
+    assert registry.touch('a')['user_name'] == 'A'
+    clock.now += 6
+    assert registry.reap() == 1
+
+    assert 'a' in registry and 'b' not in registry
+    assert evicted == [('b', {'user_name': 'B', 'frames': 0, 'score_sum': 0.0, 'focused_frames': 0}, 'expired')]
+    assert registry.stats()['evicted'] == {'expired': 1}
+
+    clock.now += 10
+    assert registry.reap() == 1
+    assert len(registry) == 0
+
+
+def test_touched_session_is_pushed_back_on_the_heap(clock):
+    registry = SessionRegistry(ttl=10, reap_interval=0)
+    registry.add('a', {})
+    for _ in range(5):
+        clock.now += 8
+        registry.touch('a')
+        assert registry.reap() == 0
+    assert 'a' in registry
+
+
+def test_removed_session_is_not_evicted(clock):
+    evicted = []
+    registry = SessionRegistry(ttl=10, reap_interval=0, on_evict=lambda *args: evicted.append(args))
+    registry.add('a', {'user_name': 'A'})
+    assert registry.remove('a')['user_name'] == 'A'
+    assert registry.remove('a') is None
+    clock.now += 20
+    assert registry.reap() == 0
+    assert evicted == []
+    assert registry.touch('a') is None
+
+
+def test_full_registry_reaps_before_refusing(clock):
+    registry = SessionRegistry(ttl=10, max_sessions=2, reap_interval=0)
+    registry.add('a', {})
+    registry.add('b', {})
+    with pytest.raises(SessionLimitError):
+        registry.add('c', {})
+    assert registry.stats()['rejected'] == 1
+
+    clock.now += 11
+    registry.add('c', {})
+    assert list(registry._sessions) == ['c']
+
+
+def test_record_updates_the_aggregates():
+    registry = SessionRegistry(reap_interval=0)
+    registry.add('a', {})
+    registry.record('a', 80.0, True)
+    registry.record('a', 20.0, False)
+    registry.record('missing', 50.0, True)
+    info = registry.get('a')
+    assert (info['frames'], info['score_sum'], info['focused_frames']) == (2, 100.0, 1)
+
+
+def test_reaper_thread_evicts_idle_sessions():
+    registry = SessionRegistry(ttl=0.05, reap_interval=0.02)
+    registry.start_reaper()
+    registry.add('a', {})
+    try:
+        deadline = time.monotonic() + 2
+        while 'a' in registry and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert 'a' not in registry
+    finally:
+        registry.stop()
+
+
+def test_concurrent_first_adds_start_one_reaper(monkeypatch):
+    started = []
+
+    class SlowStartThread(threading.Thread):
+        def start(self):
+            # Widen the window between the liveness check and the start
+            time.sleep(0.01)
+            started.append(self)
+            super().start()
+    monkeypatch.setattr(session_registry.threading, 'Thread', SlowStartThread)
+
+    registry = SessionRegistry(reap_interval=60)
+    barrier = threading.Barrier(8)
+
+    def add(index):
+        barrier.wait()
+        registry.add(f"s{index}", {})
+    adders = [threading.Thread(target=add, args=(index,)) for index in range(8)]
+    for thread in adders:
+        thread.start()
+    for thread in adders:
+        thread.join()
+    registry.stop()
+
+    reapers = [thread for thread in started if thread.name == 'session-reaper']
+    assert len(reapers) == 1 and len(registry) == 8
@@ -0,0 +1,228 @@
+import os
+import time
+import uuid
+import atexit
+import signal
+import multiprocessing
+
+import pytest
+
+import session_table
+from session_table import DELETED, LOCK_STRIPES, MAX_DELETED_FRACTION, SharedSessionTable
+from session_registry import SessionLimitError
+
+fork = multiprocessing.get_context('fork')
+
+
+@pytest.fixture
+def make_table():
+    tables = []
+
+    def make(**kwargs):
+        kwargs.setdefault('reap_interval', 0)
+        table = SharedSessionTable(**kwargs)
+        tables.append(table)
+        return table
+    yield make
+    for table in tables:
+        atexit.unregister(table._release)
+        table._release()
+
+
+def _colliding_ids(table, count):
+    """Session IDs that all hash to the same first slot"""
+    by_slot = {}
+    while True:
+        session_id = str(uuid.uuid4())
+        start = next(table._probe(uuid.UUID(session_id).bytes))
+        ids = by_slot.setdefault(start, [])
+        ids.append(session_id)
+        if len(ids) == count:
+            return ids
+
+
+def test_add_get_record_remove(make_table):
+    table = make_table(max_sessions=4)
+    session_id = str(uuid.uuid4())
+    table.add(session_id, {'meeting_id': 'm1', 'user_id': 7, 'user_name': 'Ana'})
+    table.record(session_id, 80.0, True)
+    table.record(session_id, 30.0, False)
+
+    info = table.touch(session_id)
+    assert (info['meeting_id'], info['user_id'], info['user_name']) == ('m1', '7', 'Ana')
+    assert (info['frames'], info['score_sum'], info['focused_frames']) == (2, 110.0, 1)
+    assert session_id in table and len(table) == 1
+
+    assert table.remove(session_id)['frames'] == 2
+    assert table.remove(session_id) is None
+    assert table.get(session_id) is None and len(table) == 0
+
+
+def test_only_canonical_ids_are_accepted(make_table):
+    table = make_table(max_sessions=4)
+    session_id = str(uuid.uuid4())
+    table.add(session_id, {})
+    assert table.touch(session_id.upper()) is None
+    assert table.touch('{%s}' % session_id) is None
+    assert 'not-a-uuid' not in table
+    with pytest.raises(ValueError):
+        table.add(session_id.replace('-', ''), {})
+
+
+def test_probing_past_deleted_slots_and_reusing_them(make_table):
+    table = make_table(max_sessions=4)
+    first, second, third = _colliding_ids(table, 3)
+    for session_id in (first, second, third):
+        table.add(session_id, {'user_name': session_id[:4]})
+    indexes = [table._find(uuid.UUID(session_id).bytes) for session_id in (first, second, third)]
+    assert indexes == [(indexes[0] + step) % table.capacity for step in range(3)]
+
+    table.remove(second)
+    assert table._states[indexes[1]] == DELETED
+    # Lookups continue past the deleted slot
+    assert table.get(third)['user_name'] == third[:4]
+
+    # A new colliding session takes the deleted slot
+    fourth = _colliding_ids(table, 1)[0]
+    while next(table._probe(uuid.UUID(fourth).bytes)) != indexes[0]:
+        fourth = _colliding_ids(table, 1)[0]
+    table.add(fourth, {})
+    assert table._find(uuid.UUID(fourth).bytes) == indexes[1]
+    assert table._counters[session_table._DELETED] == 0
+
+
+def test_churn_compacts_deleted_slots(make_table):
+    table = make_table(max_sessions=20)
+    kept = [str(uuid.uuid4()) for _ in range(10)]
+    for session_id in kept:
+        table.add(session_id, {})
+        table.record(session_id, 50.0, True)
+    for _ in range(500):
+        session_id = str(uuid.uuid4())
+        table.add(session_id, {})
+        table.remove(session_id)
+        assert (table._states == DELETED).sum() <= table.capacity * MAX_DELETED_FRACTION + 1
+    assert table._counters[session_table._GENERATION] > 0
+    assert all(table.get(session_id)['frames'] == 1 for session_id in kept)
+    assert len(table) == 10
+
+
+def test_limit_and_expiry(make_table):
+    evicted = []
+    table = make_table(ttl=10, max_sessions=2, on_evict=lambda *args: evicted.append(args[::2]))
+    first, second = str(uuid.uuid4()), str(uuid.uuid4())
+    table.add(first, {})
+    table.add(second, {})
+    with pytest.raises(SessionLimitError):
+        table.add(str(uuid.uuid4()), {})
+
+    assert table.reap(now=time.monotonic() + 11) == 2
+    assert sorted(evicted) == sorted([(first, 'expired'), (second, 'expired')])
+    assert table.stats()['evicted'] == {'expired': 2} and table.stats()['rejected'] == 1
+    table.add(str(uuid.uuid4()), {})
+
+
+def test_sessions_are_shared_with_forked_workers(make_table):
+    table = make_table(max_sessions=50)
+    ids = [str(uuid.uuid4()) for _ in range(40)]
+    added = fork.Barrier(2)
+
+    def worker(offset):
+        for session_id in ids[offset::2]:
+            table.add(session_id, {'user_name': str(offset)})
+        added.wait()
+        for _ in range(25):
+            for session_id in ids:
+                table.record(session_id, 1.0, True)
+
+    processes = [fork.Process(target=worker, args=(offset,)) for offset in range(2)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        assert process.exitcode == 0
+
+    assert len(table) == 40
+    assert sum(table.get(session_id)['frames'] for session_id in ids) == 2 * 25 * 40
+    assert table.get(ids[0])['user_name'] == '0' and table.get(ids[1])['user_name'] == '1'
+
+
+def test_session_removed_elsewhere_is_released_locally(make_table):
+    closed = []
+    table = make_table(max_sessions=4, on_evict=lambda *args: closed.append(args[::2]))
+    session_id = str(uuid.uuid4())
+    table.add(session_id, {})
+    process = fork.Process(target=table.remove, args=(session_id,))
+    process.start()
+    process.join()
+    table.reap()
+    assert closed == [(session_id, 'closed')]
+
+
+def test_lock_of_a_killed_process_is_taken_over(make_table, monkeypatch):
+    monkeypatch.setattr(session_table, 'LOCK_TIMEOUT', 0.05)
+    table = make_table(max_sessions=4)
+    stripe = LOCK_STRIPES - 1
+
+    def die_holding_lock():
+        table._acquire_lock(stripe)
+        os.kill(os.getpid(), signal.SIGKILL)
+
+    process = fork.Process(target=die_holding_lock)
+    process.start()
+    process.join()
+    assert table._owners[stripe] == process.pid
+
+    with table._locked(stripe):
+        assert table._owners[stripe] == os.getpid()
+    assert table._owners[stripe] == 0
+
+
+@pytest.mark.parametrize('stage', ['rehash', 'copy'])
+def test_compaction_of_a_killed_process_is_recovered(make_table, stage):
+    table = make_table(max_sessions=8)
+    ids = [str(uuid.uuid4()) for _ in range(8)]
+    for session_id in ids:
+        table.add(session_id, {'user_name': session_id[:4]})
+        table.record(session_id, 10.0, True)
+    for session_id in ids[3:]:
+        table.remove(session_id)
+    kept = ids[:3]
+
+    def die_compacting():
+        if stage == 'rehash':
+            rehash = table._rehash
+
+            def dying_rehash():
+                rehash()
+                table._spare[0] = table._spare[1]
+                os.kill(os.getpid(), signal.SIGKILL)
+            table._rehash = dying_rehash
+        else:
+            def dying_copy():
+                half = table.capacity // 2
+                table._slots[:half] = table._spare[:half]
+                os.kill(os.getpid(), signal.SIGKILL)
+            table._copy_spare = dying_copy
+        table._compact()
+
+    process = fork.Process(target=die_compacting)
+    process.start()
+    process.join()
+    assert process.exitcode == -signal.SIGKILL
+    assert table._owners[0] == process.pid
+    assert table._counters[session_table._GENERATION] % 2 == (stage == 'copy')
+
+    assert [table.get(session_id)['user_name'] for session_id in kept] == [session_id[:4] for session_id in kept]
+    assert table._counters[session_table._GENERATION] % 2 == 0
+    assert (table._states == session_table.USED).sum() == 3
+    if stage == 'copy':
+        assert table._counters[session_table._DELETED] == 0
+    # The table keeps working, including the next compaction, which takes
+    # over any lock still recorded as the dead process's
+    for _ in range(20):
+        session_id = str(uuid.uuid4())
+        table.add(session_id, {})
+        table.remove(session_id)
+    assert all(table.get(session_id)['frames'] == 1 for session_id in kept)
+    assert all(owner == 0 for owner in table._owners)
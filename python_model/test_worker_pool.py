@@ -0,0 +1,100 @@
+import os
+import time
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from multiprocessing import shared_memory
+
+import numpy as np
+import pytest
+
+import worker_pool
+from worker_pool import InferencePool, WorkerDiedError
+
+
+def _fake_worker_main(worker_index, shm_name, slot_bytes, task_queue, result_queue, ready_flags):
+    """Answers with the frame's mean; the session ID picks a failure"""
+    shm = shared_memory.SharedMemory(name=shm_name)
+    ready_flags[worker_index] = 1
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        if task[0] == 'drop':
+            continue
+        _, task_id, slot, shape, session_id, scale = task
+        if session_id == 'crash':
+            os._exit(1)
+        if session_id == 'hang':
+            time.sleep(60)
+        if session_id == 'slow':
+            time.sleep(0.5)
+        frame = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=slot * slot_bytes)
+        result = {'mean': float(frame.mean()), 'pid': os.getpid()}
+        del frame
+        result_queue.put((task_id, slot, result, {}))
+    shm.close()
+
+
+@pytest.fixture
+def make_pool(monkeypatch):
+    monkeypatch.setattr(worker_pool, '_worker_main', _fake_worker_main)
+    monkeypatch.setattr(worker_pool, 'WATCH_INTERVAL', 0.05)
+    pools = []
+
+    def make(**kwargs):
+        pool = InferencePool(1, slots_per_worker=2, slot_shape=(8, 8), **kwargs)
+        pools.append(pool)
+        deadline = time.monotonic() + 5
+        while pool.ready_workers() < 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return pool
+    yield make
+    for pool in pools:
+        pool.shutdown()
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def frame(value):
+    return np.full((8, 8), value, dtype=np.uint8)
+
+
+def test_frames_are_analysed_in_the_worker(make_pool):
+    pool = make_pool()
+    assert pool.analyze('a', frame(7))['mean'] == 7.0
+    assert pool.queue_depth() == 0 and pool._free_slots.qsize() == pool.num_slots
+
+
+def test_a_dead_worker_is_restarted(make_pool):
+    pool = make_pool()
+    first_pid = pool.analyze('a', frame(1))['pid']
+    with pytest.raises(WorkerDiedError):
+        pool.analyze('crash', frame(2))
+    assert pool.restarts == 1
+    assert pool.queue_depth() == 0 and pool._free_slots.qsize() == pool.num_slots
+
+    wait_for(lambda: pool.ready_workers() == 1)
+    result = pool.analyze('a', frame(3))
+    assert result['mean'] == 3.0 and result['pid'] != first_pid
+
+
+def test_a_hung_worker_is_restarted(make_pool):
+    pool = make_pool(hang_timeout=0.3)
+    with pytest.raises(WorkerDiedError):
+        pool.submit('hang', frame(1)).result(timeout=5)
+    assert pool._free_slots.qsize() == pool.num_slots
+    wait_for(lambda: pool.ready_workers() == 1)
+    assert pool.analyze('a', frame(4))['mean'] == 4.0
+
+
+def test_a_timed_out_frame_returns_its_slot_when_answered(make_pool):
+    pool = make_pool(timeout=0.1, hang_timeout=5)
+    with pytest.raises(FutureTimeoutError):
+        pool.analyze('slow', frame(1))
+    assert pool.queue_depth() == 0
+    wait_for(lambda: pool._free_slots.qsize() == pool.num_slots)
+    assert not pool._in_flight and pool.restarts == 0
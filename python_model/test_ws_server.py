@@ -0,0 +1,47 @@
+import json
+import socket
+
+import pytest
+from websockets.exceptions import InvalidStatus
+from websockets.sync.client import connect
+
+from ws_server import FrameStreamServer
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def server():
+    server = FrameStreamServer(
+        lambda session_id, frame_bytes: {'success': True, 'sessionId': session_id},
+        port=free_port(),
+        analysis_threads=1,
+        origins=['http://localhost:5173']
+    ).start()
+    yield server
+    server.shutdown()
+
+
+def stream_one_frame(server, **kwargs):
+    with connect(f"ws://127.0.0.1:{server.port}/?sessionId=abc", open_timeout=5, **kwargs) as websocket:
+        websocket.send(b'frame')
+        return json.loads(websocket.recv(timeout=5))
+
+
+def test_allowed_origin_can_stream(server):
+    assert stream_one_frame(server, origin='http://localhost:5173')['sessionId'] == 'abc'
+
+
+def test_other_origin_is_refused(server):
+    with pytest.raises(InvalidStatus) as excinfo:
+        stream_one_frame(server, origin='https://evil.example')
+    assert excinfo.value.response.status_code == 403
+    assert server.stats()['connections'] == 0
+
+
+def test_client_without_origin_can_stream(server):
+    assert stream_one_frame(server)['sessionId'] == 'abc'
@@ -1,21 +1,31 @@
 import os
 import sys
-import dlib
+import argparse
+from download_model import MODEL_PATH, MODEL_SHA256, is_verified, verify_model_file
 
-def verify_model():
+def verify_model(model_path=MODEL_PATH, expected_hash=MODEL_SHA256, load=False):
     try:
-        model_path = 'shape_predictor_68_face_landmarks.dat'
-        
         if not os.path.exists(model_path):
             print(f"Error: Model file not found at {model_path}")
             return False
             
         print(f"Found model file at {model_path}")
-        print("Attempting to load model...")
         
-        # Try to load the model
-        predictor = dlib.shape_predictor(model_path)
-        print("Successfully loaded model!")
+        # A current marker means this exact file was already hashed
+        if is_verified(model_path, expected_hash):
+            print("Checksum already verified")
+        else:
+            print("Checking SHA-256...")
+            if not verify_model_file(model_path, expected_hash):
+                print(f"Error: Model file does not match SHA-256 {expected_hash}; run download_model.py --force")
+                return False
+            print("Checksum matches; recorded verified marker")
+        
+        if load:
+            import dlib
+            print("Attempting to load model...")
+            dlib.shape_predictor(model_path)
+            print("Successfully loaded model!")
         return True
         
     except Exception as e:
@@ -23,5 +33,10 @@ def verify_model():
         return False
 
 if __name__ == '__main__':
-    success = verify_model()
-    sys.exit(0 if success else 1) 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Verify the dlib 68-point landmark model file')
+    parser.add_argument('model', nargs='?', default=MODEL_PATH)
+    parser.add_argument('--sha256', default=MODEL_SHA256, help='Expected SHA-256 of the model file')
+    parser.add_argument('--load', action='store_true', help='Also load the model with dlib')
+    args = parser.parse_args()
+    success = verify_model(args.model, args.sha256, args.load)
+    sys.exit(0 if success else 1)
@@ -0,0 +1,274 @@
+import os
+import time
+import zlib
+import queue
+import logging
+import itertools
+import threading
+import traceback
+import multiprocessing
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from log_utils import setup_logging
+from image_utils import WARMUP_RESOLUTIONS, parse_resolutions
+
+logger = logging.getLogger(__name__)
+
+# Largest frame a slot can hold: 1080p BGR
+DEFAULT_SLOT_SHAPE = (1080, 1920, 3)
+
+# Seconds between checks that every worker is alive and answering
+WATCH_INTERVAL = 1.0
+
+
+class WorkerDiedError(RuntimeError):
+    """The worker analysing a frame exited or was restarted before answering"""
+
+
+def _worker_main(worker_index, shm_name, slot_bytes, task_queue, result_queue, ready_flags):
+    """Worker process loop: load and warm up the models once, then analyse frames from shared memory"""
+    setup_logging()
+    from focus_tracker import FocusTracker, SessionState
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        tracker = FocusTracker()
+        tracker.warm_up(parse_resolutions(WARMUP_RESOLUTIONS))
+        states = {}
+        ready_flags[worker_index] = 1
+        logger.info(f"Inference worker {worker_index} ready (pid {os.getpid()})")
+
+        while True:
+            task = task_queue.get()
+            if task is None:
+                break
+
+            kind = task[0]
+            if kind == 'drop':
+                states.pop(task[1], None)
+                continue
+
+            _, task_id, slot, shape, session_id, scale = task
+            timings = {}
+            try:
+                frame = np.ndarray(shape, dtype=np.uint8, buffer=shm.buf, offset=slot * slot_bytes)
+                state = states.get(session_id)
+                if state is None:
+                    state = states[session_id] = SessionState()
+                result = tracker.process_frame(frame, state, scale, timings)
+                # Release the view before the parent hands the slot to another request
+                del frame
+            except Exception as e:
+                logger.error(f"Worker {worker_index} failed on task {task_id}: {str(e)}\n{traceback.format_exc()}")
+                result = {
+                    'type': 'focus-score',
+                    'focusScore': 0,
+                    'error': str(e),
+                    'message': 'Error processing frame',
+                    'isDrowsy': False
+                }
+            result_queue.put((task_id, slot, result, timings))
+    finally:
+        shm.close()
+
+
+class InferencePool:
+    """Pool of worker processes that each hold their own FocusTracker.
+
+    Frames are written into fixed-size slots of one shared-memory block and
+    only the slot index, shape and session ID travel through the task queue,
+    so frame pixels are never pickled. Each session is pinned to one worker
+    so its SessionState stays in a single process.
+
+    A slot is returned when its worker answers, even if the caller stopped
+    waiting. A watchdog thread restarts any worker that exits (an OOM kill,
+    a crash in dlib) or holds a frame for longer than hang_timeout: frames
+    it held fail with WorkerDiedError and their slots are returned. The
+    sessions pinned to it start over with fresh tracker state.
+    """
+    def __init__(self, num_workers, slots_per_worker=4, slot_shape=DEFAULT_SLOT_SHAPE, timeout=10.0,
+                 hang_timeout=None):
+        self.num_workers = num_workers
+        self.num_slots = num_workers * slots_per_worker
+        self.slot_bytes = int(np.prod(slot_shape))
+        self.timeout = timeout
+        self.hang_timeout = 3 * timeout if hang_timeout is None else hang_timeout
+
+        self._shm = shared_memory.SharedMemory(create=True, size=self.slot_bytes * self.num_slots)
+        self._free_slots = queue.Queue()
+        for slot in range(self.num_slots):
+            self._free_slots.put(slot)
+
+        # Futures of callers still waiting, and (slot, worker, submit time)
+        # of every frame handed to a worker and not yet answered
+        self._pending = {}
+        self._in_flight = {}
+        self._pending_lock = threading.Lock()
+        self._task_ids = itertools.count()
+
+        self._result_queue = multiprocessing.Queue()
+        # Set by each worker once it has loaded and warmed up its models
+        self._ready_flags = multiprocessing.Array('b', num_workers)
+        self._task_queues = [None] * num_workers
+        self._workers = [None] * num_workers
+        for index in range(num_workers):
+            self._start_worker(index)
+        self.restarts = 0
+
+        self._stopping = threading.Event()
+        self._collector = threading.Thread(target=self._collect_results, name='focus-pool-collector', daemon=True)
+        self._collector.start()
+        self._watchdog = threading.Thread(target=self._watch_workers, name='focus-pool-watchdog', daemon=True)
+        self._watchdog.start()
+        logger.info(f"Started inference pool with {num_workers} workers and {self.num_slots} frame slots")
+
+    def _start_worker(self, index):
+        # A fresh queue each time: a worker killed inside get() leaves its queue's lock held
+        task_queue = multiprocessing.Queue()
+        worker = multiprocessing.Process(
+            target=_worker_main,
+            args=(index, self._shm.name, self.slot_bytes, task_queue, self._result_queue, self._ready_flags),
+            name=f'focus-worker-{index}',
+            daemon=True
+        )
+        worker.start()
+        self._task_queues[index] = task_queue
+        self._workers[index] = worker
+
+    def _worker_for(self, session_id):
+        return zlib.crc32(session_id.encode('utf-8')) % self.num_workers
+
+    def _collect_results(self):
+        while True:
+            item = self._result_queue.get()
+            if item is None:
+                break
+            task_id, slot, result, timings = item
+            with self._pending_lock:
+                # Unknown if the worker was restarted and the slot already returned
+                if self._in_flight.pop(task_id, None) is None:
+                    continue
+                future = self._pending.pop(task_id, None)
+            self._free_slots.put(slot)
+            if future is not None:
+                future.set_result((result, timings))
+
+    def _restart_worker(self, index, reason):
+        """Replace a worker, failing the frames it held and returning their slots"""
+        worker = self._workers[index]
+        if worker.is_alive():
+            worker.kill()
+        worker.join(timeout=5)
+        self._ready_flags[index] = 0
+        with self._pending_lock:
+            lost = [task_id for task_id, (_, owner, _) in self._in_flight.items() if owner == index]
+            slots = [self._in_flight.pop(task_id)[0] for task_id in lost]
+            futures = [self._pending.pop(task_id, None) for task_id in lost]
+            old_queue = self._task_queues[index]
+            # Under the lock, so no frame is queued for the old worker meanwhile
+            self._start_worker(index)
+        old_queue.close()
+        old_queue.cancel_join_thread()
+        self.restarts += 1
+        logger.error(f"Restarted inference worker {index} ({reason}); {len(lost)} frames lost")
+
+        for slot in slots:
+            self._free_slots.put(slot)
+        error = WorkerDiedError(f"Inference worker {index} {reason}")
+        for future in futures:
+            if future is not None:
+                future.set_exception(error)
+
+    def _watch_workers(self):
+        while not self._stopping.wait(WATCH_INTERVAL):
+            now = time.monotonic()
+            with self._pending_lock:
+                oldest = {}
+                for _, index, submitted in self._in_flight.values():
+                    oldest[index] = min(oldest.get(index, now), submitted)
+            for index, worker in enumerate(self._workers):
+                if self._stopping.is_set():
+                    break
+                if not worker.is_alive():
+                    self._restart_worker(index, f"exited with code {worker.exitcode}")
+                elif self._ready_flags[index] and now - oldest.get(index, now) > self.hang_timeout:
+                    self._restart_worker(index, f"held a frame for over {self.hang_timeout:.0f}s")
+
+    def submit(self, session_id, frame, scale=1.0):
+        """Copy a frame into a free slot and queue it for the session's worker.
+
+        The future resolves to (result, stage timings measured in the worker).
+        """
+        return self._submit(session_id, frame, scale)[1]
+
+    def _submit(self, session_id, frame, scale):
+        if frame.dtype != np.uint8:
+            raise ValueError("Frames must be uint8 images")
+
+        out_shape = frame.shape
+        if int(np.prod(out_shape)) > self.slot_bytes:
+            raise ValueError(f"Frame of shape {out_shape} does not fit in a {self.slot_bytes} byte slot")
+
+        try:
+            slot = self._free_slots.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError("No free frame slot available")
+
+        view = np.ndarray(out_shape, dtype=np.uint8, buffer=self._shm.buf, offset=slot * self.slot_bytes)
+        np.copyto(view, frame)
+        del view
+
+        task_id = next(self._task_ids)
+        future = Future()
+        index = self._worker_for(session_id)
+        with self._pending_lock:
+            self._pending[task_id] = future
+            self._in_flight[task_id] = (slot, index, time.monotonic())
+            self._task_queues[index].put(('frame', task_id, slot, out_shape, session_id, scale))
+        return task_id, future
+
+    def analyze(self, session_id, frame, scale=1.0, timings=None):
+        """Analyse a frame in the session's worker and wait for the result.
+
+        If timings is a dict, the worker's stage timings are copied into it.
+        """
+        task_id, future = self._submit(session_id, frame, scale)
+        try:
+            result, worker_timings = future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            # Nobody waits for the answer any more; its slot is returned when it arrives
+            with self._pending_lock:
+                self._pending.pop(task_id, None)
+            raise
+        if timings is not None:
+            timings.update(worker_timings)
+        return result
+
+    def drop_session(self, session_id):
+        """Discard a session's tracker state in its worker"""
+        with self._pending_lock:
+            self._task_queues[self._worker_for(session_id)].put(('drop', session_id))
+
+    def ready_workers(self):
+        """Number of live workers that have loaded and warmed up their models"""
+        return sum(1 for index, worker in enumerate(self._workers) if self._ready_flags[index] and worker.is_alive())
+
+    def queue_depth(self):
+        """Number of frames submitted but not yet answered"""
+        with self._pending_lock:
+            return len(self._pending)
+
+    def shutdown(self):
+        self._stopping.set()
+        self._watchdog.join(timeout=5)
+        for task_queue in self._task_queues:
+            task_queue.put(None)
+        for worker in self._workers:
+            worker.join(timeout=5)
+        self._result_queue.put(None)
+        self._collector.join(timeout=5)
+        self._shm.close()
+        self._shm.unlink()
@@ -0,0 +1,152 @@
+import os
+import json
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from collections import deque
+from urllib.parse import urlsplit, parse_qs
+from concurrent.futures import ThreadPoolExecutor
+
+from websockets.asyncio.server import serve
+from websockets.exceptions import ConnectionClosed
+
+logger = logging.getLogger(__name__)
+
+
+class FrameStreamServer:
+    """WebSocket server that streams frames in and focus results out.
+
+    Clients connect to ws://host:port/?sessionId=<id> (a session started via
+    /start-session) and send each frame as one binary message holding the
+    encoded JPEG/PNG. Every frame is answered with a JSON text message in the
+    /analyze-frame result shape plus the connection's backlog.
+
+    analyze(session_id, frame_bytes) is called in a thread pool and must
+    return a dict. Frames of one connection are analysed in order; if the
+    client sends faster than they are analysed, at most max_backlog frames
+    are kept and the oldest are dropped. analysis_threads defaults to the
+    number of CPU cores, up to 4; analyze must be safe to call from that
+    many threads at once (FocusTracker is: it pools its dlib detectors).
+
+    origins is the list of page origins allowed to open a stream, normally
+    the HTTP routes' CORS allow-list. A handshake whose Origin header is not
+    in it is refused with 403. Handshakes without an Origin header come from
+    non-browser clients and are accepted, as the HTTP routes accept them.
+    With origins=None every origin is accepted.
+    """
+    def __init__(self, analyze, host='127.0.0.1', port=5001, max_backlog=2, analysis_threads=None, origins=None):
+        if analysis_threads is None:
+            analysis_threads = min(4, os.cpu_count() or 1)
+        self.analyze = analyze
+        self.host = host
+        self.port = port
+        self.max_backlog = max_backlog
+        self.origins = None if origins is None else list(origins) + [None]
+        self._executor = ThreadPoolExecutor(max_workers=analysis_threads, thread_name_prefix='focus-ws')
+        self._connections = {}
+        self._loop = None
+        self._stop = None
+        self._thread = None
+
+    def start(self):
+        """Run the server's event loop in a background thread"""
+        started = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(started,), name='focus-ws-server', daemon=True)
+        self._thread.start()
+        started.wait(timeout=5)
+        return self
+
+    def _run(self, started):
+        asyncio.run(self._serve(started))
+
+    async def _serve(self, started):
+        self._loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        async with serve(self._handle, self.host, self.port, origins=self.origins, max_size=4 * 1024 * 1024):
+            logger.info(f"Frame stream server listening on ws://{self.host}:{self.port}")
+            started.set()
+            await self._stop.wait()
+
+    async def _handle(self, websocket):
+        query = parse_qs(urlsplit(websocket.request.path).query)
+        session_id = (query.get('sessionId') or [None])[0]
+        if not session_id:
+            await websocket.close(code=1008, reason='Missing sessionId')
+            return
+
+        connection = {
+            'sessionId': session_id,
+            'frames': deque(),
+            'ready': asyncio.Event(),
+            'received': 0,
+            'analyzed': 0,
+            'dropped': 0
+        }
+        self._connections[id(websocket)] = connection
+        logger.info(f"Frame stream opened for session {session_id}")
+
+        worker = asyncio.create_task(self._analyze_frames(websocket, connection))
+        try:
+            async for message in websocket:
+                if isinstance(message, str):
+                    await websocket.send(json.dumps({
+                        'success': False,
+                        'message': 'Frames must be sent as binary messages'
+                    }))
+                    continue
+                connection['received'] += 1
+                frames = connection['frames']
+                frames.append((message, time.monotonic()))
+                while len(frames) > self.max_backlog:
+                    frames.popleft()
+                    connection['dropped'] += 1
+                connection['ready'].set()
+        except ConnectionClosed:
+            pass
+        finally:
+            worker.cancel()
+            self._connections.pop(id(websocket), None)
+            logger.info(f"Frame stream closed for session {session_id} ({connection['analyzed']} analysed, {connection['dropped']} dropped)")
+
+    async def _analyze_frames(self, websocket, connection):
+        frames = connection['frames']
+        while True:
+            if not frames:
+                connection['ready'].clear()
+                await connection['ready'].wait()
+                continue
+            frame_bytes, received_at = frames.popleft()
+            try:
+                result = await self._loop.run_in_executor(self._executor, self.analyze, connection['sessionId'], frame_bytes)
+            except Exception as e:
+                logger.error(f"Error analysing streamed frame: {str(e)}\n{traceback.format_exc()}")
+                result = {
+                    'success': False,
+                    'message': f'Error processing frame: {str(e)}'
+                }
+            connection['analyzed'] += 1
+            result['backlog'] = len(frames)
+            result['droppedFrames'] = connection['dropped']
+            result['latencyMs'] = round((time.monotonic() - received_at) * 1000.0, 2)
+            try:
+                await websocket.send(json.dumps(result))
+            except ConnectionClosed:
+                return
+
+    def stats(self):
+        """Open connections and their current backlog"""
+        connections = list(self._connections.values())
+        return {
+            'connections': len(connections),
+            'backlog': sum(len(c['frames']) for c in connections),
+            'droppedFrames': sum(c['dropped'] for c in connections)
+        }
+
+    def shutdown(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._stop.set)
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self._executor.shutdown(wait=False)
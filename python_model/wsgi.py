@@ -0,0 +1,36 @@
+"""Production entry point for the focus tracking service.
+
+Run with gunicorn and the settings in gunicorn.conf.py:
+
+    gunicorn -c gunicorn.conf.py wsgi:application
+
+With preload_app the master imports this module once, loading and warming
+up the dlib detector, the 68-point shape predictor and the Haar cascades,
+then forks the workers, which share those pages copy-on-write instead of
+each loading the ~100 MB predictor. A restarted worker is a fork of the
+loaded master, so it serves again immediately.
+"""
+import os
+import logging
+
+import app as service
+
+logger = logging.getLogger(__name__)
+
+if int(os.environ.get('FOCUS_WORKERS', 0)) > 0:
+    # The pre-forked workers already spread frames over processes
+    logger.warning("FOCUS_WORKERS is ignored by the pre-fork server; set FOCUS_SERVER_WORKERS instead")
+
+# Warm up in the master, so the workers fork with warmed-up models and are
+# ready from their first request
+service.warm_up()
+if not service.warmup_status['finished']:
+    raise RuntimeError(f"Failed to initialize focus tracker: {service.warmup_status['error']}")
+
+application = service.app
+
+
+def init_worker():
+    """Per-worker setup after the fork (threads started in the master do not survive it)"""
+    service.sessions.start_reaper()
+    service.start_batch_scheduler()